@@ -0,0 +1,5 @@
+"""
+Benchmarks: a schema-conforming synthetic log generator (``generate``), the
+benchmark suite with machine-readable results (``run``) and the parallel
+replay benchmark (``parallel_load``).
+"""
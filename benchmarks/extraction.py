@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Offline extraction throughput with ``FakeExtractionModel``.
+
+Usage:
+    python -m benchmarks.extraction --documents 20 --chars 30000 --latency 0.5
+    python -m benchmarks.extraction --concurrency 1 4 16 --failure-rate 0.1
+
+Synthetic documents are extracted into a temporary graph, once per
+``--concurrency`` value with the cache off, then once more against a warm
+cache. ``--latency`` stands in for the model's response time, so the runs
+show how far bounded concurrency hides it and that a cached rerun makes no
+model calls. Prints one JSON object per run.
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ontology_tool.core.extractor import CHUNK_CHARS, LLMExtractor
+from ontology_tool.core.fake_llm import FakeExtractionModel
+from ontology_tool.core.manager import OntologyManager
+
+FIRST = ("Alice", "Bruno", "Chen", "Dana", "Emeka", "Fatima", "Goran", "Hana", "Ivan", "Julia")
+LAST = ("Smith", "Okafor", "Wang", "Garcia", "Novak", "Sato", "Haddad", "Berg", "Costa", "Kim")
+FILLER = ("reviewed the plan", "met in the lab", "shipped the release", "wrote the report",
+          "discussed the budget", "joined the project")
+
+
+def documents(count: int, chars: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        sentences, size = [], 0
+        while size < chars:
+            a, b = (f"{rng.choice(FIRST)} {rng.choice(LAST)}" for _ in range(2))
+            sentence = f"{a} and {b} {rng.choice(FILLER)}."
+            sentences.append(sentence + ("\n\n" if rng.random() < 0.2 else " "))
+            size += len(sentences[-1])
+        texts.append("".join(sentences))
+    return texts
+
+
+def run(workdir: Path, texts: list, concurrency: int, cache: bool, args) -> dict:
+    manager = OntologyManager(str(workdir / f"graph_{concurrency}_{cache}.jsonl"))
+    model = FakeExtractionModel(latency=args.latency, failure_rate=args.failure_rate, seed=args.seed)
+    extractor = LLMExtractor(manager, llm=model, cache_dir=workdir / "cache" if cache else False,
+                             chunk_chars=args.chunk_chars, max_concurrency=concurrency, retry_delay=0.01)
+    start = time.perf_counter()
+    results = extractor.extract_documents(texts)
+    elapsed = time.perf_counter() - start
+    graph = manager.load_ontology()
+    return {
+        "concurrency": concurrency,
+        "cache": cache,
+        "seconds": round(elapsed, 3),
+        "model_calls": model.calls,
+        "failed_documents": sum(result is None for result in results),
+        "entities": len(graph.entities),
+        "relations": len(graph.edges),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--chars", type=int, default=20000, help="Characters per document")
+    parser.add_argument("--chunk-chars", type=int, default=CHUNK_CHARS)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per model call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of model calls that fail")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = documents(args.documents, args.chars, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for concurrency in args.concurrency:
+            print(json.dumps(run(workdir, texts, concurrency, False, args)))
+        concurrency = max(args.concurrency)
+        # Fill the cache, then time the rerun that reads it
+        run(workdir, texts, concurrency, True, args)
+        print(json.dumps(run(workdir, texts, concurrency, True, args)))
+
+
+if __name__ == "__main__":
+    main()
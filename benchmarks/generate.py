@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Synthetic graph logs that conform to a schema.
+
+Usage:
+    python -m benchmarks.generate --out /tmp/graph.jsonl --entities 100000 --relations 300000
+    python -m benchmarks.generate --out /tmp/graph.jsonl --entities 10000 --degree uniform --delete-ratio 0
+
+Entity types, property values (enums, refs, dates, URLs, lists...) and
+relation endpoints, cardinalities and acyclicity follow the compiled schema,
+so ``validate`` reports no errors for the generated graph. The log holds the
+creates, then relates and updates interleaved, then deletes. Deleted entities
+are never referenced, so no ref or edge dangles. Output is deterministic for
+a given seed.
+"""
+import argparse
+import bisect
+import itertools
+import json
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ontology_tool.core.schema import ANY_TYPE, CompiledSchema, load_schema
+
+DEFAULT_SCHEMA_PATH = Path(__file__).resolve().parent.parent / "memory" / "ontology" / "schema.yaml"
+DEGREES = ("zipf", "uniform")
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Properties that bound a range and must stay ordered
+DATE_RANGES = (("start", "end"), ("start_date", "end_date"))
+# Attempts at drawing an edge that satisfies cardinality, acyclicity and uniqueness
+EDGE_ATTEMPTS = 20
+
+
+class Picker:
+    """Draws items uniformly or with Zipf-distributed popularity (rank r weighted 1 / r**s)."""
+
+    def __init__(self, items: list, rng: random.Random, degree: str = "zipf", exponent: float = 1.0):
+        self.items = items
+        self.rng = rng
+        self.cum_weights = None
+        if degree == "zipf" and items:
+            # Shuffled first so the hubs are arbitrary entities, not the oldest
+            items = self.items = rng.sample(items, len(items))
+            self.cum_weights = list(itertools.accumulate(1.0 / (r ** exponent) for r in range(1, len(items) + 1)))
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def pick(self):
+        if self.cum_weights is None:
+            return self.items[self.rng.randrange(len(self.items))]
+        x = self.rng.random() * self.cum_weights[-1]
+        return self.items[min(bisect.bisect(self.cum_weights, x), len(self.items) - 1)]
+
+
+class Generator:
+    def __init__(self, schema: CompiledSchema, seed: int = 0, degree: str = "zipf", exponent: float = 1.0):
+        if degree not in DEGREES:
+            raise ValueError(f"degree must be one of {DEGREES}, got '{degree}'")
+        self.schema = schema
+        self.rng = random.Random(seed)
+        self.degree = degree
+        self.exponent = exponent
+        # type -> ids that stay live (refs and edges only point at these)
+        self.live = {}
+        self.order = {}
+        self._candidates = {}
+
+    def _timestamp(self, i: int) -> str:
+        return (EPOCH + timedelta(seconds=i)).isoformat()
+
+    def _value(self, spec, prop: str, i: int):
+        rng = self.rng
+        if spec.is_list:
+            return [self._scalar(spec, prop, i) for _ in range(rng.randint(0, 3))]
+        return self._scalar(spec, prop, i)
+
+    def _scalar(self, spec, prop: str, i: int):
+        rng = self.rng
+        if spec.enum is not None:
+            return rng.choice(sorted(spec.enum))
+        if spec.ref_types is not None:
+            ids = self._ref_candidates(spec.ref_types)
+            return ids[rng.randrange(len(ids))] if ids else None
+        kind = spec.scalar
+        if kind == "number":
+            return round(rng.uniform(0, 100), 1)
+        if kind == "boolean":
+            return rng.random() < 0.5
+        if kind == "object":
+            return {"key": prop, "value": rng.randint(0, 1000)}
+        if kind == "datetime":
+            return self._timestamp(rng.randint(0, 365 * 86400))
+        if kind == "date":
+            return (EPOCH.date() + timedelta(days=rng.randint(0, 365))).isoformat()
+        if kind == "url":
+            return f"https://example.com/{prop}/{i}"
+        return f"{prop} {i} {rng.choice(WORDS)} {rng.choice(WORDS)}"
+
+    def _ref_candidates(self, types) -> list:
+        key = frozenset(types)
+        ids = self._candidates.get(key)
+        if ids is None:
+            types = sorted(self.live) if ANY_TYPE in key else sorted(key)
+            ids = self._candidates[key] = [entity_id for t in types for entity_id in self.live.get(t, ())]
+        return ids
+
+    def _properties(self, validator, i: int) -> dict:
+        props = {}
+        for prop, spec in validator.properties.items():
+            if prop in validator.forbidden:
+                continue
+            if prop not in validator.required and self.rng.random() < 0.5:
+                continue
+            value = self._value(spec, prop, i)
+            if value is None and not spec.nullable:
+                continue
+            props[prop] = value
+        for prop in validator.required:
+            props.setdefault(prop, f"{prop} {i}")
+        for start, end in DATE_RANGES:
+            if start in props and end in props and props[end] < props[start]:
+                props[start], props[end] = props[end], props[start]
+        return props
+
+    def records(self, entities: int, relations: int, update_ratio: float = 0.2,
+                delete_ratio: float = 0.02, types: list = None):
+        """Yield log records: ``entities`` creates, ``relations`` relates, then updates and deletes."""
+        rng = self.rng
+        schema = self.schema
+        types = types or sorted(schema.types)
+        plan = [(types[rng.randrange(len(types))], i) for i in range(entities)]
+        deleted = set(rng.sample(range(entities), int(entities * delete_ratio)))
+        ids = [f"{type_name.lower()[:4]}_{i:08x}" for type_name, i in plan]
+        # Every id is planned up front, so refs may point at entities created later
+        for (type_name, i), entity_id in zip(plan, ids):
+            if i not in deleted:
+                self.live.setdefault(type_name, []).append(entity_id)
+                self.order[entity_id] = i
+
+        clock = itertools.count()
+        for (type_name, i), entity_id in zip(plan, ids):
+            timestamp = self._timestamp(next(clock))
+            yield {"op": "create", "entity": {
+                "id": entity_id, "type": type_name,
+                "properties": self._properties(schema.types[type_name], i),
+                "created": timestamp, "updated": timestamp}, "timestamp": timestamp}
+
+        live_ids = [entity_id for entity_id in ids if entity_id in self.order]
+        updates = int(entities * update_ratio)
+        edges = self._edges(relations)
+        entity_picker = Picker(live_ids, rng, self.degree, self.exponent)
+        # Relates and updates interleaved in proportion
+        remaining_updates = updates if entity_picker else 0
+        for rel in itertools.chain(edges, itertools.repeat(None)):
+            while remaining_updates and (rel is None or rng.random() < updates / (updates + relations)):
+                remaining_updates -= 1
+                entity_id = entity_picker.pick()
+                type_name = plan[self.order[entity_id]][0]
+                props = self._properties(schema.types[type_name], self.order[entity_id])
+                props = dict(rng.sample(sorted(props.items()), min(2, len(props))))
+                yield {"op": "update", "id": entity_id, "properties": props,
+                       "timestamp": self._timestamp(next(clock))}
+            if rel is None:
+                break
+            rel["timestamp"] = self._timestamp(next(clock))
+            yield rel
+
+        for i in sorted(deleted):
+            yield {"op": "delete", "id": ids[i], "timestamp": self._timestamp(next(clock))}
+
+    def _edges(self, count: int):
+        """Yield up to ``count`` relate records honouring each relation rule."""
+        rng = self.rng
+        rules = []
+        for rule in self.schema.relations.values():
+            sources = self._ref_candidates(rule.from_types or {ANY_TYPE})
+            targets = self._ref_candidates(rule.to_types or {ANY_TYPE})
+            if sources and targets:
+                rules.append((rule, Picker(sources, rng, self.degree, self.exponent),
+                              Picker(targets, rng, self.degree, self.exponent), set(), set()))
+        if not rules:
+            return
+        seen = set()
+        for _ in range(count):
+            rule, sources, targets, used_sources, used_targets = rules[rng.randrange(len(rules))]
+            for _ in range(EDGE_ATTEMPTS):
+                from_id, to_id = sources.pick(), targets.pick()
+                if rule.acyclic:
+                    # Edges only run from older to newer entities, so they cannot close a cycle
+                    if from_id == to_id or self.order[from_id] > self.order[to_id]:
+                        continue
+                key = (from_id, rule.name, to_id)
+                if key in seen or (rule.single_target and from_id in used_sources) \
+                        or (rule.single_source and to_id in used_targets):
+                    continue
+                seen.add(key)
+                used_sources.add(from_id)
+                used_targets.add(to_id)
+                props = {prop: self._value(spec, prop, len(seen)) for prop, spec in rule.properties.items()}
+                yield {"op": "relate", "from": from_id, "rel": rule.name, "to": to_id,
+                       "properties": {k: v for k, v in props.items() if v is not None}}
+                break
+
+
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india",
+         "juliet", "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo")
+
+
+def generate(out, schema_path=DEFAULT_SCHEMA_PATH, entities: int = 10000, relations: int = None,
+             update_ratio: float = 0.2, delete_ratio: float = 0.02, degree: str = "zipf",
+             exponent: float = 1.0, seed: int = 0, types: list = None) -> dict:
+    """
+    Write a synthetic log to ``out`` (``relations`` defaults to twice
+    ``entities``) and return counts of what was written per op.
+    """
+    relations = entities * 2 if relations is None else relations
+    generator = Generator(CompiledSchema(load_schema(schema_path)), seed, degree, exponent)
+    counts = dict.fromkeys(("create", "update", "delete", "relate"), 0)
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        for record in generator.records(entities, relations, update_ratio, delete_ratio, types):
+            counts[record["op"]] += 1
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    counts["bytes"] = out.stat().st_size
+    return counts
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--schema", "-s", default=str(DEFAULT_SCHEMA_PATH))
+    parser.add_argument("--entities", type=int, default=10000)
+    parser.add_argument("--relations", type=int, help="Relations to create (default: 2 x entities)")
+    parser.add_argument("--update-ratio", type=float, default=0.2, help="Updates per entity")
+    parser.add_argument("--delete-ratio", type=float, default=0.02, help="Fraction of entities deleted")
+    parser.add_argument("--degree", choices=DEGREES, default="zipf",
+                        help="How edge endpoints and updated entities are drawn")
+    parser.add_argument("--exponent", type=float, default=1.0, help="Zipf exponent")
+    parser.add_argument("--types", nargs="+", help="Entity types to generate (default: all in the schema)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic graph log that conforms to a schema")
+    parser.add_argument("--out", "-o", required=True)
+    add_arguments(parser)
+    args = parser.parse_args()
+    counts = generate(args.out, args.schema, args.entities, args.relations, args.update_ratio,
+                      args.delete_ratio, args.degree, args.exponent, args.seed, args.types)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
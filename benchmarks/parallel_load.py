@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Cold-start replay: sequential ``apply_log`` against ``parallel_apply_log``.
+
+Usage:
+    python -m benchmarks.parallel_load --entities 1000000 --workers 1 2 4 8 16 32
+    python -m benchmarks.parallel_load --graph memory/ontology/tool_graph.jsonl --workers 8
+
+Without ``--graph`` a synthetic log from ``benchmarks.generate`` is written
+to a temporary directory. Each run replays the whole log into an empty
+graph; the parallel result is checked against the sequential one.
+Prints one JSON object per worker count, including the CPU time spent in
+this process, which bounds how far more cores can bring the elapsed time down.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.generate import generate
+from ontology_tool.core.graph import OntologyGraph, apply_log
+from ontology_tool.core.parallel import default_workers, parallel_apply_log
+
+
+def replay(path, workers: int):
+    graph = OntologyGraph()
+    start, cpu = time.perf_counter(), time.process_time()
+    if workers == 1:
+        apply_log(graph, path)
+    elif parallel_apply_log(graph, path, 0, workers) is None:
+        raise RuntimeError("could not start a process pool")
+    return graph, time.perf_counter() - start, time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--graph", "-g", help="Existing log to replay (default: a synthetic one)")
+    parser.add_argument("--entities", type=int, default=200000, help="Synthetic log size in entities")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, default_workers()],
+                        help="Worker counts to time (1 = sequential replay)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per worker count; the best is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.graph
+        if path is None:
+            path = Path(tmp) / "graph.jsonl"
+            generate(path, entities=args.entities)
+        size = Path(path).stat().st_size
+
+        expected, baseline = None, None
+        for workers in args.workers:
+            best = None
+            for _ in range(args.repeat):
+                graph, elapsed, cpu = replay(path, workers)
+                if best is None or elapsed < best:
+                    best, main_cpu = elapsed, cpu
+            if expected is None:
+                expected = graph
+            elif (list(graph.entities.items()) != list(expected.entities.items())
+                  or list(graph.edges.items()) != list(expected.edges.items())):
+                raise SystemExit(f"workers={workers}: replay differs from workers={args.workers[0]}")
+            baseline = baseline or best
+            print(json.dumps({
+                "workers": workers,
+                "bytes": size,
+                "seconds": round(best, 3),
+                "mb_per_sec": round(size / best / 1e6, 1),
+                "speedup": round(baseline / best, 2),
+                # Work left in this process (merging, unpickling): the floor
+                # the elapsed time approaches as workers are added
+                "main_cpu_seconds": round(main_cpu, 3),
+                "entities": len(graph.entities),
+                "relations": len(graph.edges),
+            }))
+
+
+if __name__ == "__main__":
+    main()
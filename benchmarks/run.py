@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Repeatable benchmarks over a synthetic graph.
+
+Usage:
+    python -m benchmarks.run --entities 50000 --out results.json
+    python -m benchmarks.run --backend sqlite --only get_entity get_related
+    python -m benchmarks.run --compare baseline.json --tolerance 0.25
+
+Generates a schema-conforming log (see ``benchmarks.generate``) in a
+temporary directory, then times each benchmark ``--repeat`` times. Results
+are written as JSON: run metadata (git revision, Python, platform,
+parameters) and per benchmark the timings in seconds and the time per
+operation. ``--compare`` checks the medians against an earlier results file
+and exits with status 1 when any is slower by more than ``--tolerance``.
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.generate import add_arguments, generate
+from ontology_tool.core.exporter import RDFExporter, iter_rdf
+from ontology_tool.core.importer import DataImporter
+from ontology_tool.core.manager import OntologyManager
+from ontology_tool.core.snapshot import remove_snapshot
+from ontology_tool.core.storage import BACKENDS, convert, open_storage
+
+RESULTS_VERSION = 1
+
+
+def _load_cli():
+    """``scripts/ontology.py`` as a module; it is a script, not part of the package."""
+    spec = importlib.util.spec_from_file_location("ontology_cli", ROOT / "scripts" / "ontology.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Suite:
+    """
+    The benchmarks, as ``bench_<name>`` methods returning ``(setup, run, ops)``:
+    ``setup`` runs untimed before every repeat, ``run`` is timed, and ``ops``
+    is the number of operations one ``run`` performs.
+    """
+
+    def __init__(self, workdir: Path, graph_path: Path, schema_path, entities: int, lookups: int = 20,
+                 seed: int = 0):
+        self.workdir = workdir
+        self.graph_path = str(graph_path)
+        self.schema_path = str(schema_path)
+        self.entities = entities
+        self.cli = _load_cli()
+        rng = random.Random(seed)
+        graph = open_storage(self.graph_path).load()[0]
+        ids = list(graph.entities)
+        self.sample_ids = [rng.choice(ids) for _ in range(lookups)] if ids else []
+        connected = sorted(graph.outgoing.keys() | graph.incoming.keys())
+        self.sample_nodes = [rng.choice(connected) for _ in range(lookups)] if connected else []
+
+    def names(self) -> list:
+        return [name[len("bench_"):] for name in dir(self) if name.startswith("bench_")]
+
+    def bench_load_graph_cold(self):
+        return lambda: remove_snapshot(self.graph_path), lambda: self.cli.load_graph(self.graph_path), 1
+
+    def bench_load_graph(self):
+        # Warm: the snapshot written by the first load covers the whole log
+        return None, lambda: self.cli.load_graph(self.graph_path), 1
+
+    def bench_get_entity(self):
+        def run():
+            for entity_id in self.sample_ids:
+                self.cli.get_entity(entity_id, self.graph_path)
+        return None, run, len(self.sample_ids)
+
+    def bench_query_entities(self):
+        queries = [
+            ("Task", {"status": "open"}, None, None),                   # indexed equality
+            ("Task", {"priority": {"$in": ["high", "urgent"]}}, None, None),
+            ("Task", {"status": {"$ne": "done"}}, "-updated", 20),       # top-k
+            ("Task", {"estimate_hours": {"$gte": 50}}, "estimate_hours", 50),
+            ("Person", {"name": {"$prefix": "name 1"}}, None, None),
+        ]
+
+        def run():
+            for type_name, where, order_by, limit in queries:
+                self.cli.query_entities(type_name, where, self.graph_path, self.schema_path, order_by, limit)
+        return None, run, len(queries)
+
+    def bench_get_related(self):
+        def run():
+            for entity_id in self.sample_nodes:
+                self.cli.get_related(entity_id, None, self.graph_path, "both")
+        return None, run, len(self.sample_nodes)
+
+    def bench_resolve_entity(self):
+        # Exact and fuzzy (one character changed) lookups against a prebuilt index
+        graph = open_storage(self.graph_path).load()[0]
+        resolver = graph.enable_resolution()
+        queries = []
+        for entity_id in self.sample_ids:
+            entity = graph.entities[entity_id]
+            name = entity["properties"].get("name") or entity["properties"].get("title") or ""
+            queries.append((entity["type"], entity["properties"]))
+            queries.append((entity["type"], {"name": name[:-1] + "x"}))
+
+        def run():
+            for type_name, properties in queries:
+                resolver.resolve(type_name, properties)
+        return None, run, len(queries)
+
+    def bench_search(self):
+        # Against the persisted index; the first call builds it, untimed
+        queries = ["alpha bravo", "delta", "foxtrot golf hotel", "status open", "计划"]
+        self.cli.search_entities(queries[0], self.graph_path)
+
+        def run():
+            for query in queries:
+                self.cli.search_entities(query, self.graph_path)
+        return None, run, len(queries)
+
+    def bench_validate_graph(self):
+        return None, lambda: self.cli.validate_graph(self.graph_path, self.schema_path), 1
+
+    def bench_import_csv(self):
+        rows = self.entities
+        csv_path = self.workdir / "people.csv"
+        if not csv_path.exists():
+            with open(csv_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["id", "name", "email", "notes"])
+                for i in range(rows):
+                    writer.writerow([f"pers_csv_{i:08x}", f"Person {i}", f"p{i}@example.com",
+                                     "" if i % 3 else f"note {i}"])
+        target = self.workdir / "import.jsonl"
+
+        def setup():
+            for path in (target, Path(f"{target}.snapshot")):
+                path.unlink(missing_ok=True)
+
+        def run():
+            DataImporter(OntologyManager(str(target), self.schema_path)).import_csv(str(csv_path), "Person", "id")
+        return setup, run, rows
+
+    def bench_export_turtle(self):
+        try:
+            import rdflib  # noqa: F401
+        except ImportError:
+            return None
+        return None, lambda: RDFExporter(OntologyManager(self.graph_path, self.schema_path)).export_turtle(), 1
+
+    def bench_export_ntriples_stream(self):
+        def run():
+            entities, relations = open_storage(self.graph_path).iter_state()
+            for _ in iter_rdf(entities, relations, "ntriples"):
+                pass
+        return None, run, 1
+
+
+def measure(setup, run, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings: list, ops: int) -> dict:
+    median = statistics.median(timings)
+    return {
+        "repeat": len(timings),
+        "ops": ops,
+        "min": round(min(timings), 6),
+        "median": round(median, 6),
+        "mean": round(statistics.fmean(timings), 6),
+        "stdev": round(statistics.stdev(timings), 6) if len(timings) > 1 else 0.0,
+        "per_op": round(median / ops, 9) if ops else None,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """``(name, baseline median, median, ratio)`` for each benchmark slower than ``1 + tolerance`` times its baseline."""
+    regressions = []
+    for name, result in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or "median" not in result or not before.get("median"):
+            continue
+        ratio = result["median"] / before["median"]
+        if ratio > 1 + tolerance:
+            regressions.append((name, before["median"], result["median"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ontology benchmarks")
+    add_arguments(parser)
+    parser.add_argument("--backend", choices=BACKENDS, default="jsonl", help="Storage backend to benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=20, help="get_entity / get_related calls per repeat")
+    parser.add_argument("--only", nargs="+", help="Benchmarks to run (default: all)")
+    parser.add_argument("--out", "-o", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Earlier results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against --compare")
+    parser.set_defaults(entities=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        graph_path = workdir / "graph.jsonl"
+        counts = generate(graph_path, args.schema, args.entities, args.relations, args.update_ratio,
+                          args.delete_ratio, args.degree, args.exponent, args.seed, args.types)
+        if args.backend != "jsonl":
+            convert(graph_path, args.backend)
+
+        suite = Suite(workdir, graph_path, args.schema, args.entities, args.lookups, args.seed)
+        names = args.only or suite.names()
+        unknown = set(names) - set(suite.names())
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))} (have: {', '.join(suite.names())})")
+
+        results = {}
+        for name in names:
+            bench = getattr(suite, f"bench_{name}")()
+            if bench is None:
+                results[name] = {"skipped": "optional dependency not installed"}
+            else:
+                setup, run, ops = bench
+                results[name] = summarize(measure(setup, run, args.repeat), ops)
+            print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {
+            "backend": args.backend, "entities": args.entities, "relations": args.relations,
+            "update_ratio": args.update_ratio, "delete_ratio": args.delete_ratio,
+            "degree": args.degree, "exponent": args.exponent, "seed": args.seed,
+            "types": args.types, "repeat": args.repeat, "lookups": args.lookups, "schema": str(args.schema),
+        },
+        "log": counts,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get("params") != report["params"]:
+            print("warning: baseline was run with different parameters", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before:.6f}s -> {after:.6f}s ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Thin synchronous client for the graph server (see server.py).
+
+Only uses the standard library socket module so the CLI can forward a
+command without importing asyncio or loading the graph itself.
+"""
+import json
+import socket
+from pathlib import Path
+
+
+def socket_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".sock")
+
+
+class ServerError(Exception):
+    pass
+
+
+class OntologyClient:
+    def __init__(self, address):
+        """``address`` is a Unix socket path or a ``host:port`` string."""
+        host, sep, port = str(address).rpartition(":")
+        if sep and port.isdigit():
+            self.sock = socket.create_connection((host or "127.0.0.1", int(port)))
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self.sock.connect(str(address))
+            except OSError:
+                self.sock.close()
+                raise
+        self.stream = self.sock.makefile("rwb")
+
+    def call(self, op: str, enforce_schema: bool = False, **args):
+        """Run ``op`` on the server; ``enforce_schema`` checks this write even if the server doesn't check every write."""
+        request = {"op": op, "args": args}
+        if enforce_schema:
+            request["enforce_schema"] = True
+        self.stream.write(json.dumps(request).encode() + b"\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ServerError("graph server closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise ServerError(response["error"])
+        return response["result"]
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+def connect(address=None, graph_path=None):
+    """Client for ``address`` (or the graph's default socket), or None if no server is running."""
+    if address is None:
+        if graph_path is None or not hasattr(socket, "AF_UNIX"):
+            return None
+        address = socket_path(graph_path)
+        if not address.exists():
+            return None
+    try:
+        return OntologyClient(address)
+    except OSError:
+        return None
@@ -0,0 +1,716 @@
+"""
+Compact in-memory graph model for graphs too large for ``OntologyGraph``'s
+dict-of-dicts representation.
+
+* Entities are ``__slots__`` records holding interned type and timestamp
+  strings, with properties kept as JSON bytes and decoded on each read.
+* Entity ids map to integer nodes; edges live in CSR arrays: per-node offsets
+  into packed ``(relation << 32 | target)`` keys, stored in the order
+  ``OntologyGraph`` lists a node's edges (grouped by relation, then insertion
+  order), with a per-node permutation sorted by key so an edge is found by
+  binary search, plus an incoming index of edge numbers in the same order.
+  Relation names and edge properties are stored once and referenced by index.
+* Edges added after the arrays were built go to a small overlay that is
+  merged into new arrays once it grows past a fraction of the graph.
+* Entities list in the order they were created, as in ``OntologyGraph``:
+  an entity deleted and created again moves to the end, though it keeps
+  its node.
+
+``CompactGraph`` is a drop-in for reads: ``entities`` is a read-only mapping
+producing the same entity dicts, and querying, ``related``, traversal and
+shortest paths return the same shapes. Mutate it only through ``apply``.
+"""
+import json
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, ValuesView
+
+from .graph import DIRECTIONS, OntologyGraph
+
+# Overlay edges tolerated before rebuilding the arrays: at least this many,
+# else this fraction of the edges already in them
+MIN_OVERLAY_EDGES = 1 << 16
+OVERLAY_FRACTION = 0.5
+# Deleted entities' holes tolerated in the creation order before it is rebuilt
+MIN_ORDER_HOLES = 1 << 16
+
+_REMOVED = -1
+_TARGET_MASK = 0xFFFFFFFF
+_ENTITY_KEYS = ("id", "type", "properties", "created", "updated", "version")
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _group_order(old, overlay) -> list:
+    """
+    A node's edges in ``OntologyGraph``'s order: grouped by relation, groups
+    in the order they were started, edges in insertion order within a group.
+    ``old`` is the stored edges as ``(relation, edge)`` in stored order, edge
+    None where removed (its group keeps its place); ``overlay`` is the newer
+    ``(relation, edge, group)`` in insertion order, where group -1 joins the
+    relation's stored group (or, untracked, its overlay group) and others
+    number the groups started since, in order.
+    """
+    groups, started = {}, {}
+    for rel_index, edge in old:
+        group = groups.get(rel_index)
+        if group is None:
+            group = groups[rel_index] = []
+        if edge is not None:
+            group.append(edge)
+    for rel_index, edge, number in overlay:
+        if number < 0:
+            group = groups.get(rel_index)
+            if group is None:
+                group = groups[rel_index] = []
+        else:
+            group = started.get(number)
+            if group is None:
+                group = started[number] = []
+        group.append(edge)
+    ordered = [edge for group in groups.values() for edge in group]
+    for number in sorted(started):
+        ordered.extend(started[number])
+    return ordered
+
+
+def _one_relation(overlay: dict):
+    """The relation all of a node's overlay edges share, so they form one group; else None."""
+    rel_index = next(iter(overlay))[0]
+    if len(overlay) == 1 or all(rel == rel_index for rel, _ in overlay):
+        return rel_index
+    return None
+
+
+class EntityRecord:
+    """One entity; ``extra`` holds any other top-level keys, JSON-encoded like ``properties``."""
+    __slots__ = ("type", "properties", "created", "updated", "version", "extra")
+
+    def __init__(self, type_name, properties, created, updated, version, extra):
+        self.type = type_name
+        self.properties = properties
+        self.created = created
+        self.updated = updated
+        self.version = version
+        self.extra = extra
+
+
+class _EntityValues(ValuesView):
+    def __iter__(self):
+        graph = self._mapping.graph
+        records = graph._records
+        for node in graph._live_nodes():
+            yield graph._entity(node, records[node])
+
+
+class EntityView(Mapping):
+    """Read-only ``{id: entity dict}`` view; every lookup builds a fresh dict."""
+    __slots__ = ("graph",)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, entity_id):
+        node = self.graph._nodes.get(entity_id)
+        record = self.graph._records[node] if node is not None else None
+        if record is None:
+            raise KeyError(entity_id)
+        return self.graph._entity(node, record)
+
+    def __contains__(self, entity_id):
+        node = self.graph._nodes.get(entity_id)
+        return node is not None and self.graph._records[node] is not None
+
+    def __iter__(self):
+        return map(self.graph._ids.__getitem__, self.graph._live_nodes())
+
+    def __len__(self):
+        return self.graph._entity_count
+
+    def values(self):
+        return _EntityValues(self)
+
+
+class CompactGraph(OntologyGraph):
+    def __init__(self):
+        self._strings = {}
+        self._ids = []
+        self._nodes = {}
+        self._records = []
+        self._entity_count = 0
+        # Live nodes in creation order, _REMOVED where one was deleted, and
+        # each node's position there (-1 while not live)
+        self._order = array("i")
+        self._slot = array("q")
+        self._rels = []
+        self._rel_index = {}
+        # Encoded edge properties; index 0 is the empty object
+        self._edge_props = [b"{}"]
+        # CSR arrays over the first len(_out_offsets) - 1 nodes
+        self._out_offsets = array("q", [0])
+        self._out_keys = array("q")
+        self._out_props = array("i")
+        self._edge_from = array("i")
+        self._in_offsets = array("q", [0])
+        self._in_edges = array("q")
+        # Each node's edge numbers sorted by key, for lookups by (relation, target)
+        self._out_sorted = array("q")
+        # Overlay: node -> {(rel, other node): props index}, both directions
+        self._overlay_out = {}
+        self._overlay_in = {}
+        self._overlay_size = 0
+        # Overlay edges join their relation's group at each end, which keeps
+        # its place while it has live edges. Until an edge is removed the
+        # overlay's own order places them; from then on groups are tracked:
+        # the number of the group each overlay edge joined (absent for the
+        # group stored in the arrays), numbered in the order they started,
+        # and [live size, number] of each group touched, so one that empties
+        # restarts under a new number after the node's other groups
+        self._group_out = {}
+        self._group_in = {}
+        self._groups = {}
+        self._next_group = 0
+        self._tracking = False
+        self._edge_count = 0
+        self.property_indexes = {}
+
+    @classmethod
+    def from_state(cls, entities, relations) -> "CompactGraph":
+        """Build from iterables of entity dicts and graph relation dicts."""
+        graph = cls()
+        for entity in entities:
+            graph._put_entity(entity)
+        for rel in relations:
+            graph._add_relation(rel)
+        graph.freeze()
+        return graph
+
+    @classmethod
+    def from_graph(cls, graph: OntologyGraph) -> "CompactGraph":
+        """
+        Build from a dict graph, listing each node's edges in the order its
+        adjacency does. The arrays are filled from the adjacency directly:
+        after removals, no single insertion order reproduces every node's
+        outgoing and incoming order at once.
+        """
+        compact = cls()
+        for entity in graph.entities.values():
+            compact._put_entity(entity)
+        edges = []
+        for source_id, by_rel in graph.outgoing.items():
+            source = compact._node(source_id)
+            for rel_type, targets in by_rel.items():
+                rel_index = compact._rel(rel_type)
+                for target_id, rel in targets.items():
+                    edges.append((source, rel_index << 32 | compact._node(target_id),
+                                  compact._props_index(rel.get("properties"))))
+        # Stable, so each node keeps its adjacency order
+        edges.sort(key=lambda edge: edge[0])
+        n, total = len(compact._ids), len(edges)
+        counts = array("q", bytes(8 * (n + 1)))
+        for source, _, _ in edges:
+            counts[source + 1] += 1
+        for node in range(n):
+            counts[node + 1] += counts[node]
+        keys = array("q", (key for _, key, _ in edges))
+        sources = array("i", (source for source, _, _ in edges))
+        by_key = array("q", bytes(8 * total))
+        for node in range(n):
+            start, end = counts[node], counts[node + 1]
+            if end > start:
+                by_key[start:end] = array("q", sorted(range(start, end), key=keys.__getitem__))
+        compact._out_offsets, compact._out_keys, compact._out_sorted = counts, keys, by_key
+        compact._out_props = array("i", (props for _, _, props in edges))
+        compact._edge_from = sources
+        del edges
+
+        in_counts = array("q", bytes(8 * (n + 1)))
+        for key in keys:
+            in_counts[(key & _TARGET_MASK) + 1] += 1
+        for node in range(n):
+            in_counts[node + 1] += in_counts[node]
+        in_edges = array("q", bytes(8 * total))
+        for target_id, by_rel in graph.incoming.items():
+            target = compact._nodes[target_id]
+            offset = in_counts[target]
+            for rel_type, sources_by_id in by_rel.items():
+                key = compact._rel_index[rel_type] << 32 | target
+                for source_id in sources_by_id:
+                    in_edges[offset] = compact._find_edge(compact._nodes[source_id], key)
+                    offset += 1
+        compact._in_offsets, compact._in_edges = in_counts, in_edges
+        compact._edge_count = total
+        return compact
+
+    def _intern(self, value):
+        if not isinstance(value, str):
+            return value
+        return self._strings.setdefault(value, value)
+
+    def _node(self, entity_id: str) -> int:
+        node = self._nodes.get(entity_id)
+        if node is None:
+            entity_id = self._intern(entity_id)
+            node = self._nodes[entity_id] = len(self._ids)
+            self._ids.append(entity_id)
+            self._records.append(None)
+            self._slot.append(-1)
+        return node
+
+    def _rel(self, rel_type: str) -> int:
+        index = self._rel_index.get(rel_type)
+        if index is None:
+            index = self._rel_index[rel_type] = len(self._rels)
+            self._rels.append(self._intern(rel_type))
+        return index
+
+    # Entities
+
+    def _entity(self, node: int, record: EntityRecord) -> dict:
+        entity = {"id": self._ids[node], "type": record.type,
+                  "properties": json.loads(record.properties) if record.properties else {}}
+        if record.created is not None:
+            entity["created"] = record.created
+        if record.updated is not None:
+            entity["updated"] = record.updated
+        if record.extra is not None:
+            entity.update(json.loads(record.extra))
+        entity["version"] = record.version
+        return entity
+
+    def _put_entity(self, entity: dict):
+        extra = {key: value for key, value in entity.items() if key not in _ENTITY_KEYS}
+        created, updated = entity.get("created"), entity.get("updated")
+        # Timestamps that aren't strings (or explicit nulls) round-trip through extra
+        for key, value in (("created", created), ("updated", updated)):
+            if key in entity and not isinstance(value, str):
+                extra[key] = value
+        properties = entity.get("properties") or {}
+        node = self._node(entity["id"])
+        if self._records[node] is None:
+            self._entity_count += 1
+            self._slot[node] = len(self._order)
+            self._order.append(node)
+        self._records[node] = EntityRecord(
+            self._intern(entity["type"]), _encode(properties) if properties else None,
+            self._intern(created) if isinstance(created, str) else None,
+            self._intern(updated) if isinstance(updated, str) else None,
+            entity.get("version", 1), _encode(extra) if extra else None)
+
+    def _drop_entity(self, node: int):
+        self._records[node] = None
+        self._entity_count -= 1
+        self._order[self._slot[node]] = _REMOVED
+        self._slot[node] = -1
+        if len(self._order) > 2 * self._entity_count + MIN_ORDER_HOLES:
+            # Mostly holes: keep only the live nodes
+            self._order = array("i", self._live_nodes())
+            for position, live in enumerate(self._order):
+                self._slot[live] = position
+
+    def _live_nodes(self):
+        return (node for node in self._order if node != _REMOVED)
+
+    @property
+    def entities(self) -> EntityView:
+        return EntityView(self)
+
+    def _in_log_order(self, ids):
+        slot, nodes = self._slot, self._nodes
+        return sorted(ids, key=lambda entity_id: slot[nodes[entity_id]])
+
+    # Edges
+
+    def _find_edge(self, source: int, key: int) -> int | None:
+        if source + 1 >= len(self._out_offsets):
+            return None
+        lo, hi = self._out_offsets[source], self._out_offsets[source + 1]
+        i = bisect_left(self._out_sorted, key, lo, hi, key=self._out_keys.__getitem__)
+        if i < hi:
+            edge = self._out_sorted[i]
+            if self._out_keys[edge] == key and self._out_props[edge] != _REMOVED:
+                return edge
+        return None
+
+    def _props_index(self, properties) -> int:
+        if not properties:
+            return 0
+        self._edge_props.append(_encode(properties))
+        return len(self._edge_props) - 1
+
+    def _stored_run(self, node: int, rel_index: int) -> range:
+        """Positions of a node's stored edges for one relation: one contiguous run, found through the key order."""
+        if node + 1 >= len(self._out_offsets):
+            return range(0)
+        lo, hi = self._out_offsets[node], self._out_offsets[node + 1]
+        first = bisect_left(self._out_sorted, rel_index << 32, lo, hi, key=self._out_keys.__getitem__)
+        last = bisect_left(self._out_sorted, (rel_index + 1) << 32, first, hi, key=self._out_keys.__getitem__)
+        if first == last:
+            return range(0)
+        start = min(self._out_sorted[first:last])
+        return range(start, start + last - first)
+
+    def _stored_in(self, node: int) -> range:
+        if node + 1 >= len(self._in_offsets):
+            return range(0)
+        return range(self._in_offsets[node], self._in_offsets[node + 1])
+
+    def _group(self, node: int, rel_index: int, outgoing: bool) -> list:
+        """[live size, number] of a node's group for one relation, counted once and then kept up to date."""
+        key = (node, rel_index, outgoing)
+        group = self._groups.get(key)
+        if group is None:
+            size, number = 0, -1
+            keys, props = self._out_keys, self._out_props
+            if outgoing:
+                overlay, numbers = self._overlay_out.get(node), self._group_out
+                size = sum(1 for i in self._stored_run(node, rel_index) if props[i] != _REMOVED)
+            else:
+                overlay, numbers = self._overlay_in.get(node), self._group_in
+                for i in self._stored_in(node):
+                    edge = self._in_edges[i]
+                    if keys[edge] >> 32 == rel_index and props[edge] != _REMOVED:
+                        size += 1
+            for rel, other in overlay or ():
+                if rel == rel_index:
+                    size += 1
+                    number = numbers.get((node, rel, other), -1)
+            group = self._groups[key] = [size, number]
+        return group
+
+    def _add_relation(self, rel: dict):
+        source, target, rel_index = self._node(rel["from"]), self._node(rel["to"]), self._rel(rel["rel"])
+        props = self._props_index(rel.get("properties"))
+        edge = self._find_edge(source, rel_index << 32 | target)
+        if edge is not None:
+            # Re-relating an existing edge replaces its properties in place
+            self._out_props[edge] = props
+            return
+        outgoing = self._overlay_out.setdefault(source, {})
+        if (rel_index, target) not in outgoing:
+            if self._tracking:
+                self._join_group(source, rel_index, target, True, self._group_out)
+                self._join_group(target, rel_index, source, False, self._group_in)
+            self._overlay_size += 1
+            self._edge_count += 1
+        outgoing[(rel_index, target)] = props
+        self._overlay_in.setdefault(target, {})[(rel_index, source)] = props
+        if self._overlay_size > max(MIN_OVERLAY_EDGES, len(self._out_keys) * OVERLAY_FRACTION):
+            self.freeze()
+
+    def _join_group(self, node: int, rel_index: int, other: int, outgoing: bool, numbers: dict):
+        group = self._groups.get((node, rel_index, outgoing)) or self._group(node, rel_index, outgoing)
+        if not group[0]:
+            group[1] = self._next_group
+            self._next_group += 1
+        group[0] += 1
+        if group[1] >= 0:
+            numbers[(node, rel_index, other)] = group[1]
+
+    def _remove_relation(self, from_id: str, rel_type: str, to_id: str):
+        source, target = self._nodes.get(from_id), self._nodes.get(to_id)
+        rel_index = self._rel_index.get(rel_type)
+        if source is None or target is None or rel_index is None:
+            return
+        edge = self._find_edge(source, rel_index << 32 | target)
+        if not self._tracking and (edge is not None or (rel_index, target) in self._overlay_out.get(source, ())):
+            self._track_groups()
+        if edge is not None:
+            self._out_props[edge] = _REMOVED
+            self._edge_count -= 1
+        else:
+            outgoing = self._overlay_out.get(source)
+            if outgoing is None or (rel_index, target) not in outgoing:
+                return
+            del outgoing[(rel_index, target)]
+            if not outgoing:
+                del self._overlay_out[source]
+            incoming = self._overlay_in[target]
+            del incoming[(rel_index, source)]
+            if not incoming:
+                del self._overlay_in[target]
+            self._group_out.pop((source, rel_index, target), None)
+            self._group_in.pop((target, rel_index, source), None)
+            self._overlay_size -= 1
+            self._edge_count -= 1
+        for node, outgoing in ((source, True), (target, False)):
+            group = self._groups.get((node, rel_index, outgoing))
+            if group is None:
+                self._group(node, rel_index, outgoing)
+            else:
+                group[0] -= 1
+
+    def _track_groups(self):
+        """Number the groups started in the overlay so far, before a removal can change their order."""
+        self._tracking = True
+        for overlay, numbers, outgoing in ((self._overlay_out, self._group_out, True),
+                                           (self._overlay_in, self._group_in, False)):
+            for node, edges in overlay.items():
+                started = {}
+                for rel_index, other in edges:
+                    number = started.get(rel_index)
+                    if number is None:
+                        number = -1
+                        if not self._stored(node, rel_index, outgoing):
+                            number = self._next_group
+                            self._next_group += 1
+                        started[rel_index] = number
+                    if number >= 0:
+                        numbers[(node, rel_index, other)] = number
+
+    def _stored(self, node: int, rel_index: int, outgoing: bool) -> bool:
+        if outgoing:
+            return bool(self._stored_run(node, rel_index))
+        keys, in_edges = self._out_keys, self._in_edges
+        return any(keys[in_edges[i]] >> 32 == rel_index for i in self._stored_in(node))
+
+    def freeze(self):
+        """Merge the overlay into freshly built arrays, dropping removed edges."""
+        n = len(self._ids)
+        old_offsets, old_keys, old_props = self._out_offsets, self._out_keys, self._out_props
+        old_in_offsets, old_in_edges = self._in_offsets, self._in_edges
+        counts = array("q", bytes(8 * (n + 1)))
+        for node in range(len(old_offsets) - 1):
+            for i in range(old_offsets[node], old_offsets[node + 1]):
+                if old_props[i] != _REMOVED:
+                    counts[node + 1] += 1
+        for node, outgoing in self._overlay_out.items():
+            counts[node + 1] += len(outgoing)
+        for node in range(n):
+            counts[node + 1] += counts[node]
+
+        # Carry over only the properties still referenced
+        props_map = {0: 0}
+        edge_props = [b"{}"]
+
+        def remap(index):
+            new = props_map.get(index)
+            if new is None:
+                new = props_map[index] = len(edge_props)
+                edge_props.append(self._edge_props[index])
+            return new
+
+        total = counts[n]
+        keys = array("q", bytes(8 * total))
+        props = array("i", bytes(4 * total))
+        sources = array("i", bytes(4 * total))
+        by_key = array("q", bytes(8 * total))
+        # Where each old and overlay edge ends up, for the incoming index
+        moved = array("q", bytes(8 * len(old_keys)))
+        overlay_moved = {}
+        for node in range(n):
+            start, end = counts[node], counts[node + 1]
+            if start == end:
+                continue
+            if node in self._overlay_out:
+                for offset, (key, p, old) in enumerate(self._out_order(node, old_offsets, old_keys, old_props), start):
+                    keys[offset] = key
+                    props[offset] = p and remap(p)
+                    sources[offset] = node
+                    if old is None:
+                        overlay_moved[(node, key)] = offset
+                    else:
+                        moved[old] = offset
+            else:
+                offset = start
+                for old in range(old_offsets[node], old_offsets[node + 1]):
+                    p = old_props[old]
+                    if p != _REMOVED:
+                        keys[offset] = old_keys[old]
+                        props[offset] = p and remap(p)
+                        sources[offset] = node
+                        moved[old] = offset
+                        offset += 1
+            if end - start == 1:
+                by_key[start] = start
+            else:
+                by_key[start:end] = array("q", sorted(range(start, end), key=keys.__getitem__))
+
+        in_counts = array("q", bytes(8 * (n + 1)))
+        for key in keys:
+            in_counts[(key & _TARGET_MASK) + 1] += 1
+        for node in range(n):
+            in_counts[node + 1] += in_counts[node]
+        in_edges = array("q", bytes(8 * total))
+        for node in range(n):
+            stored = old_in_edges[old_in_offsets[node]:old_in_offsets[node + 1]] if node + 1 < len(old_in_offsets) else ()
+            overlay = self._overlay_in.get(node)
+            rel_index = _one_relation(overlay) if overlay else None
+            if rel_index is not None and all(old_keys[edge] >> 32 != rel_index for edge in stored):
+                edges = [moved[edge] for edge in stored if old_props[edge] != _REMOVED]
+                edges.extend(overlay_moved[(source, rel_index << 32 | node)] for _, source in overlay)
+            elif overlay:
+                old = ((old_keys[edge] >> 32, moved[edge] if old_props[edge] != _REMOVED else None) for edge in stored)
+                edges = _group_order(old, ((rel_index, overlay_moved[(source, rel_index << 32 | node)],
+                                            self._group_in.get((node, rel_index, source), -1))
+                                           for rel_index, source in overlay))
+            else:
+                edges = [moved[edge] for edge in stored if old_props[edge] != _REMOVED]
+            if edges:
+                in_edges[in_counts[node]:in_counts[node + 1]] = array("q", edges)
+
+        self._out_offsets, self._out_keys, self._out_props = counts, keys, props
+        self._out_sorted = by_key
+        self._edge_from, self._in_offsets, self._in_edges = sources, in_counts, in_edges
+        self._edge_props = edge_props
+        self._overlay_out, self._overlay_in = {}, {}
+        self._overlay_size = 0
+        self._group_out, self._group_in, self._groups = {}, {}, {}
+        self._next_group = 0
+        self._tracking = False
+
+    def _out_order(self, node: int, offsets, keys, props) -> list:
+        """A node's live ``(key, props, old edge or None)`` in the order to store them, overlay included."""
+        stored = range(offsets[node], offsets[node + 1]) if node + 1 < len(offsets) else range(0)
+        overlay = self._overlay_out.get(node)
+        if not overlay:
+            return [(keys[i], props[i], i) for i in stored if props[i] != _REMOVED]
+        rel_index = _one_relation(overlay)
+        if rel_index is not None and not self._stored_run(node, rel_index):
+            # A group of its own after the stored ones
+            return ([(keys[i], props[i], i) for i in stored if props[i] != _REMOVED]
+                    + [(rel_index << 32 | target, p, None) for (_, target), p in overlay.items()])
+        old = ((keys[i] >> 32, (keys[i], props[i], i) if props[i] != _REMOVED else None) for i in stored)
+        return _group_order(old, ((rel_index, (rel_index << 32 | target, p, None), self._group_out.get((node, rel_index, target), -1))
+                                  for (rel_index, target), p in overlay.items()))
+
+    def _relation(self, source: int, rel_index: int, target: int, props: int) -> dict:
+        return {"from": self._ids[source], "rel": self._rels[rel_index], "to": self._ids[target],
+                "properties": json.loads(self._edge_props[props]) if props else {}}
+
+    def _outgoing(self, node: int, rel_indexes):
+        overlay = self._overlay_out.get(node)
+        if rel_indexes is None:
+            for key, props, _ in self._out_order(node, self._out_offsets, self._out_keys, self._out_props):
+                yield key >> 32, key & _TARGET_MASK, props
+            return
+        for rel_index in rel_indexes:
+            for i in self._stored_run(node, rel_index):
+                props = self._out_props[i]
+                if props != _REMOVED:
+                    yield rel_index, self._out_keys[i] & _TARGET_MASK, props
+            for (rel, target), props in (overlay or {}).items():
+                if rel == rel_index:
+                    yield rel, target, props
+
+    def _incoming(self, node: int, rel_indexes):
+        keys, out_props, in_edges, sources = self._out_keys, self._out_props, self._in_edges, self._edge_from
+        stored = self._stored_in(node)
+        overlay = self._overlay_in.get(node)
+        if rel_indexes is None and overlay:
+            old = ((keys[in_edges[i]] >> 32, in_edges[i] if out_props[in_edges[i]] != _REMOVED else None)
+                   for i in stored)
+            newer = ((rel_index, (rel_index, source, props), self._group_in.get((node, rel_index, source), -1))
+                     for (rel_index, source), props in overlay.items())
+            for item in _group_order(old, newer):
+                if isinstance(item, tuple):
+                    yield item
+                else:
+                    yield keys[item] >> 32, sources[item], out_props[item]
+            return
+        for rel_index in ([None] if rel_indexes is None else rel_indexes):
+            for i in stored:
+                edge = in_edges[i]
+                rel, props = keys[edge] >> 32, out_props[edge]
+                if props != _REMOVED and (rel_index is None or rel == rel_index):
+                    yield rel, sources[edge], props
+            for (rel, source), props in (overlay or {}).items():
+                if rel == rel_index:
+                    yield rel, source, props
+
+    def neighbors(self, entity_id: str, rel_types=None, direction: str = "outgoing"):
+        """Yield ``(relation, direction, other_id)`` for edges touching ``entity_id``."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}, got '{direction}'")
+        node = self._nodes.get(entity_id)
+        if node is None:
+            return
+        rel_indexes = None
+        if rel_types is not None:
+            rel_indexes = [self._rel_index[r] for r in dict.fromkeys(rel_types) if r in self._rel_index]
+        if direction in ("outgoing", "both"):
+            for rel_index, target, props in self._outgoing(node, rel_indexes):
+                yield self._relation(node, rel_index, target, props), "outgoing", self._ids[target]
+        if direction in ("incoming", "both"):
+            for rel_index, source, props in self._incoming(node, rel_indexes):
+                # A self-loop was already reported as outgoing
+                if direction == "both" and source == node:
+                    continue
+                yield self._relation(source, rel_index, node, props), "incoming", self._ids[source]
+
+    def iter_relations(self):
+        for node in range(len(self._ids)):
+            for rel_index, target, props in self._outgoing(node, None):
+                yield self._relation(node, rel_index, target, props)
+
+    @property
+    def relations(self) -> list:
+        return list(self.iter_relations())
+
+    # Full adjacency dicts for schema validation, built on each access
+
+    @property
+    def edges(self) -> dict:
+        return {(rel["from"], rel["rel"], rel["to"]): rel for rel in self.iter_relations()}
+
+    def _adjacency(self, outgoing: bool) -> dict:
+        index = {}
+        for rel in self.iter_relations():
+            near, far = (rel["from"], rel["to"]) if outgoing else (rel["to"], rel["from"])
+            index.setdefault(near, {}).setdefault(rel["rel"], {})[far] = rel
+        return index
+
+    @property
+    def outgoing(self) -> dict:
+        return self._adjacency(True)
+
+    @property
+    def incoming(self) -> dict:
+        return self._adjacency(False)
+
+    def apply(self, record: dict):
+        """Apply one log record to the graph."""
+        op = record.get("op")
+        if op == "create":
+            entity = dict(record["entity"])
+            node = self._nodes.get(entity["id"])
+            previous = self._records[node] if node is not None else None
+            # Versions count writes to an entity for optimistic update/delete checks
+            entity["version"] = previous.version + 1 if previous else entity.get("version", 1)
+            if self.property_indexes and previous is not None:
+                self._unindex_entity(self._entity(node, previous))
+            self._put_entity(entity)
+            if self.property_indexes:
+                self._index_entity(entity)
+        elif op == "update":
+            node = self._nodes.get(record["id"])
+            current = self._records[node] if node is not None else None
+            if current is not None:
+                props = record.get("properties", {})
+                entity = self._entity(node, current)
+                if self.property_indexes:
+                    self._unindex_entity(entity, props)
+                entity["properties"].update(props)
+                entity["updated"] = record.get("timestamp")
+                entity["version"] = current.version + 1
+                self._put_entity(entity)
+                if self.property_indexes:
+                    self._index_entity(entity, props)
+        elif op == "delete":
+            node = self._nodes.get(record["id"])
+            previous = self._records[node] if node is not None else None
+            if previous is not None:
+                if self.property_indexes:
+                    self._unindex_entity(self._entity(node, previous))
+                self._drop_entity(node)
+        elif op == "relate":
+            self._add_relation({
+                "from": record["from"],
+                "rel": record["rel"],
+                "to": record["to"],
+                "properties": record.get("properties", {})
+            })
+        elif op == "unrelate":
+            self._remove_relation(record["from"], record["rel"], record["to"])
@@ -0,0 +1,167 @@
+"""
+Log compaction: rewrite the append-only graph log to its live state.
+
+Every live entity becomes a single ``create`` record and every live edge a
+single ``relate`` record. Optionally only history older than N days is
+folded, with the raw folded records appended to an archive segment and the
+recent records kept verbatim.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from .locking import graph_lock
+from .snapshot import remove_snapshot
+
+
+def archive_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(f"{graph_path.stem}.archive{graph_path.suffix}")
+
+
+def parse_timestamp(value):
+    try:
+        ts = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _fold(entities: dict, edges: dict, record: dict):
+    op = record.get("op")
+    if op == "create":
+        entity = record["entity"]
+        previous = entities.get(entity["id"])
+        # Carried into the compacted create record so versions survive compaction
+        entity["version"] = previous.get("version", 1) + 1 if previous else entity.get("version", 1)
+        entities[entity["id"]] = entity
+    elif op == "update":
+        entity = entities.get(record["id"])
+        if entity is not None:
+            entity["properties"].update(record.get("properties", {}))
+            entity["updated"] = record.get("timestamp")
+            entity["version"] = entity.get("version", 1) + 1
+    elif op == "delete":
+        entities.pop(record["id"], None)
+    elif op == "relate":
+        edges[(record["from"], record["rel"], record["to"])] = record
+    elif op == "unrelate":
+        edges.pop((record["from"], record["rel"], record["to"]), None)
+
+
+def fsync_dir(path: Path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fold_log(f, cutoff, entities: dict, edges: dict, stats: dict) -> tuple[list, list, int]:
+    """
+    Fold the records read from binary file ``f`` into ``entities`` and
+    ``edges``. With a ``cutoff`` datetime, records from the first one newer
+    than it on are left unfolded. Returns the raw ``(folded, kept)`` lines
+    and the file offset where the kept records start.
+    """
+    folded, kept = [], []
+    offset = kept_offset = f.tell()
+    for line in f:
+        offset += len(line)
+        if not kept:
+            kept_offset = offset
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        stats["records_before"] += 1
+        if not kept and cutoff is not None:
+            ts = parse_timestamp(record.get("timestamp"))
+            if ts is not None and ts >= cutoff:
+                kept_offset = offset - len(line)
+                kept.append(line)
+                continue
+        if kept:
+            kept.append(line)
+        else:
+            folded.append(line)
+            _fold(entities, edges, record)
+    return folded, kept, kept_offset
+
+
+def archive_lines(graph_path, lines: list) -> int:
+    """Append raw folded lines to the graph's archive segment."""
+    if not lines:
+        return 0
+    with open(archive_path(graph_path), "ab") as archive:
+        for line in lines:
+            archive.write(line if line.endswith(b"\n") else line + b"\n")
+        archive.flush()
+        os.fsync(archive.fileno())
+    return len(lines)
+
+
+def write_state(out, entities: dict, edges: dict):
+    """Write one ``create`` record per entity and one ``relate`` record per edge to binary file ``out``."""
+    for entity in entities.values():
+        record = {"op": "create", "entity": entity,
+                  "timestamp": entity.get("updated") or entity.get("created")}
+        out.write(json.dumps(record).encode() + b"\n")
+    for record in edges.values():
+        out.write(json.dumps(record).encode() + b"\n")
+
+
+def cutoff_for(archive_days: int = None):
+    if archive_days is None:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=archive_days)
+
+
+def compact_log(graph_path, archive_days: int = None) -> dict:
+    """
+    Atomically rewrite ``graph_path`` to one record per live entity and edge.
+    With ``archive_days``, only records older than that many days are folded;
+    they are appended raw to the archive segment and newer records are kept.
+    """
+    graph_path = Path(graph_path)
+    cutoff = cutoff_for(archive_days)
+
+    stats = {"records_before": 0, "records_after": 0, "archived": 0,
+             "bytes_before": 0, "bytes_after": 0}
+
+    # Appenders take the same lock, so nothing is written between read and replace
+    with graph_lock(graph_path):
+        if not graph_path.exists():
+            return stats
+        stats["bytes_before"] = graph_path.stat().st_size
+
+        entities, edges = {}, {}
+        with open(graph_path, "rb") as f:
+            folded, kept, _ = fold_log(f, cutoff, entities, edges, stats)
+
+        tmp_path = graph_path.with_name(graph_path.name + ".compact.tmp")
+        with open(tmp_path, "wb") as out:
+            write_state(out, entities, edges)
+            for line in kept:
+                out.write(line if line.endswith(b"\n") else line + b"\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+        if cutoff is not None:
+            stats["archived"] = archive_lines(graph_path, folded)
+
+        os.replace(tmp_path, graph_path)
+        fsync_dir(graph_path.parent)
+        remove_snapshot(graph_path)
+
+        stats["records_after"] = len(entities) + len(edges) + len(kept)
+        stats["bytes_after"] = graph_path.stat().st_size
+    return stats
@@ -1,11 +1,53 @@
-from rdflib import Graph, URIRef, Literal, RDF, RDFS, Namespace
-from .manager import OntologyManager
+"""
+RDF export.
+
+``RDFExporter.export_turtle`` builds an rdflib ``Graph`` and serializes it in
+one string. The streaming writers below need no rdflib: they turn entities
+and relations into N-Triples, Turtle or JSON-LD text one statement at a time
+and yield it in chunks, so memory stays flat however large the graph is.
+
+Entities become ``<base><id> a <base><Type>`` plus one triple per property
+value (list values give one triple per item). Literals are typed (integers,
+doubles, booleans; objects as ``rdf:JSON``) and IRIs are percent-escaped.
+Relations become ``<from> <base><rel> <to>`` and, when they carry
+properties, a reified ``rdf:Statement`` holding them.
+"""
+import json
+import math
+import re
+from urllib.parse import quote
+
+DEFAULT_BASE = "http://example.org/ontology/"
+
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+# Output characters buffered before a chunk is yielded.
+CHUNK_SIZE = 1 << 16
+
+# format -> (file extension, MIME type)
+FORMATS = {
+    "ntriples": ("nt", "application/n-triples"),
+    "turtle": ("ttl", "text/turtle"),
+    "jsonld": ("jsonld", "application/ld+json"),
+}
+
+# Characters left unescaped in IRI local parts: RFC 3986 unreserved and
+# sub-delimiters, plus ':' and '@'
+_IRI_SAFE = "-._~!$&'()*+,;=:@"
+
+# Local names written as Turtle prefixed names; anything else stays a full <IRI>
+_LOCAL_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_-]*\Z")
+
+_ESCAPES = {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+
 
 class RDFExporter:
-    def __init__(self, manager: OntologyManager):
+    def __init__(self, manager):
         self.manager = manager
 
     def export_turtle(self) -> str:
+        from rdflib import Graph, URIRef, Literal, RDF, RDFS, Namespace
         g = Graph()
         EX = Namespace("http://example.org/ontology/")
         g.bind("ex", EX)
@@ -30,3 +72,184 @@ class RDFExporter:
             g.add((src, pred, dst))
 
         return g.serialize(format="turtle")
+
+    def stream(self, fmt: str = "turtle", base: str = DEFAULT_BASE, chunk_size: int = CHUNK_SIZE):
+        """Yield the graph as ``fmt`` text chunks, without materializing it; see ``iter_rdf``."""
+        entities, relations = self.manager.iter_state()
+        return iter_rdf(entities, relations, fmt, base, chunk_size)
+
+    def write(self, out, fmt: str = "turtle", base: str = DEFAULT_BASE) -> int:
+        """Write the graph as ``fmt`` to a path or text file; returns the characters written."""
+        return write_rdf(out, self.stream(fmt, base))
+
+
+def iri(base: str, name) -> str:
+    return base + quote(str(name), safe=_IRI_SAFE)
+
+
+def _escape(text: str) -> str:
+    out = []
+    for ch in text:
+        escaped = _ESCAPES.get(ch)
+        if escaped is not None:
+            out.append(escaped)
+        elif ch < " " or ch == "\x7f":
+            out.append(f"\\u{ord(ch):04X}")
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _typed(value) -> tuple[str, str | None] | None:
+    """``(lexical form, datatype IRI)`` for a literal value (no datatype for strings), None to skip it."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return ("true" if value else "false"), XSD + "boolean"
+    if isinstance(value, int):
+        return str(value), XSD + "integer"
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN", XSD + "double"
+        if math.isinf(value):
+            return ("INF" if value > 0 else "-INF"), XSD + "double"
+        return repr(value), XSD + "double"
+    if isinstance(value, str):
+        return value, None
+    return json.dumps(value, sort_keys=True, ensure_ascii=False), RDF + "JSON"
+
+
+def _values(value):
+    # A list is a multi-valued property: one statement per item
+    return value if isinstance(value, list) else [value]
+
+
+def _statements(entities, relations, base: str):
+    """
+    Yield ``(subject, predicate, object)`` per statement: subject and predicate
+    are IRIs or blank node labels (``_:...``), the object is an IRI, a blank
+    node label, or a literal as ``(lexical form, datatype)``.
+    """
+    for entity in entities:
+        subject = iri(base, entity["id"])
+        yield subject, RDF + "type", iri(base, entity["type"])
+        for key, value in entity["properties"].items():
+            predicate = iri(base, key)
+            for item in _values(value):
+                literal = _typed(item)
+                if literal is not None:
+                    yield subject, predicate, literal
+    for n, rel in enumerate(relations):
+        subject, predicate, obj = iri(base, rel["from"]), iri(base, rel["rel"]), iri(base, rel["to"])
+        yield subject, predicate, obj
+        properties = rel.get("properties")
+        if not properties:
+            continue
+        # Reification carries the edge's own properties
+        node = f"_:r{n}"
+        yield node, RDF + "type", RDF + "Statement"
+        yield node, RDF + "subject", subject
+        yield node, RDF + "predicate", predicate
+        yield node, RDF + "object", obj
+        for key, value in properties.items():
+            for item in _values(value):
+                literal = _typed(item)
+                if literal is not None:
+                    yield node, iri(base, key), literal
+
+
+def _term(term, prefixes=()) -> str:
+    if isinstance(term, tuple):
+        lexical, datatype = term
+        text = f'"{_escape(lexical)}"'
+        return text if datatype is None else f"{text}^^{_term(datatype, prefixes)}"
+    if term.startswith("_:"):
+        return term
+    for prefix, namespace in prefixes:
+        if term.startswith(namespace) and _LOCAL_NAME.match(term, len(namespace)):
+            return f"{prefix}:{term[len(namespace):]}"
+    return f"<{term}>"
+
+
+def _ntriples(entities, relations, base: str):
+    for subject, predicate, obj in _statements(entities, relations, base):
+        yield f"{_term(subject)} {_term(predicate)} {_term(obj)} .\n"
+
+
+def _turtle(entities, relations, base: str):
+    prefixes = (("rdf", RDF), ("xsd", XSD), ("ex", base))
+    yield "".join(f"@prefix {prefix}: <{namespace}> .\n" for prefix, namespace in prefixes)
+    # Consecutive statements about one subject share a block
+    current = None
+    for subject, predicate, obj in _statements(entities, relations, base):
+        if predicate == RDF + "type":
+            predicate_text = "a"
+        else:
+            predicate_text = _term(predicate, prefixes)
+        if subject == current:
+            yield f" ;\n    {predicate_text} {_term(obj, prefixes)}"
+        else:
+            yield f"{' .' if current is not None else ''}\n{_term(subject, prefixes)} {predicate_text} {_term(obj, prefixes)}"
+            current = subject
+    if current is not None:
+        yield " .\n"
+
+
+def _jsonld_value(term):
+    if isinstance(term, tuple):
+        lexical, datatype = term
+        return {"@value": lexical} if datatype is None else {"@value": lexical, "@type": datatype}
+    return {"@id": term}
+
+
+def _jsonld(entities, relations, base: str):
+    yield json.dumps({"@context": {"ex": base, "rdf": RDF, "xsd": XSD}})[:-1] + ', "@graph": [\n'
+    # One node object per run of statements about the same subject
+    node, first = None, True
+    for subject, predicate, obj in _statements(entities, relations, base):
+        if node is None or node["@id"] != subject:
+            if node is not None:
+                yield ("" if first else ",\n") + json.dumps(node, ensure_ascii=False)
+                first = False
+            node = {"@id": subject}
+        if predicate == RDF + "type":
+            node.setdefault("@type", []).append(obj)
+        else:
+            node.setdefault(predicate, []).append(_jsonld_value(obj))
+    if node is not None:
+        yield ("" if first else ",\n") + json.dumps(node, ensure_ascii=False)
+    yield "\n]}\n"
+
+
+_WRITERS = {"ntriples": _ntriples, "turtle": _turtle, "jsonld": _jsonld}
+
+
+def iter_rdf(entities, relations, fmt: str = "turtle", base: str = DEFAULT_BASE,
+             chunk_size: int = CHUNK_SIZE):
+    """
+    Serialize iterables of entity and relation dicts as ``fmt`` (one of
+    ``FORMATS``), yielding text chunks of about ``chunk_size`` characters.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"format must be one of {tuple(FORMATS)}, got '{fmt}'")
+    parts, size = [], 0
+    for text in _WRITERS[fmt](entities, relations, base):
+        parts.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield "".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts)
+
+
+def write_rdf(out, chunks) -> int:
+    """Write text ``chunks`` to a path or text file; returns the characters written."""
+    if isinstance(out, (str, bytes)) or hasattr(out, "__fspath__"):
+        with open(out, "w", encoding="utf-8") as f:
+            return write_rdf(f, chunks)
+    written = 0
+    for chunk in chunks:
+        out.write(chunk)
+        written += len(chunk)
+    return written
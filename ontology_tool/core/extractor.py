@@ -1,13 +1,54 @@
+"""
+LLM extraction of entities and relations from unstructured text.
+
+Documents are split into overlapping chunks, and the chunks are sent to the
+model concurrently (at most ``max_concurrency`` in flight, each retried with
+exponential backoff). Per-chunk results are merged: an entity found in
+several chunks (same id, or same type and name) is kept once and relations
+are remapped onto it. Entities are then upserted onto the graph entities
+they resolve to (same type and email, URL or name; see ``resolution``).
+Similar-name matching is off by default: it would merge, say, two meetings
+whose titles differ only in the date.
+
+Chunk results are cached on disk under a hash of the model, the prompt and
+the chunk text, so re-ingesting unchanged text makes no model calls. Any
+LangChain chat model can be passed as ``llm``; ``FakeExtractionModel`` in
+``fake_llm`` runs the pipeline offline.
+"""
 try:
     from langchain_core.pydantic_v1 import BaseModel, Field
 except ImportError:
     from pydantic import BaseModel, Field
 from typing import List
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
 from .manager import OntologyManager
+from pathlib import Path
+import asyncio
+import hashlib
+import json
 import os
+import random
+import re
+
+PROMPT_TEMPLATE = """Extract knowledge graph entities and relations from the following text.
+
+            Text: {text}
+
+            {format_instructions}
+            """
+
+# Characters per chunk, and characters shared by consecutive chunks so an
+# entity or relation cut at a boundary is still seen whole in one of them.
+CHUNK_CHARS = 6000
+CHUNK_OVERLAP = 400
+MAX_CONCURRENCY = 8
+MAX_RETRIES = 3
+# Seconds before the first retry; doubled per attempt, with jitter
+RETRY_DELAY = 1.0
+
+# Preferred chunk ends, strongest first: paragraph, line, sentence, word
+_BOUNDARIES = (re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"(?<=[.!?。！？])\s*"), re.compile(r"\s"))
 
 class EntityModel(BaseModel):
     id: str = Field(description="Unique identifier for the entity")
@@ -24,42 +65,243 @@ class ExtractionResult(BaseModel):
     entities: List[EntityModel]
     relations: List[RelationModel]
 
+
+def _dump(model: BaseModel) -> dict:
+    dump = getattr(model, "model_dump", None)
+    return dump() if dump is not None else model.dict()
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> list:
+    """
+    Split ``text`` into chunks of at most ``size`` characters, each starting
+    about ``overlap`` characters before the previous one ended. Chunks end at
+    the strongest boundary (paragraph, line, sentence, word) in their second half.
+    """
+    if len(text) <= size:
+        return [text] if text.strip() else []
+    overlap = min(overlap, size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            window = text[start + size // 2:end]
+            for boundary in _BOUNDARIES:
+                cut = None
+                for cut in boundary.finditer(window):
+                    pass
+                if cut is not None:
+                    end = start + size // 2 + cut.end()
+                    break
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        # Begin the next chunk on a word boundary inside the overlap
+        next_start = end - overlap
+        space = re.compile(r"\s").search(text, next_start, end)
+        start = space.end() if space else next_start
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+class ExtractionCache:
+    """Chunk results on disk, one JSON file per content hash."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def merge_results(results) -> ExtractionResult:
+    """
+    Merge chunk results: entities with the same id, or the same type and
+    name/title, become one (properties from earlier chunks win), relations
+    are remapped onto the kept ids and deduplicated.
+    """
+    entities = {}
+    by_name = {}
+    aliases = {}
+    for result in results:
+        for ent in result.entities:
+            name = ent.properties.get("name") or ent.properties.get("title")
+            name_key = (ent.type.casefold(), " ".join(str(name).split()).casefold()) if name else None
+            kept_id = aliases.get(ent.id) or (by_name.get(name_key) if name_key else None) or ent.id
+            aliases[ent.id] = kept_id
+            kept = entities.get(kept_id)
+            if kept is None:
+                entities[kept_id] = EntityModel(id=kept_id, type=ent.type, properties=dict(ent.properties))
+            else:
+                for key, value in ent.properties.items():
+                    kept.properties.setdefault(key, value)
+            if name_key:
+                by_name.setdefault(name_key, kept_id)
+    relations = {}
+    for result in results:
+        for rel in result.relations:
+            source_id = aliases.get(rel.source_id, rel.source_id)
+            target_id = aliases.get(rel.target_id, rel.target_id)
+            key = (source_id, rel.type, target_id)
+            if key not in relations:
+                relations[key] = RelationModel(source_id=source_id, target_id=target_id,
+                                               type=rel.type, properties=dict(rel.properties))
+    return ExtractionResult(entities=list(entities.values()), relations=list(relations.values()))
+
+
 class LLMExtractor:
-    def __init__(self, manager: OntologyManager, model_name="deepseek-chat"):
-        # Using DeepSeek via OpenAI compatible interface
-        self.llm = ChatOpenAI(
-            model=model_name,
-            openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
-            openai_api_base="https://api.deepseek.com",
-            temperature=0
-        )
+    def __init__(self, manager: OntologyManager, model_name="deepseek-chat", llm=None, cache_dir=None,
+                 chunk_chars: int = CHUNK_CHARS, chunk_overlap: int = CHUNK_OVERLAP,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES,
+                 retry_delay: float = RETRY_DELAY, resolve: bool = True, fuzzy: bool = False):
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+            # Using DeepSeek via OpenAI compatible interface
+            llm = ChatOpenAI(
+                model=model_name,
+                openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
+                openai_api_base="https://api.deepseek.com",
+                temperature=0
+            )
+        else:
+            model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+        self.llm = llm
+        self.model_name = model_name
         self.manager = manager
         self.parser = PydanticOutputParser(pydantic_object=ExtractionResult)
-
-    def extract_from_text(self, text: str):
-        prompt = PromptTemplate(
-            template="""Extract knowledge graph entities and relations from the following text.
-            
-            Text: {text}
-            
-            {format_instructions}
-            """,
+        # Built once; only the text changes between calls
+        self.prompt = PromptTemplate(
+            template=PROMPT_TEMPLATE,
             input_variables=["text"],
             partial_variables={"format_instructions": self.parser.get_format_instructions()}
         )
+        self.chain = self.prompt | self.llm | self.parser
+        if cache_dir is None:
+            cache_dir = Path(manager.graph_path).parent / "extraction_cache"
+        self.cache = ExtractionCache(cache_dir) if cache_dir is not False else None
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap = chunk_overlap
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # Upsert onto existing entities (see OntologyManager.upsert_entities_bulk)
+        # rather than trusting the ids the model invents; ``fuzzy`` also
+        # matches similar names of the types resolution treats fuzzily
+        self.resolve = resolve
+        self.fuzzy = fuzzy
+        self._prompt_hash = hashlib.sha256(
+            (PROMPT_TEMPLATE + self.parser.get_format_instructions()).encode()).hexdigest()
 
-        chain = prompt | self.llm | self.parser
-        try:
-            result = chain.invoke({"text": text})
-            
-            # Save to ontology
-            for ent in result.entities:
-                self.manager.create_entity(ent.type, ent.properties, ent.id)
-            
+    def cache_key(self, chunk: str) -> str:
+        return hashlib.sha256(json.dumps([self.model_name, self._prompt_hash, chunk]).encode()).hexdigest()
+
+    async def _extract_chunk(self, chunk: str, semaphore: asyncio.Semaphore) -> ExtractionResult:
+        key = self.cache_key(chunk)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ExtractionResult(**cached)
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = await self.chain.ainvoke({"text": chunk})
+                    break
+                except Exception:
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt * (1 + random.random()))
+        if self.cache is not None:
+            self.cache.put(key, _dump(result))
+        return result
+
+    async def aextract_documents(self, texts, save: bool = True) -> list:
+        """
+        Extract every document in ``texts`` concurrently and, if ``save``,
+        write all entities and relations in one batch. Returns one merged
+        result per document; None for a document whose chunks all failed
+        (failed chunks are not cached, so a rerun retries only those).
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        documents = [chunk_text(text, self.chunk_chars, self.chunk_overlap) for text in texts]
+        tasks = [[asyncio.ensure_future(self._extract_chunk(chunk, semaphore)) for chunk in chunks]
+                 for chunks in documents]
+        results = []
+        for chunk_tasks in tasks:
+            outcomes = await asyncio.gather(*chunk_tasks, return_exceptions=True)
+            succeeded = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+            for outcome in outcomes:
+                if isinstance(outcome, BaseException):
+                    print(f"Extraction failed: {outcome}")
+            results.append(merge_results(succeeded) if succeeded or not chunk_tasks else None)
+        if save:
+            self.save([result for result in results if result is not None])
+        return results
+
+    def extract_documents(self, texts, save: bool = True) -> list:
+        """Blocking wrapper around ``aextract_documents``."""
+        return asyncio.run(self.aextract_documents(texts, save))
+
+    def save(self, results):
+        """
+        Write extraction results to the ontology: the entities, then the
+        relations (so schema checks on relations see their endpoints). With
+        ``resolve``, entities are upserted onto the ones they resolve to and
+        the results are rewritten to the resolved ids; otherwise entities
+        already stored unchanged are skipped. Existing edges are skipped, so
+        re-ingesting a document adds nothing.
+        """
+        entities = {}
+        if self.resolve:
+            items = [(result, ent) for result in results for ent in result.entities]
+            stored = self.manager.load_ontology().entities
+            # A model id naming an entity of another type is a clash, not a match: resolve by keys instead
+            written = self.manager.upsert_entities_bulk(
+                ({"id": ent.id if ent.id not in stored or stored[ent.id]["type"] == ent.type else None,
+                  "type": ent.type, "properties": ent.properties} for _, ent in items), self.fuzzy)
+            ids = {}
+            for (result, ent), entity in zip(items, written):
+                ids[id(result), ent.id] = ent.id = entity["id"]
+            for result in results:
+                for rel in result.relations:
+                    rel.source_id = ids.get((id(result), rel.source_id), rel.source_id)
+                    rel.target_id = ids.get((id(result), rel.target_id), rel.target_id)
+            graph = self.manager.load_ontology()
+        else:
+            graph = self.manager.load_ontology()
+            for result in results:
+                for ent in result.entities:
+                    stored = graph.entities.get(ent.id)
+                    if stored is None or stored["type"] != ent.type or stored["properties"] != ent.properties:
+                        entities[ent.id] = {"id": ent.id, "type": ent.type, "properties": ent.properties}
+        relations = {}
+        for result in results:
             for rel in result.relations:
-                self.manager.create_relation(rel.source_id, rel.type, rel.target_id, rel.properties)
-                
-            return result
+                key = (rel.source_id, rel.type, rel.target_id)
+                if key not in relations and not any(
+                        other_id == rel.target_id
+                        for _, _, other_id in graph.neighbors(rel.source_id, [rel.type], "outgoing")):
+                    relations[key] = {"from": rel.source_id, "rel": rel.type, "to": rel.target_id,
+                                      "properties": rel.properties}
+        self.manager.create_entities_bulk(entities.values())
+        self.manager.create_relations_bulk(relations.values())
+
+    def extract_from_text(self, text: str):
+        try:
+            return self.extract_documents([text])[0]
         except Exception as e:
             print(f"Extraction failed: {e}")
             return None
@@ -0,0 +1,80 @@
+"""
+An offline stand-in for the extraction LLM.
+
+``FakeExtractionModel`` answers extraction prompts without a network: every
+run of two or more capitalized words in the text becomes a ``Person``, and
+names that share a sentence are linked by ``knows``. Answers are
+deterministic, so the extraction pipeline can be exercised and benchmarked
+without an API key; ``latency`` and ``failure_rate`` simulate a remote model.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+_NAME = re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)+\b")
+_SENTENCE = re.compile(r"(?<=[.!?。！？])\s+|\n\s*\n")
+
+
+class FakeModelError(RuntimeError):
+    """A simulated transient failure."""
+
+
+def extract_names(text: str) -> dict:
+    """The answer the fake model gives for ``text``, as an ``ExtractionResult`` dict."""
+    entities = {}
+    relations = []
+    seen = set()
+    for sentence in _SENTENCE.split(text):
+        ids = []
+        for name in _NAME.findall(sentence):
+            name = " ".join(name.split())
+            entity_id = "pers_" + name.lower().replace(" ", "_")
+            entities.setdefault(entity_id, {"id": entity_id, "type": "Person", "properties": {"name": name}})
+            if entity_id not in ids:
+                ids.append(entity_id)
+        for source_id, target_id in zip(ids, ids[1:]):
+            if (source_id, target_id) not in seen:
+                seen.add((source_id, target_id))
+                relations.append({"source_id": source_id, "target_id": target_id, "type": "knows", "properties": {}})
+    return {"entities": list(entities.values()), "relations": relations}
+
+
+class FakeExtractionModel(BaseChatModel):
+    latency: float = 0.0
+    failure_rate: float = 0.0
+    seed: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-extraction"
+
+    def _answer(self, messages: List[BaseMessage]) -> ChatResult:
+        self.calls += 1
+        # Failures depend on the call count, not on timing, so runs repeat
+        if self.failure_rate and random.Random(f"{self.seed}:{self.calls}").random() < self.failure_rate:
+            raise FakeModelError(f"simulated failure on call {self.calls}")
+        prompt = messages[-1].content
+        # Only the text, not the format instructions after it
+        text = prompt.split("Text:", 1)[-1].split("The output should be formatted", 1)[0]
+        message = AIMessage(content=json.dumps(extract_names(text), ensure_ascii=False))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(messages)
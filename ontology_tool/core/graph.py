@@ -0,0 +1,398 @@
+"""
+In-memory ontology graph with adjacency indexes, and the log replay engine
+shared by every loader.
+
+Relations are keyed by ``(from, rel, to)`` and outgoing/incoming edges are
+indexed by entity id and relation type, so replaying ``relate``/``unrelate``
+is constant time and neighbourhood lookups and multi-hop traversals touch
+only the edges they follow instead of scanning the whole relation list.
+"""
+import json
+from collections import deque
+from pathlib import Path
+
+from .parallel import PARALLEL_MIN_BYTES, default_workers, parallel_apply_log
+from .query import compile_where, execute, index_values
+from .resolution import EntityResolver
+from .snapshot import DEFAULT_SNAPSHOT_THRESHOLD, read_log, read_snapshot, write_snapshot
+
+DIRECTIONS = ("outgoing", "incoming", "both")
+
+
+def _index_key(value):
+    """Hashable stand-in for a property value; a missing property indexes as None."""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("__json__", json.dumps(value, sort_keys=True, default=str))
+
+
+class OntologyGraph:
+    # Entity resolution index, built on demand and never snapshotted
+    resolver = None
+    # entity id -> creation sequence number, numbered on the first query that
+    # needs log order and kept by ``apply`` from then on
+    _seq = None
+
+    def __init__(self, entities: dict = None, relations: list = None):
+        self.entities = entities if entities is not None else {}
+        # (from, rel, to) -> relation
+        self.edges = {}
+        # entity id -> relation type -> other id -> relation
+        self.outgoing = {}
+        self.incoming = {}
+        # (type, property) -> value key -> {entity id, ...}
+        self.property_indexes = {}
+        for rel in relations or ():
+            self._add_relation(rel)
+
+    def add_index(self, type_name: str, prop: str):
+        """Build a hash index on ``prop`` for entities of ``type_name``."""
+        if (type_name, prop) in self.property_indexes:
+            return
+        index = self.property_indexes[(type_name, prop)] = {}
+        for entity_id, entity in self.entities.items():
+            if entity["type"] == type_name:
+                index.setdefault(_index_key(entity["properties"].get(prop)), set()).add(entity_id)
+
+    def enable_resolution(self, **options) -> EntityResolver:
+        """Build the entity resolution index; ``apply`` keeps it current from then on."""
+        if self.resolver is None:
+            self.resolver = EntityResolver.from_entities(self.entities.values(), **options)
+        return self.resolver
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("resolver", None)
+        return state
+
+    @property
+    def indexed(self) -> bool:
+        """Whether entity writes must update property indexes or the resolution index."""
+        return bool(self.property_indexes) or self.resolver is not None
+
+    def drop_index(self, type_name: str, prop: str):
+        self.property_indexes.pop((type_name, prop), None)
+
+    def set_indexes(self, specs) -> bool:
+        """Make the declared ``(type, property)`` indexes exactly ``specs``; True if anything changed."""
+        specs = set(specs)
+        changed = False
+        for spec in set(self.property_indexes) - specs:
+            self.drop_index(*spec)
+            changed = True
+        for spec in specs - set(self.property_indexes):
+            self.add_index(*spec)
+            changed = True
+        return changed
+
+    def _index_entity(self, entity: dict, props=None):
+        for (type_name, prop), index in self.property_indexes.items():
+            if type_name == entity["type"] and (props is None or prop in props):
+                index.setdefault(_index_key(entity["properties"].get(prop)), set()).add(entity["id"])
+        if self.resolver is not None:
+            self.resolver.add(entity, props)
+
+    def _unindex_entity(self, entity: dict, props=None):
+        if self.resolver is not None and props is None:
+            self.resolver.remove(entity["id"])
+        for (type_name, prop), index in self.property_indexes.items():
+            if type_name == entity["type"] and (props is None or prop in props):
+                key = _index_key(entity["properties"].get(prop))
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(entity["id"])
+                    if not ids:
+                        del index[key]
+
+    @property
+    def relations(self) -> list:
+        return list(self.edges.values())
+
+    def iter_relations(self):
+        """Iterate over live relations without copying them into a list."""
+        return iter(self.edges.values())
+
+    def _add_relation(self, rel: dict):
+        key = (rel["from"], rel["rel"], rel["to"])
+        # Re-relating an existing edge replaces its properties in place
+        self.edges[key] = rel
+        self.outgoing.setdefault(rel["from"], {}).setdefault(rel["rel"], {})[rel["to"]] = rel
+        self.incoming.setdefault(rel["to"], {}).setdefault(rel["rel"], {})[rel["from"]] = rel
+
+    def _remove_relation(self, from_id: str, rel_type: str, to_id: str):
+        if self.edges.pop((from_id, rel_type, to_id), None) is None:
+            return
+        for index, node_id, other_id in ((self.outgoing, from_id, to_id), (self.incoming, to_id, from_id)):
+            by_type = index[node_id]
+            del by_type[rel_type][other_id]
+            if not by_type[rel_type]:
+                del by_type[rel_type]
+                if not by_type:
+                    del index[node_id]
+
+    def apply(self, record: dict):
+        """Apply one log record to the graph."""
+        op = record.get("op")
+        if op == "create":
+            # Stored as a copy, so stamping the version or applying updates
+            # never writes through to the caller's record
+            entity = dict(record["entity"])
+            entity["properties"] = dict(entity.get("properties") or {})
+            previous = self.entities.get(entity["id"])
+            # Versions count writes to an entity for optimistic update/delete checks
+            entity["version"] = previous.get("version", 1) + 1 if previous else entity.get("version", 1)
+            if self.indexed:
+                if previous is not None:
+                    self._unindex_entity(previous)
+                self._index_entity(entity)
+            self.entities[entity["id"]] = entity
+            if previous is None and self._seq is not None:
+                self._seq[entity["id"]] = self._next_seq
+                self._next_seq += 1
+        elif op == "update":
+            entity = self.entities.get(record["id"])
+            if entity is not None:
+                props = record.get("properties", {})
+                if self.indexed:
+                    self._unindex_entity(entity, props)
+                entity["properties"].update(props)
+                entity["updated"] = record.get("timestamp")
+                entity["version"] = entity.get("version", 1) + 1
+                if self.indexed:
+                    self._index_entity(entity, props)
+        elif op == "delete":
+            entity = self.entities.pop(record["id"], None)
+            if entity is not None and self._seq is not None:
+                self._seq.pop(record["id"], None)
+            if entity is not None and self.indexed:
+                self._unindex_entity(entity)
+        elif op == "relate":
+            self._add_relation({
+                "from": record["from"],
+                "rel": record["rel"],
+                "to": record["to"],
+                "properties": record.get("properties", {})
+            })
+        elif op == "unrelate":
+            self._remove_relation(record["from"], record["rel"], record["to"])
+
+    def query(self, type_name: str = None, where: dict = None, **options) -> list:
+        """Matching entities; see ``query_page`` for the options."""
+        return self.query_page(type_name, where, **options)[0]
+
+    def query_page(self, type_name: str = None, where: dict = None, order_by: str = None,
+                   limit: int = None, offset: int = 0, cursor: str = None) -> tuple[list, str | None]:
+        """
+        Entities of ``type_name`` matching ``where`` (see ``query.compile_where``),
+        as ``(page, next_cursor)``. Equality and ``$in`` filters use the most
+        selective covering property index; everything else is checked per entity.
+        """
+        where = where or {}
+        clauses = compile_where(where)
+        candidates = None
+        if type_name:
+            for key, condition in where.items():
+                index = self.property_indexes.get((type_name, key))
+                values = index_values(condition) if index is not None else None
+                if values is None:
+                    continue
+                if len(values) == 1:
+                    ids = index.get(_index_key(values[0]), ())
+                else:
+                    ids = set().union(*(index.get(_index_key(v), ()) for v in values))
+                if candidates is None or len(ids) < len(candidates):
+                    candidates = ids
+
+        if candidates is not None:
+            if order_by is None and len(candidates) > 1:
+                # Postings are sets; an unordered page lists entities in log order, as a scan would
+                candidates = self._in_log_order(candidates)
+            entities = (self.entities[entity_id] for entity_id in candidates)
+        else:
+            entities = self.entities.values()
+        if type_name:
+            entities = (entity for entity in entities if entity["type"] == type_name)
+        return execute(entities, clauses, order_by, limit, offset, cursor)
+
+    def _in_log_order(self, ids) -> list:
+        """``ids`` in the order their entities were created."""
+        if self._seq is None or len(self._seq) != len(self.entities):
+            # Entities added other than through apply: number them in dict (creation) order
+            self._seq = {entity_id: seq for seq, entity_id in enumerate(self.entities)}
+            self._next_seq = len(self._seq)
+        return sorted(ids, key=self._seq.__getitem__)
+
+    def _edges(self, index: dict, entity_id: str, rel_types):
+        by_type = index.get(entity_id)
+        if not by_type:
+            return
+        if rel_types is None:
+            for rels in by_type.values():
+                yield from rels.values()
+        else:
+            for rel_type in rel_types:
+                rels = by_type.get(rel_type)
+                if rels:
+                    yield from rels.values()
+
+    def neighbors(self, entity_id: str, rel_types=None, direction: str = "outgoing"):
+        """Yield ``(relation, direction, other_id)`` for edges touching ``entity_id``."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}, got '{direction}'")
+        if direction in ("outgoing", "both"):
+            for rel in self._edges(self.outgoing, entity_id, rel_types):
+                yield rel, "outgoing", rel["to"]
+        if direction in ("incoming", "both"):
+            for rel in self._edges(self.incoming, entity_id, rel_types):
+                # A self-loop was already reported as outgoing
+                if direction == "both" and rel["from"] == entity_id:
+                    continue
+                yield rel, "incoming", rel["from"]
+
+    def related(self, entity_id: str, rel_type: str = None, direction: str = "outgoing") -> list:
+        """Related entities in the shape returned by the ``related`` command."""
+        rel_types = [rel_type] if rel_type else None
+        results = []
+        for rel, rel_dir, other_id in self.neighbors(entity_id, rel_types, direction):
+            entity = self.entities.get(other_id)
+            if entity is None:
+                continue
+            result = {"relation": rel["rel"]}
+            if direction == "both":
+                result["direction"] = rel_dir
+            result["entity"] = entity
+            results.append(result)
+        return results
+
+    def traverse(self, start_id: str, max_depth: int = None, rel_types=None,
+                 direction: str = "outgoing", strategy: str = "bfs") -> list:
+        """
+        Walk the graph from ``start_id`` breadth- or depth-first, visiting each
+        entity once. Returns one entry per reached entity with its depth and
+        the edge it was reached through.
+        """
+        if strategy not in ("bfs", "dfs"):
+            raise ValueError(f"strategy must be 'bfs' or 'dfs', got '{strategy}'")
+        if start_id not in self.entities:
+            return []
+
+        visited = {start_id}
+        frontier = deque([(start_id, 0)])
+        pop = frontier.popleft if strategy == "bfs" else frontier.pop
+        results = []
+        while frontier:
+            node_id, depth = pop()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for rel, rel_dir, other_id in self.neighbors(node_id, rel_types, direction):
+                if other_id in visited or other_id not in self.entities:
+                    continue
+                visited.add(other_id)
+                results.append({
+                    "depth": depth + 1,
+                    "parent": node_id,
+                    "relation": rel["rel"],
+                    "direction": rel_dir,
+                    "entity": self.entities[other_id],
+                })
+                frontier.append((other_id, depth + 1))
+        return results
+
+    def shortest_path(self, from_id: str, to_id: str, rel_types=None,
+                      direction: str = "outgoing", max_depth: int = None) -> list | None:
+        """
+        Fewest-hop path between two entities as a list of steps, starting with
+        ``{"entity": <from>}``; None when ``to_id`` is unreachable.
+        """
+        if from_id not in self.entities or to_id not in self.entities:
+            return None
+
+        parents = {from_id: None}
+        frontier = deque([(from_id, 0)])
+        while frontier and to_id not in parents:
+            node_id, depth = frontier.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for rel, rel_dir, other_id in self.neighbors(node_id, rel_types, direction):
+                if other_id in parents or other_id not in self.entities:
+                    continue
+                parents[other_id] = (node_id, rel["rel"], rel_dir)
+                if other_id == to_id:
+                    break
+                frontier.append((other_id, depth + 1))
+
+        if to_id not in parents:
+            return None
+        steps = []
+        node_id = to_id
+        while parents[node_id] is not None:
+            parent_id, rel_type, rel_dir = parents[node_id]
+            steps.append({"relation": rel_type, "direction": rel_dir, "entity": self.entities[node_id]})
+            node_id = parent_id
+        steps.append({"entity": self.entities[from_id]})
+        steps.reverse()
+        return steps
+
+
+def apply_log(graph: OntologyGraph, graph_path, offset: int = 0) -> tuple[int, bool]:
+    """
+    Apply the complete log lines from ``offset`` on to ``graph``, skipping
+    undecodable ones. Returns the offset just past the last complete line
+    and whether an unterminated (still being written) line followed it.
+    """
+    torn = False
+    for line, end in read_log(graph_path, offset):
+        if end is None:
+            # Applied once it is complete, on the next read
+            torn = True
+            break
+        offset = end
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        graph.apply(record)
+    return offset, torn
+
+
+def load_log(graph_path, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD,
+             indexes=None, workers: int = None) -> tuple[OntologyGraph, int]:
+    """
+    Load the graph from its snapshot and replay the log tail written after it,
+    returning the graph and the log offset it covers. The snapshot is refreshed
+    once the replayed tail exceeds ``snapshot_threshold`` bytes, or when
+    ``indexes`` (declared ``(type, property)`` pairs) differ from the ones it holds.
+
+    Tails of at least ``PARALLEL_MIN_BYTES`` are parsed in ``workers``
+    processes (default: one per available core; 1 replays sequentially).
+    """
+    graph_path = Path(graph_path)
+    if not graph_path.exists():
+        return OntologyGraph(), 0
+
+    snapshot = read_snapshot(graph_path)
+    graph, start = snapshot if snapshot else (OntologyGraph(), 0)
+    # Build declared indexes before the tail so replay maintains them
+    reindexed = indexes is not None and graph.set_indexes(indexes)
+
+    replayed = None
+    workers = workers or default_workers()
+    if workers > 1 and graph_path.stat().st_size - start >= PARALLEL_MIN_BYTES:
+        replayed = parallel_apply_log(graph, graph_path, start, workers)
+    offset, torn = replayed or apply_log(graph, graph_path, start)
+
+    # Only snapshot fully written lines; a torn tail is replayed again next time.
+    if not torn and (reindexed or offset - start > snapshot_threshold):
+        write_snapshot(graph_path, graph, offset)
+    return graph, offset
+
+
+def replay_log(graph_path, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD,
+               indexes=None, workers: int = None) -> OntologyGraph:
+    """Load the graph from its snapshot plus the log tail; see ``load_log``."""
+    return load_log(graph_path, snapshot_threshold, indexes, workers)[0]
@@ -0,0 +1,328 @@
+"""
+Point-in-time reads and per-entity history over the graph log.
+
+``HistoryIndex`` keeps a side database (``<graph>.history``) next to the log:
+
+* ``ops`` - the offset of every create/update/delete record, by entity id,
+  so an entity's history reads only its own lines;
+* ``marks`` - every ``MARK_RECORDS`` records, an offset and the latest
+  timestamp of the records before it, mapping a point in time to the log;
+* ``checkpoints`` - every ``CHECKPOINT_BYTES`` of log, the replayed graph at
+  an offset, pickled to ``<graph>.checkpoints/<offset>.pickle``.
+
+The index catches up with the log incrementally whenever it is used. A log
+that was rewritten (compaction, conversion, a segment fold) is detected as
+for snapshots, and the index is rebuilt from the state the log starts from.
+
+A read as of ``T`` sees every record up to the first one stamped later than
+``T``: the graph is taken from the nearest checkpoint before the last mark
+at or before ``T`` and only the records after it are replayed. When the log
+starts from a folded state (a segment), ``T`` must not be earlier than the
+latest timestamp in that state: the ops before it are gone, so older states
+cannot be rebuilt and ``HistoryError`` is raised instead.
+"""
+import copy
+import json
+import os
+import pickle
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .graph import OntologyGraph
+from .snapshot import fingerprint, read_log
+
+# Log bytes between checkpoints
+CHECKPOINT_BYTES = 64 << 20
+# Records between time marks; a historical read replays at most this many past its mark
+MARK_RECORDS = 1024
+ENTITY_OPS = ("create", "update", "delete")
+# Seconds a connection waits for another process's index update to commit
+BUSY_TIMEOUT = 60
+
+DDL = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS ops (
+    entity_id TEXT NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ops_entity ON ops (entity_id, offset);
+CREATE TABLE IF NOT EXISTS marks (
+    offset INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS marks_timestamp ON marks (timestamp);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    offset INTEGER PRIMARY KEY,
+    timestamp TEXT
+);
+"""
+
+
+def history_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".history")
+
+
+def checkpoint_dir(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".checkpoints")
+
+
+def remove_history(graph_path):
+    path = history_path(graph_path)
+    for suffix in ("", "-wal", "-shm"):
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
+    directory = checkpoint_dir(graph_path)
+    if directory.exists():
+        for checkpoint in directory.iterdir():
+            checkpoint.unlink(missing_ok=True)
+        directory.rmdir()
+
+
+def parse_as_of(value) -> str:
+    """
+    Normalize an ISO 8601 date or datetime (naive values are UTC) to the
+    UTC ``isoformat`` the log's timestamps use, so they compare as strings.
+    """
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            raise ValueError(f"invalid timestamp '{value}', expected ISO 8601 (e.g. 2024-05-01T12:00:00Z)")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+class HistoryError(ValueError):
+    """The requested point in time is older than the history the log still holds."""
+
+
+def _entity_id(record: dict):
+    return record["entity"]["id"] if record["op"] == "create" else record.get("id")
+
+
+def fold_history(records, entity: dict = None) -> list:
+    """
+    The versions an entity went through, from its ``records`` in log order
+    (starting from ``entity`` when the log starts after its creation). Each is
+    ``{"version", "op", "timestamp", "entity"}``; a delete has no entity.
+    Updates and deletes of an entity that did not exist changed nothing and are left out.
+    """
+    graph = OntologyGraph()
+    versions = []
+    if entity is not None:
+        graph.entities[entity["id"]] = copy.deepcopy(entity)
+        versions.append({"version": entity.get("version", 1), "op": "base",
+                         "timestamp": entity.get("updated"), "entity": entity})
+    for record in records:
+        op = record.get("op")
+        if op not in ENTITY_OPS:
+            continue
+        entity_id = _entity_id(record)
+        if op != "create" and entity_id not in graph.entities:
+            continue
+        graph.apply(record)
+        current = graph.entities.get(entity_id)
+        versions.append({"version": current["version"] if current else None, "op": op,
+                         "timestamp": record.get("timestamp"),
+                         "entity": copy.deepcopy(current) if current else None})
+    return versions
+
+
+class HistoryIndex:
+    """
+    History of the log at ``graph_path``. ``base`` returns the graph the log
+    starts from and the offset its records start at (default: an empty graph
+    and 0); ``base_entity`` looks one entity up in that state.
+    """
+
+    def __init__(self, graph_path, base=None, base_entity=None, checkpoint_bytes: int = CHECKPOINT_BYTES):
+        self.graph_path = Path(graph_path)
+        self.path = history_path(self.graph_path)
+        self.checkpoints = checkpoint_dir(self.graph_path)
+        self.base = base or (lambda: (OntologyGraph(), 0))
+        self.base_entity = base_entity or (lambda entity_id: None)
+        self.checkpoint_bytes = checkpoint_bytes
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript(DDL)
+        return conn
+
+    def _checkpoint_path(self, offset: int) -> Path:
+        return self.checkpoints / f"{offset}.pickle"
+
+    def _write_checkpoint(self, conn, graph: OntologyGraph, offset: int, timestamp: str):
+        self.checkpoints.mkdir(parents=True, exist_ok=True)
+        path = self._checkpoint_path(offset)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        conn.execute("INSERT OR REPLACE INTO checkpoints (offset, timestamp) VALUES (?, ?)", (offset, timestamp))
+
+    def _nearest_checkpoint(self, conn, limit: int) -> tuple[OntologyGraph, int]:
+        """The latest readable checkpoint at or before ``limit``, else the base state."""
+        for (offset,) in conn.execute("SELECT offset FROM checkpoints WHERE offset <= ? ORDER BY offset DESC",
+                                      (limit,)):
+            try:
+                with open(self._checkpoint_path(offset), "rb") as f:
+                    return pickle.load(f), offset
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+                continue
+        return self.base()
+
+    def _reset(self, conn) -> dict:
+        conn.execute("DELETE FROM ops")
+        conn.execute("DELETE FROM marks")
+        conn.execute("DELETE FROM checkpoints")
+        conn.execute("DELETE FROM meta")
+        if self.checkpoints.exists():
+            for checkpoint in self.checkpoints.iterdir():
+                checkpoint.unlink(missing_ok=True)
+        graph, start = self.base()
+        # The folded state is as of its latest write at the earliest
+        base_time = max((value for entity in graph.entities.values()
+                         for value in (entity.get("created"), entity.get("updated")) if isinstance(value, str)),
+                        default="")
+        return {"offset": start, "base_offset": start, "base_time": base_time, "checkpoint": start,
+                "max_timestamp": "", "records": 0}
+
+    def _valid(self, meta: dict, st) -> bool:
+        if not meta or "base_time" not in meta or meta.get("ino") != st.st_ino or st.st_size < meta["offset"]:
+            return False
+        with open(self.graph_path, "rb") as f:
+            return fingerprint(f, meta["offset"]) == meta.get("sample")
+
+    def sync(self, conn) -> dict:
+        """Index the records appended since the last sync; returns the index metadata."""
+        try:
+            st = os.stat(self.graph_path)
+        except FileNotFoundError:
+            return {"offset": 0, "base_offset": 0}
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        if self._valid(meta, st) and meta["offset"] == st.st_size:
+            return meta
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have synced while we waited for the write lock
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            if not self._valid(meta, st):
+                meta = self._reset(conn)
+            offset, checkpoint = meta["offset"], meta["checkpoint"]
+            max_timestamp, records = meta["max_timestamp"], meta["records"]
+
+            graph = None
+            if st.st_size - checkpoint >= self.checkpoint_bytes:
+                # A checkpoint falls in the new records: rebuild the state up to them
+                graph, start = self._nearest_checkpoint(conn, checkpoint)
+                _replay(graph, self.graph_path, start, offset)
+
+            ops, marks = [], []
+            for line, end in read_log(self.graph_path, offset):
+                if end is None:
+                    break
+                start, offset = offset, end
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                timestamp = record.get("timestamp")
+                if isinstance(timestamp, str) and timestamp > max_timestamp:
+                    max_timestamp = timestamp
+                if record.get("op") in ENTITY_OPS:
+                    ops.append((_entity_id(record), start))
+                records += 1
+                if records % MARK_RECORDS == 0:
+                    marks.append((end, max_timestamp))
+                if graph is not None:
+                    graph.apply(record)
+                    if end - checkpoint >= self.checkpoint_bytes:
+                        self._write_checkpoint(conn, graph, end, max_timestamp)
+                        marks.append((end, max_timestamp))
+                        checkpoint = end
+            conn.executemany("INSERT INTO ops (entity_id, offset) VALUES (?, ?)", ops)
+            conn.executemany("INSERT OR REPLACE INTO marks (offset, timestamp) VALUES (?, ?)", marks)
+            with open(self.graph_path, "rb") as f:
+                sample = fingerprint(f, offset)
+            meta.update(offset=offset, checkpoint=checkpoint, max_timestamp=max_timestamp, records=records,
+                        ino=st.st_ino, sample=sample)
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?) "
+                             "ON CONFLICT (key) DO UPDATE SET value = excluded.value", meta.items())
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return meta
+
+    def as_of(self, timestamp) -> OntologyGraph:
+        """The graph as it was at ``timestamp`` (see ``parse_as_of``)."""
+        timestamp = parse_as_of(timestamp)
+        conn = self._connect()
+        try:
+            meta = self.sync(conn)
+            if timestamp < meta.get("base_time", ""):
+                raise HistoryError(f"{self.graph_path}: the log starts from a state folded at "
+                                   f"{meta['base_time']}, so earlier states can no longer be rebuilt")
+            row = conn.execute("SELECT max(offset) FROM marks WHERE timestamp <= ?", (timestamp,)).fetchone()
+            mark = row[0] if row[0] is not None else meta["base_offset"]
+            graph, start = self._nearest_checkpoint(conn, mark)
+        finally:
+            conn.close()
+        if not self.graph_path.exists():
+            return graph
+        # Every record before the mark is no later than it
+        _replay(graph, self.graph_path, start, mark)
+        _replay(graph, self.graph_path, mark, until=timestamp)
+        return graph
+
+    def history(self, entity_id: str) -> list:
+        """Versions of ``entity_id``, oldest first (see ``fold_history``)."""
+        conn = self._connect()
+        try:
+            self.sync(conn)
+            offsets = [offset for (offset,) in conn.execute(
+                "SELECT offset FROM ops WHERE entity_id = ? ORDER BY offset", (entity_id,))]
+        finally:
+            conn.close()
+        records = []
+        with open(self.graph_path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return fold_history(records, self.base_entity(entity_id))
+
+
+def _replay(graph: OntologyGraph, graph_path, start: int, end: int = None, until: str = None):
+    """
+    Apply the complete log lines in ``[start, end)`` to ``graph``, stopping
+    before the first record stamped later than ``until``.
+    """
+    if end is not None and end <= start:
+        return
+    for line, line_end in read_log(graph_path, start):
+        if line_end is None or (end is not None and line_end > end):
+            break
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict):
+            continue
+        timestamp = record.get("timestamp")
+        if until is not None and isinstance(timestamp, str) and timestamp > until:
+            break
+        graph.apply(record)
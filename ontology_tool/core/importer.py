@@ -1,44 +1,329 @@
 import pandas as pd
+import numpy as np
+import codecs
 import json
+import os
+import time
+from datetime import datetime, timezone
 from .manager import OntologyManager
 
+# Rows parsed, serialized and appended per step; bounds memory for any file size.
+CHUNK_ROWS = 100_000
+# JSON records written per append when streaming JSON/NDJSON input.
+JSON_BATCH_SIZE = 10_000
+# Bytes read from a JSON input per step.
+JSON_READ_SIZE = 1 << 20
+# pandas' default float parser can be off by an ulp; imported values must match the file exactly
+FLOAT_PRECISION = "round_trip"
+
 class DataImporter:
     def __init__(self, manager: OntologyManager):
         self.manager = manager
 
-    def import_csv(self, file, entity_type: str, id_col: str = None, mapping: dict = None):
+    def import_csv(self, file, entity_type: str, id_col: str = None, mapping: dict = None,
+                   chunksize: int = CHUNK_ROWS, resolve: bool = False):
         """
         Import entities from CSV.
         mapping: dict {csv_col: property_name}
+        The file is read in chunks; each chunk is mapped, NaN-filtered and
+        serialized column-wise and appended to the log in one write.
+        With resolve, rows are upserted onto the entities they resolve to
+        (see OntologyManager.upsert_entities_bulk) instead of always created.
+        When the manager enforces the schema, rows go through
+        create_entities_bulk so each one is validated like any other write.
         """
-        df = pd.read_csv(file)
+        usecols = None
+        if mapping:
+            wanted = set(mapping) | ({id_col} if id_col else set())
+            usecols = lambda col: col in wanted
+        dtype = {id_col: str} if id_col else None
+
         count = 0
-        for _, row in df.iterrows():
-            props = {}
-            # Apply mapping if provided, else use all columns
-            if mapping:
-                for csv_col, prop_name in mapping.items():
-                    if csv_col in row:
-                        props[prop_name] = row[csv_col]
-            else:
-                props = row.to_dict()
-            
-            # Clean NaN values
-            props = {k: v for k, v in props.items() if pd.notna(v)}
-            
-            entity_id = str(row[id_col]) if id_col and id_col in row else None
-            self.manager.create_entity(entity_type, props, entity_id)
-            count += 1
+        for chunk in pd.read_csv(file, chunksize=chunksize, usecols=usecols, dtype=dtype,
+                                 float_precision=FLOAT_PRECISION):
+            props = _json_rows(_apply_mapping(chunk, mapping))
+            if resolve or self.manager.enforce_schema:
+                given = chunk[id_col] if id_col and id_col in chunk.columns else [None] * len(chunk)
+                items = ({"type": entity_type, "properties": json.loads(p), "id": v if isinstance(v, str) else None}
+                         for v, p in zip(given, props))
+                if resolve:
+                    self.manager.upsert_entities_bulk(items)
+                else:
+                    self.manager.create_entities_bulk(items)
+                count += len(chunk)
+                continue
+            timestamp = json.dumps(datetime.now(timezone.utc).isoformat())
+            ids = self._entity_ids(chunk, entity_type, id_col)
+            type_json = json.dumps(entity_type)
+            self.manager.append_lines(
+                f'{{"op": "create", "entity": {{"id": {eid}, "type": {type_json}, "properties": {p}, '
+                f'"created": {timestamp}, "updated": {timestamp}}}, "timestamp": {timestamp}}}'
+                for eid, p in zip(ids, props)
+            )
+            count += len(chunk)
         return count
 
-    def import_json(self, file, entity_type: str):
-        data = json.load(file)
+    def import_relations_csv(self, file, from_col: str, to_col: str, rel_type: str = None,
+                             rel_col: str = None, mapping: dict = None, chunksize: int = CHUNK_ROWS):
+        """
+        Import relations from an edge-list CSV.
+        Each row links from_col -> to_col with the fixed rel_type or the
+        relation named in rel_col; other columns (or those in mapping) become
+        relation properties. Rows missing an endpoint or relation are skipped.
+        When the manager enforces the schema, rows go through
+        create_relations_bulk so each edge is validated.
+        """
+        if (rel_type is None) == (rel_col is None):
+            raise ValueError("exactly one of rel_type and rel_col is required")
+        key_cols = [from_col, to_col] + ([rel_col] if rel_col else [])
+        usecols = None
+        if mapping:
+            wanted = set(mapping) | set(key_cols)
+            usecols = lambda col: col in wanted
+
         count = 0
-        if isinstance(data, list):
-            for item in data:
-                self.manager.create_entity(entity_type, item)
-                count += 1
-        elif isinstance(data, dict):
-             self.manager.create_entity(entity_type, data)
-             count += 1
+        for chunk in pd.read_csv(file, chunksize=chunksize, usecols=usecols,
+                                 dtype={col: str for col in key_cols}, float_precision=FLOAT_PRECISION):
+            chunk = chunk.dropna(subset=key_cols)
+            timestamp = json.dumps(datetime.now(timezone.utc).isoformat())
+            if mapping:
+                props = _apply_mapping(chunk, mapping)
+            else:
+                props = chunk.drop(columns=key_cols)
+            if self.manager.enforce_schema:
+                self.manager.create_relations_bulk(
+                    {"from": src, "rel": rel, "to": dst, "properties": json.loads(p)}
+                    for src, rel, dst, p in zip(chunk[from_col], chunk[rel_col] if rel_col else [rel_type] * len(chunk),
+                                                chunk[to_col], _json_rows(props)))
+                count += len(chunk)
+                continue
+            rels = chunk[rel_col].map(json.dumps) if rel_col else [json.dumps(rel_type)] * len(chunk)
+            self.manager.append_lines(
+                f'{{"op": "relate", "from": {src}, "rel": {rel}, "to": {dst}, "properties": {p}, '
+                f'"timestamp": {timestamp}}}'
+                for src, rel, dst, p in zip(chunk[from_col].map(json.dumps), rels,
+                                            chunk[to_col].map(json.dumps), _json_rows(props))
+            )
+            count += len(chunk)
         return count
+
+    def _entity_ids(self, chunk: pd.DataFrame, entity_type: str, id_col: str = None) -> list:
+        """JSON-encoded ids: from id_col where present, generated otherwise."""
+        n = len(chunk)
+        # Same shape as OntologyManager._generate_id, drawn for the whole chunk at once
+        prefix = entity_type.lower()[:4]
+        suffixes = os.urandom(4 * n).hex()
+        generated = [json.dumps(f"{prefix}_{suffixes[8 * i:8 * i + 8]}") for i in range(n)]
+        if not id_col or id_col not in chunk.columns:
+            return generated
+        given = chunk[id_col]
+        return [json.dumps(v) if isinstance(v, str) else g for v, g in zip(given, generated)]
+
+    def import_json(self, file, entity_type: str, **options):
+        return self.import_json_stream(file, entity_type, **options)["imported"]
+
+    def import_json_stream(self, file, entity_type: str, batch_size: int = JSON_BATCH_SIZE,
+                           id_field: str = None, progress=None, resolve: bool = False) -> dict:
+        """
+        Import entities from a JSON array, a single JSON object or NDJSON,
+        parsing incrementally so memory stays bounded by one batch.
+        Each object becomes an entity (its id taken from id_field if given);
+        non-object values and undecodable NDJSON lines are rejected.
+        progress(stats) is called after every written batch.
+        With resolve, objects are upserted as in import_csv.
+        Returns {"imported", "rejected", "seconds", "records_per_sec"}.
+        """
+        stats = {"imported": 0, "rejected": 0, "seconds": 0.0, "records_per_sec": 0.0}
+        started = time.perf_counter()
+        batch = []
+
+        def flush():
+            if resolve:
+                self.manager.upsert_entities_bulk(batch)
+            else:
+                self.manager.create_entities_bulk(batch)
+            stats["imported"] += len(batch)
+            batch.clear()
+            stats["seconds"] = time.perf_counter() - started
+            stats["records_per_sec"] = stats["imported"] / stats["seconds"] if stats["seconds"] else 0.0
+            if progress:
+                progress(dict(stats))
+
+        for item in iter_json_values(file):
+            if not isinstance(item, dict):
+                stats["rejected"] += 1
+                continue
+            entity_id = item.get(id_field) if id_field else None
+            batch.append({"type": entity_type, "properties": item,
+                          "id": str(entity_id) if entity_id is not None else None})
+            if len(batch) >= batch_size:
+                flush()
+        if batch or not stats["imported"]:
+            flush()
+        return stats
+
+
+class _Rejected:
+    """Marker yielded for an NDJSON line that failed to decode."""
+
+
+def _read_text(file, size: int):
+    """Yield text chunks from a text or binary file object, decoding UTF-8 incrementally."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+
+
+def iter_json_values(file, read_size: int = JSON_READ_SIZE):
+    """
+    Incrementally yield the elements of a top-level JSON array, or each value
+    of a whitespace/newline separated stream (NDJSON, or a single object).
+    In stream mode an undecodable line yields a _Rejected marker and parsing
+    resumes at the next line; a malformed array raises ValueError.
+    """
+    decoder = json.JSONDecoder()
+    chunks = _read_text(file, read_size)
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = None
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+        else:
+            buf = buf[pos:] + chunk
+            pos = 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip(" \t\r\n")
+    if pos < len(buf):
+        in_array = buf[pos] == "["
+        if in_array:
+            pos += 1
+
+    while True:
+        skip(" \t\r\n," if in_array else " \t\r\n")
+        if pos >= len(buf):
+            if in_array:
+                raise ValueError("unterminated JSON array")
+            return
+        if in_array and buf[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # An error on the buffer's last line may just be a value cut off by
+            # the chunk boundary (strings can't hold raw newlines): read more
+            if not eof and buf.find("\n", e.pos) < 0:
+                fill()
+                continue
+            if in_array:
+                raise ValueError(f"malformed JSON array element: {e}")
+            newline = buf.find("\n", pos)
+            while newline < 0 and not eof:
+                fill()
+                newline = buf.find("\n", pos)
+            pos = len(buf) if newline < 0 else newline + 1
+            yield _Rejected()
+            continue
+        # A value touching the end of the buffer may be cut short; a number
+        # stops at a cut-off exponent ("1.5e") without reaching the end
+        cut = end == len(buf) or (isinstance(value, (int, float)) and buf[end] not in " \t\r\n,]")
+        if cut and not eof:
+            fill()
+            continue
+        pos = end
+        yield value
+
+
+def _apply_mapping(df: pd.DataFrame, mapping: dict = None) -> pd.DataFrame:
+    """Select and rename the mapped columns; all columns when there is no mapping."""
+    if not mapping:
+        return df
+    cols = [col for col in mapping if col in df.columns]
+    df = df[cols].rename(columns=mapping)
+    # Several columns mapped onto one property: the last one wins
+    return df.loc[:, ~df.columns.duplicated(keep="last")]
+
+
+def _json_lines(frame: pd.DataFrame) -> list:
+    """
+    One JSON object per row of a frame without nulls. pandas writes floats
+    with at most 15 significant digits, so float columns are written with
+    repr instead (the shortest string that parses back to the same double);
+    runs of other columns still go through to_json in one call.
+    """
+    n = len(frame)
+    kinds = [dtype.kind == "f" for dtype in frame.dtypes]
+    if not any(kinds):
+        return frame.to_json(orient="records", lines=True, force_ascii=True).split("\n")[:n]
+
+    fields = []
+    start = 0
+    for end in range(1, len(kinds) + 1):
+        if end < len(kinds) and kinds[end] == kinds[start]:
+            continue
+        if kinds[start]:
+            for name in frame.columns[start:end]:
+                values = frame[name].to_numpy(dtype=float)
+                key = json.dumps(str(name)) + ":"
+                text = list(map(key.__add__, map(float.__repr__, values.tolist())))
+                # Written as null, as to_json does
+                for i in np.flatnonzero(~np.isfinite(values)).tolist():
+                    text[i] = key + "null"
+                fields.append(text)
+        else:
+            lines = frame.iloc[:, start:end].to_json(orient="records", lines=True, force_ascii=True)
+            fields.append([line[1:-1] for line in lines.split("\n")[:n]])
+        start = end
+    return ["{" + ",".join(parts) + "}" for parts in zip(*fields)]
+
+
+def _json_rows(df: pd.DataFrame) -> list:
+    """
+    Serialize each row as a JSON object without its null cells.
+    Rows are grouped by null pattern and each group is serialized by pandas
+    in one call, so no Python code runs per cell.
+    """
+    n = len(df)
+    if n == 0:
+        return []
+    if df.shape[1] == 0:
+        return ["{}"] * n
+
+    def to_lines(frame):
+        return _json_lines(frame)
+
+    mask = df.notna().to_numpy()
+    if mask.all():
+        return to_lines(df)
+
+    patterns, inverse = np.unique(np.packbits(mask, axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(patterns)))[:-1]
+    out = np.empty(n, dtype=object)
+    for rows in np.split(order, bounds):
+        cols = np.flatnonzero(mask[rows[0]])
+        if len(cols) == 0:
+            out[rows] = "{}"
+        else:
+            out[rows] = to_lines(df.iloc[rows, cols])
+    return out.tolist()
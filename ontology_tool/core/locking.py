@@ -0,0 +1,38 @@
+"""
+Advisory file locking for the graph log.
+
+Writers hold the lock while opening and appending to the log, so a
+compaction that rewrites and atomically replaces the file never loses
+records appended concurrently.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+
+def lock_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".lock")
+
+
+@contextmanager
+def graph_lock(graph_path, shared: bool = False, blocking: bool = True):
+    """
+    Hold an exclusive (or shared) advisory lock on the graph log. Without
+    ``blocking``, raise BlockingIOError instead of waiting for it.
+    """
+    path = lock_path(graph_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(f.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
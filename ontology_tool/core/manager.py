@@ -3,62 +3,305 @@ Core ontology logic shared across the tool.
 Wraps the original script logic into a reusable class structure.
 """
 import json
+import os
 import uuid
 import yaml
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timezone
+from .graph import OntologyGraph, apply_log
+from .locking import graph_lock
+from .schema import SchemaViolation, compile_schema, index_specs, load_schema
+from .search import DEFAULT_LIMIT as SEARCH_LIMIT
+from .snapshot import DEFAULT_SNAPSHOT_THRESHOLD, fingerprint
+from .storage import StorageBackend, WriteView, open_storage
+from .writer import check_version, committer, write_locked
+
+# Records buffered by batch() before an intermediate flush, to bound memory.
+BATCH_FLUSH_RECORDS = 10000
+
+
+class _Pending:
+    """
+    The writes of the current batch, kept for schema checks: a check made
+    inside batch() sees them over the resident graph, which doesn't have
+    the buffered records yet.
+    """
+
+    def __init__(self):
+        # id -> entity as the batch leaves it, or None once deleted
+        self.entities = {}
+        # (outgoing, incoming): id -> rel -> {other id: True}
+        self.added = ({}, {})
+        self.removed = ({}, {})
+
+    def apply(self, record: dict, graph: OntologyGraph):
+        op = record.get("op")
+        if op == "create":
+            entity = record["entity"]
+            self.entities[entity["id"]] = dict(entity, properties=dict(entity.get("properties") or {}))
+        elif op == "update":
+            entity = self.entity(record["id"], graph)
+            if entity is not None:
+                self.entities[record["id"]] = dict(
+                    entity, properties={**entity["properties"], **record.get("properties", {})})
+        elif op == "delete":
+            self.entities[record["id"]] = None
+        elif op in ("relate", "unrelate"):
+            add, drop = (self.added, self.removed) if op == "relate" else (self.removed, self.added)
+            for side, (near, far) in enumerate(((record["from"], record["to"]), (record["to"], record["from"]))):
+                add[side].setdefault(near, {}).setdefault(record["rel"], {})[far] = True
+                drop[side].get(near, {}).get(record["rel"], {}).pop(far, None)
+
+    def entity(self, entity_id: str, graph: OntologyGraph) -> dict | None:
+        if entity_id in self.entities:
+            return self.entities[entity_id]
+        return graph.entities.get(entity_id)
+
+    def adjacency(self, entity_id: str, direction: str, graph: OntologyGraph) -> dict:
+        side = 0 if direction == "outgoing" else 1
+        base = getattr(graph, direction).get(entity_id) or {}
+        added, removed = self.added[side].get(entity_id), self.removed[side].get(entity_id)
+        if not added and not removed:
+            return base
+        merged = {rel: dict(others) for rel, others in base.items()}
+        for rel, others in (removed or {}).items():
+            for other in others:
+                merged.get(rel, {}).pop(other, None)
+        for rel, others in (added or {}).items():
+            merged.setdefault(rel, {}).update(others)
+        return merged
+
+    def view(self, graph: OntologyGraph) -> WriteView:
+        return WriteView(lambda entity_id: self.entity(entity_id, graph),
+                         lambda entity_id, direction: self.adjacency(entity_id, direction, graph))
+
 
 class OntologyManager:
-    def __init__(self, graph_path="memory/ontology/graph.jsonl", schema_path="memory/ontology/schema.yaml"):
+    def __init__(self, graph_path="memory/ontology/graph.jsonl", schema_path="memory/ontology/schema.yaml",
+                 snapshot_threshold=DEFAULT_SNAPSHOT_THRESHOLD, indexes=None, resident=False,
+                 enforce_schema=False, durable=False, storage: StorageBackend = None, compact_memory=False):
         self.graph_path = Path(graph_path)
         self.schema_path = Path(schema_path)
+        self.snapshot_threshold = snapshot_threshold
+        # (type, property) pairs to index; defaults to the schema's `indexes` declaration
+        self.indexes = indexes
+        # Reject writes that violate the schema; checks run against the resident
+        # graph, so enforcement keeps the graph in memory between calls
+        self.enforce_schema = enforce_schema
+        # Keep a live graph in memory between calls (graph server, web UI): each
+        # access applies only the records appended since the last one
+        self.resident = resident or enforce_schema
+        # fsync every append; concurrent appenders in this process share one fsync
+        self.durable = durable
+        # Load into the compact in-memory model (see compact_graph.py); reads
+        # return the same dicts, but write-time checks need the dict graph
+        if compact_memory and enforce_schema:
+            raise ValueError("compact_memory cannot be combined with enforce_schema")
+        self.compact_memory = compact_memory
+        self._writer = committer(self.graph_path)
+        # Backend holding the base state; by default whichever the graph uses (see storage.py)
+        self._storage = storage
+        self._graph = None
+        # (inode, offset) of the log covered by the resident graph, and the
+        # log sample at that offset, used to detect a rewritten log
+        self._stamp = None
+        self._sample = None
+        # Records buffered inside batch(); None when not batching
+        self._batch = None
+        # What the batch has written so far, for enforcement checks (see _Pending)
+        self._pending = None
+        # Readers holding the resident graph as it stands (see pinned())
+        self._pins = 0
+        # Keep an entity resolution index on the resident graph (set by the first upsert)
+        self._resolve = False
         self.graph_path.parent.mkdir(parents=True, exist_ok=True)
         if not self.graph_path.exists():
             self.graph_path.touch()
 
     def _append_op(self, record: dict):
-        with open(self.graph_path, "a") as f:
-            f.write(json.dumps(record) + "\n")
+        if self._batch is not None:
+            if self.enforce_schema:
+                if self._pending is None:
+                    self._pending = _Pending()
+                self._pending.apply(record, self.load_ontology())
+            self._batch.append(record)
+            if len(self._batch) >= BATCH_FLUSH_RECORDS:
+                records, self._batch = self._batch, []
+                self._append_ops(records)
+            return
+        self._append_ops([record], fsync=self.durable)
+
+    def _serialize(self, records: list) -> bytes:
+        return "".join(json.dumps(record) + "\n" for record in records).encode()
+
+    def _applier(self, records: list):
+        def apply(ino, start, end):
+            # Nobody else wrote since the resident graph was loaded: apply in place
+            if self._graph is not None and self._stamp == (ino, start):
+                for record in records:
+                    self._graph.apply(record)
+                self._set_stamp(ino, end)
+        return apply
+
+    def _append_ops(self, records: list, fsync: bool = True):
+        """Append many records as one group-committed write with (optionally) one fsync."""
+        self._writer.append(self._serialize(records), fsync, self._applier(records))
+
+    def _append_checked(self, records: list, entity_id: str, expected_version: int) -> dict | None:
+        """
+        Append ``records`` only if the entity exists and is at ``expected_version``
+        (else VersionConflict), holding the lock from the read through the write.
+        Returns the entity as it was just before the write, or None if it is gone.
+        """
+        if self._batch is not None:
+            raise ValueError("version-checked writes cannot be buffered in batch()")
+        with graph_lock(self.graph_path):
+            entity = self.get_entity(entity_id)
+            if entity is None:
+                return None
+            check_version(entity, expected_version)
+            ino, start, end = write_locked(self.graph_path, self._serialize(records), self.durable)
+            self._applier(records)(ino, start, end)
+        return entity
+
+    def append_lines(self, lines, fsync: bool = True) -> int:
+        """
+        Append pre-serialized records (one JSON object per string, no newline)
+        in one write. A resident graph picks them up on its next reload.
+        """
+        data = "".join(line + "\n" for line in lines).encode()
+        if not data:
+            return 0
+        self._writer.append(data, fsync)
+        return len(data)
+
+    @contextmanager
+    def batch(self):
+        """
+        Buffer every append made inside the block and write them together.
+        Reads inside the block don't see the buffered records yet.
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+        finally:
+            records, self._batch, self._pending = self._batch, None, None
+            if records:
+                self._append_ops(records)
+
+    @property
+    def storage(self) -> StorageBackend:
+        return self._storage or open_storage(self.graph_path, self.snapshot_threshold)
+
+    def _index_specs(self):
+        if self.indexes is not None:
+            return self.indexes
+        return index_specs(load_schema(self.schema_path))
+
+    def _set_stamp(self, ino: int, offset: int):
+        self._stamp = (ino, offset)
+        try:
+            with open(self.graph_path, "rb") as f:
+                self._sample = fingerprint(f, offset)
+        except OSError:
+            # Never matches, so the next access reloads
+            self._sample = None
+
+    def _refresh(self) -> bool:
+        """
+        Bring the resident graph up to date by applying records appended since
+        it was loaded. False when the log was replaced, truncated or rewritten
+        (compaction, clear_graph) and needs a full reload instead.
+        """
+        try:
+            st = os.stat(self.graph_path)
+        except FileNotFoundError:
+            return False
+        ino, offset = self._stamp
+        if st.st_ino != ino or st.st_size < offset:
+            return False
+        if st.st_size == offset:
+            return True
+        with open(self.graph_path, "rb") as f:
+            if fingerprint(f, offset) != self._sample:
+                return False
+        offset, _ = apply_log(self._graph, self.graph_path, offset)
+        self._set_stamp(ino, offset)
+        return True
+
+    def stale(self) -> bool:
+        """Whether the resident graph is missing (or behind) the log; one ``stat``."""
+        if self._graph is None or self._stamp is None:
+            return True
+        try:
+            st = os.stat(self.graph_path)
+        except FileNotFoundError:
+            return True
+        return (st.st_ino, st.st_size) != self._stamp
+
+    @contextmanager
+    def pinned(self):
+        """
+        Read the resident graph as it stands, without applying records other
+        processes append meanwhile, so that several threads can read it at
+        once. The caller keeps this manager's writes out until the block ends.
+        """
+        self._pins += 1
+        try:
+            yield self
+        finally:
+            self._pins -= 1
 
     def _generate_id(self, type_name: str) -> str:
         prefix = type_name.lower()[:4]
         suffix = uuid.uuid4().hex[:8]
         return f"{prefix}_{suffix}"
 
-    def load_graph(self) -> tuple[dict, list]:
-        entities = {}
-        relations = []
-        if not self.graph_path.exists():
-            return entities, relations
-        
-        with open(self.graph_path) as f:
-            for line in f:
-                line = line.strip()
-                if not line: continue
-                try:
-                    record = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-                    
-                op = record.get("op")
-                if op == "create":
-                    entity = record["entity"]
-                    entities[entity["id"]] = entity
-                elif op == "update":
-                    eid = record["id"]
-                    if eid in entities:
-                        entities[eid]["properties"].update(record.get("properties", {}))
-                        entities[eid]["updated"] = record.get("timestamp")
-                elif op == "delete":
-                    entities.pop(record["id"], None)
-                elif op == "relate":
-                    relations.append({
-                        "from": record["from"],
-                        "rel": record["rel"],
-                        "to": record["to"],
-                        "properties": record.get("properties", {})
-                    })
-        return entities, relations
+    def load_graph(self, as_of=None) -> tuple[dict, list]:
+        graph = self.load_ontology(as_of)
+        return graph.entities, graph.relations
+
+    def load_ontology(self, as_of=None) -> OntologyGraph:
+        """
+        The current graph or, with ``as_of`` (an ISO 8601 timestamp or a
+        datetime), the graph as it was then; see ``StorageBackend.as_of``.
+        """
+        if as_of is not None:
+            return self.storage.as_of(as_of, self._index_specs())
+        if self._graph is not None and (self._pins or self._refresh()):
+            return self._graph
+        # Shares the replay engine (and snapshot file) with scripts/ontology.py
+        indexes = self._index_specs()
+        try:
+            ino = os.stat(self.graph_path).st_ino
+        except FileNotFoundError:
+            ino = None
+        if self.compact_memory:
+            graph, offset = self.storage.load_compact(indexes)
+        else:
+            graph, offset = self.storage.load(self.snapshot_threshold, indexes)
+        self._graph = None
+        if self._resolve:
+            graph.enable_resolution()
+        if self.resident and ino is not None:
+            self._graph = graph
+            self._set_stamp(ino, offset)
+        return graph
+
+    def _validate_write(self, check):
+        """Raise SchemaViolation if ``check(schema, graph)`` reports errors (enforcement mode only)."""
+        if not self.enforce_schema:
+            return
+        graph = self.load_ontology()
+        if self._pending is not None:
+            graph = self._pending.view(graph)
+        errors = check(compile_schema(self.schema_path), graph)
+        if errors:
+            raise SchemaViolation(errors)
 
     def create_entity(self, type_name: str, properties: dict, entity_id: str = None) -> dict:
         entity_id = entity_id or self._generate_id(type_name)
@@ -70,9 +313,150 @@ class OntologyManager:
             "created": timestamp,
             "updated": timestamp
         }
+        self._validate_write(lambda schema, graph: schema.check_entity(entity, graph))
         self._append_op({"op": "create", "entity": entity, "timestamp": timestamp})
         return entity
 
+    def create_entities_bulk(self, items) -> list:
+        """Create entities from dicts with ``type``, ``properties`` and an optional ``id``."""
+        with self.batch():
+            return [self.create_entity(item["type"], item.get("properties", {}), item.get("id"))
+                    for item in items]
+
+    def create_relations_bulk(self, items) -> list:
+        """Create relations from dicts with ``from``, ``rel``, ``to`` and optional ``properties``."""
+        with self.batch():
+            return [self.create_relation(item["from"], item["rel"], item["to"], item.get("properties", {}))
+                    for item in items]
+
+    def upsert_entity(self, type_name: str, properties: dict, entity_id: str = None, fuzzy: bool = True) -> dict:
+        """
+        Create an entity, or merge ``properties`` into the existing one it
+        resolves to: the entity with ``entity_id`` (which must be of
+        ``type_name``, else ValueError), else one of the same type with the
+        same email, URL or name, else, with ``fuzzy`` and for the types
+        matched fuzzily, one with a similar name (see resolution.py).
+        """
+        return self.upsert_entities_bulk([{"type": type_name, "properties": properties, "id": entity_id}], fuzzy)[0]
+
+    def upsert_entities_bulk(self, items, fuzzy: bool = True) -> list:
+        """
+        ``upsert_entity`` for dicts with ``type``, ``properties`` and an
+        optional ``id``. Items resolving to each other are merged into one
+        entity; only properties that change are written to existing ones.
+        Returns the resulting entity for every item, in order.
+
+        The first upsert makes the manager resident, so the resolution index
+        is built once and then kept current as records are appended.
+        """
+        if self.compact_memory:
+            raise ValueError("upserts need the dict graph; not available with compact_memory")
+        self.resident = self._resolve = True
+        graph = self.load_ontology()
+        resolver = graph.enable_resolution()
+        creates, updates, results = {}, {}, []
+        try:
+            for item in items:
+                type_name, props, entity_id = item["type"], item.get("properties", {}), item.get("id")
+                if entity_id is None or (entity_id not in graph.entities and entity_id not in creates):
+                    match = resolver.resolve(type_name, props, fuzzy)
+                    entity_id = match if match is not None else entity_id or self._generate_id(type_name)
+                existing = creates.get(entity_id) or graph.entities.get(entity_id)
+                if existing is not None and existing["type"] != type_name:
+                    raise ValueError(f"entity '{entity_id}' has type {existing['type']}, not {type_name}")
+                if entity_id in creates:
+                    pending = creates[entity_id]
+                    pending["properties"].update(props)
+                elif entity_id in graph.entities:
+                    stored = graph.entities[entity_id]
+                    changed = updates.setdefault(entity_id, {})
+                    changed.update((k, v) for k, v in props.items()
+                                   if k not in stored["properties"] or stored["properties"][k] != v)
+                    pending = dict(stored, properties={**stored["properties"], **changed})
+                else:
+                    pending = creates[entity_id] = {"id": entity_id, "type": type_name, "properties": dict(props)}
+                # Later items resolve onto this one before it is written
+                resolver.add(pending)
+                results.append(entity_id)
+        finally:
+            # Put the index back as the graph stands; written records are indexed as they are applied
+            for entity_id in creates:
+                resolver.remove(entity_id)
+            for entity_id in updates:
+                resolver.add(graph.entities[entity_id])
+        with self.batch():
+            written = {entity["id"]: self.create_entity(entity["type"], entity["properties"], entity["id"])
+                       for entity in creates.values()}
+            for entity_id, props in updates.items():
+                entity = graph.entities[entity_id]
+                if props:
+                    self._validate_write(lambda schema, g: schema.check_update(entity, props, g))
+                    timestamp = datetime.now(timezone.utc).isoformat()
+                    self._append_op({"op": "update", "id": entity_id, "properties": props, "timestamp": timestamp})
+                    entity = dict(entity, properties={**entity["properties"], **props}, updated=timestamp,
+                                  version=entity.get("version", 1) + 1)
+                written[entity_id] = entity
+        return [written[entity_id] for entity_id in results]
+
+    def get_entity(self, entity_id: str, as_of=None) -> dict | None:
+        if as_of is not None:
+            return self.load_ontology(as_of).entities.get(entity_id)
+        if self.resident:
+            return self.load_ontology().entities.get(entity_id)
+        return self.storage.get_entity(entity_id)
+
+    def iter_state(self):
+        """
+        Live entities and relations as two iterators, for streaming exports:
+        the resident graph when there is one, else straight from storage.
+        """
+        if self.resident:
+            graph = self.load_ontology()
+            return graph.entities.values(), graph.iter_relations()
+        return self.storage.iter_state()
+
+    def list_entities(self, type_name: str = None, as_of=None) -> list:
+        entities = self.load_ontology(as_of).entities
+        if type_name:
+            return [e for e in entities.values() if e["type"] == type_name]
+        return list(entities.values())
+
+    def update_entity(self, entity_id: str, properties: dict, expected_version: int = None) -> dict | None:
+        """
+        Merge ``properties`` into an entity. With ``expected_version`` the
+        update is applied only if the entity is still at that version,
+        otherwise VersionConflict is raised.
+        """
+        entity = self.get_entity(entity_id)
+        if entity is None:
+            return None
+        self._validate_write(lambda schema, graph: schema.check_update(entity, properties, graph))
+        timestamp = datetime.now(timezone.utc).isoformat()
+        record = {"op": "update", "id": entity_id, "properties": properties, "timestamp": timestamp}
+        if expected_version is not None:
+            entity = self._append_checked([record], entity_id, expected_version)
+            if entity is None:
+                return None
+        else:
+            self._append_op(record)
+        if self.resident:
+            # Applied to the resident graph, or picked up by the reload on next access
+            return self.get_entity(entity_id)
+        entity["properties"].update(properties)
+        entity["updated"] = timestamp
+        entity["version"] = entity.get("version", 1) + 1
+        return entity
+
+    def delete_entity(self, entity_id: str, expected_version: int = None) -> bool:
+        if self.get_entity(entity_id) is None:
+            return False
+        timestamp = datetime.now(timezone.utc).isoformat()
+        record = {"op": "delete", "id": entity_id, "timestamp": timestamp}
+        if expected_version is None:
+            self._append_op(record)
+            return True
+        return self._append_checked([record], entity_id, expected_version) is not None
+
     def create_relation(self, from_id: str, rel_type: str, to_id: str, properties: dict = {}):
         timestamp = datetime.now(timezone.utc).isoformat()
         record = {
@@ -83,9 +467,41 @@ class OntologyManager:
             "properties": properties,
             "timestamp": timestamp
         }
+        self._validate_write(lambda schema, graph: schema.check_relation(record, graph))
         self._append_op(record)
         return record
 
+    def query_entities(self, type_name: str = None, where: dict = None, **options) -> list:
+        return self.query_page(type_name, where, **options)[0]
+
+    def query_page(self, type_name: str = None, where: dict = None, order_by: str = None,
+                   limit: int = None, offset: int = 0, cursor: str = None, as_of=None):
+        if self.resident or as_of is not None:
+            return self.load_ontology(as_of).query_page(type_name, where, order_by, limit, offset, cursor)
+        return self.storage.query_page(type_name, where, order_by, limit, offset, cursor, self._index_specs())
+
+    def get_related(self, entity_id: str, rel_type: str = None, direction: str = "outgoing",
+                    as_of=None) -> list:
+        if self.resident or as_of is not None:
+            return self.load_ontology(as_of).related(entity_id, rel_type, direction)
+        return self.storage.related(entity_id, rel_type, direction)
+
+    def search(self, query: str, type_name: str = None, limit: int = SEARCH_LIMIT) -> list:
+        """Entities whose text properties match ``query``, BM25-ranked, as ``{"score", "entity"}``."""
+        return self.storage.search(query, type_name, limit)
+
+    def history(self, entity_id: str) -> list:
+        """Every version of an entity, oldest first; see ``history.fold_history``."""
+        return self.storage.history(entity_id)
+
+    def traverse(self, entity_id: str, max_depth: int = None, rel_types=None,
+                 direction: str = "outgoing", strategy: str = "bfs") -> list:
+        return self.load_ontology().traverse(entity_id, max_depth, rel_types, direction, strategy)
+
+    def shortest_path(self, from_id: str, to_id: str, rel_types=None,
+                      direction: str = "outgoing", max_depth: int = None):
+        return self.load_ontology().shortest_path(from_id, to_id, rel_types, direction, max_depth)
+
     def get_stats(self):
         entities, relations = self.load_graph()
         return {
@@ -95,7 +511,13 @@ class OntologyManager:
             "relation_types": list(set(r["rel"] for r in relations))
         }
 
+    def validate(self) -> list:
+        return compile_schema(self.schema_path).validate(self.load_ontology())
+
+    def compact(self, archive_days: int = None) -> dict:
+        """Fold the log into the storage backend's compacted form; see storage.py."""
+        return self.storage.compact(archive_days)
+
     def clear_graph(self):
-        if self.graph_path.exists():
-            self.graph_path.unlink()
-            self.graph_path.touch()
+        self._graph = self._stamp = self._sample = None
+        self.storage.clear()
@@ -0,0 +1,265 @@
+"""
+Parallel replay of large log tails.
+
+The log is split into byte ranges on line boundaries and each range is parsed
+in a worker process, which also folds its records per entity and per edge
+into a short list of reduced operations:
+
+- any run of ``update``s becomes one update carrying the merged properties,
+  the last timestamp and the number of writes it stands for;
+- whatever precedes the last ``delete`` of an entity is dropped;
+- a ``create`` absorbs the updates after it, and its version is kept either
+  as a number or, when it depends on the entity existing before the range,
+  as an offset from that earlier version;
+- consecutive ``relate``s of one edge become the first of them carrying the
+  last one's properties, and repeated ``unrelate``s the first of them (edges
+  are not folded further: which edges of a node are live at each point
+  decides the order of its adjacency lists).
+
+The reduced operations keep the log position of the record that decides each
+one's place in insertion order. The main process applies them range by range,
+in log order, through ``OntologyGraph.apply``, so entities, versions, edges,
+their ordering and property indexes come out exactly as in sequential replay.
+"""
+import gc
+import json
+import os
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Tails smaller than this are replayed sequentially; below it, starting the
+# pool and shipping results back costs more than parsing saves.
+PARALLEL_MIN_BYTES = 64 << 20
+# Ranges per worker, so a slow range does not leave the other workers idle.
+RANGES_PER_WORKER = 4
+
+
+@contextmanager
+def gc_paused():
+    """
+    Suspend the cyclic garbage collector: loading allocates millions of
+    containers and none of them are garbage, so collections only rescan them.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def default_workers() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def split_ranges(graph_path, start: int, end: int, count: int) -> list[tuple[int, int]]:
+    """Split ``[start, end)`` into at most ``count`` byte ranges that begin and end on line boundaries."""
+    bounds = [start]
+    with open(graph_path, "rb") as f:
+        for i in range(1, count):
+            pos = start + (end - start) * i // count
+            if pos <= bounds[-1]:
+                continue
+            # Finish the line the split point falls in
+            f.seek(pos - 1)
+            f.readline()
+            pos = f.tell()
+            if pos >= end:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _complete_end(graph_path, offset: int) -> tuple[int, bool]:
+    """Offset just past the last complete line at or after ``offset``, and whether a torn line follows it."""
+    with open(graph_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = size
+        while pos > offset:
+            step = min(1 << 16, pos - offset)
+            f.seek(pos - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                end = pos - step + newline + 1
+                return end, end < size
+            pos -= step
+    return offset, size > offset
+
+
+def reduce_range(graph_path, start: int, end: int) -> list:
+    """
+    Parse the log lines in ``[start, end)`` and fold them into reduced
+    operations, ordered by the log position that places each one.
+    """
+    # entity id -> [kind, entity or merged properties, timestamp, delta, version, position, delete position]
+    # where kind is "update" (only updates so far), "absent", "known" (version
+    # is absolute) or "relative" (created here; version depends on whether it existed before)
+    entities = {}
+    # (from, rel, to) -> its last reduced operation
+    edges = {}
+    reduced = []
+    # One object per distinct string, so pickling the result back writes
+    # (and the main process rebuilds) repeated keys and values only once
+    strings = {}
+    share = strings.setdefault
+
+    def shared(d: dict) -> dict:
+        return {share(k, k): share(v, v) if v.__class__ is str else v for k, v in d.items()}
+
+    with open(graph_path, "rb") as f, gc_paused():
+        f.seek(start)
+        pos = 0
+        remaining = end - start
+        while remaining > 0:
+            line = f.readline(remaining)
+            if not line:
+                break
+            remaining -= len(line)
+            pos += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            op = record.get("op")
+            if op == "create":
+                entity = shared(record["entity"])
+                entity["properties"] = shared(entity["properties"])
+                state = entities.get(entity["id"])
+                if state is None or state[0] == "absent":
+                    version = entity.get("version", 1)
+                    if state is None:
+                        entities[entity["id"]] = ["relative", entity, None, 1, version, pos, None]
+                    else:
+                        state[:2], state[4:6] = ("known", entity), (version, pos)
+                elif state[0] == "update":
+                    state[:2], state[3:6] = ("relative", entity), (state[3] + 1, entity.get("version", 1), pos)
+                else:
+                    state[1] = entity
+                    state[4] += 1
+                    if state[0] == "relative":
+                        state[3] += 1
+            elif op == "update":
+                entity_id = record["id"]
+                props = shared(record.get("properties", {}))
+                state = entities.get(entity_id)
+                if state is None:
+                    entities[entity_id] = ["update", props, record.get("timestamp"), 1, None, pos, None]
+                elif state[0] == "update":
+                    state[1].update(props)
+                    state[2] = record.get("timestamp")
+                    state[3] += 1
+                elif state[0] != "absent":
+                    state[1]["properties"].update(props)
+                    state[1]["updated"] = record.get("timestamp")
+                    state[4] += 1
+                    if state[0] == "relative":
+                        state[3] += 1
+            elif op == "delete":
+                state = entities.get(record["id"])
+                if state is None:
+                    entities[record["id"]] = ["absent", None, None, None, None, None, pos]
+                else:
+                    state[0], state[1], state[6] = "absent", None, pos
+            elif op == "relate":
+                key = (record["from"], record["rel"], record["to"])
+                rel = {"from": share(key[0], key[0]), "rel": share(key[1], key[1]), "to": share(key[2], key[2]),
+                       "properties": shared(record.get("properties", {}))}
+                last = edges.get(key)
+                if last is not None and last[1] == "relate":
+                    # Re-relating a live edge only replaces its properties
+                    last[2] = rel
+                else:
+                    edges[key] = last = [pos, "relate", rel]
+                    reduced.append(last)
+            elif op == "unrelate":
+                key = (record["from"], record["rel"], record["to"])
+                last = edges.get(key)
+                if last is None or last[1] == "relate":
+                    edges[key] = last = [pos, "unrelate", key]
+                    reduced.append(last)
+
+    for entity_id, (kind, value, timestamp, delta, version, position, deleted) in entities.items():
+        if deleted is not None:
+            reduced.append((deleted, "delete", entity_id))
+        if kind == "update":
+            reduced.append((position, "update", entity_id, value, timestamp, delta))
+        elif kind != "absent":
+            reduced.append((position, "create", value, delta if kind == "relative" else None, version))
+    reduced.sort(key=lambda op: op[0])
+    return reduced
+
+
+def apply_reduced(graph, reduced: list):
+    """
+    Apply the output of ``reduce_range`` to ``graph``. Creates and edge
+    changes, the bulk of a log, go straight into the graph's structures
+    (what ``OntologyGraph.apply`` does for them); the rest goes through ``apply``.
+    """
+    apply = graph.apply
+    entities = graph.entities
+    indexed = graph.indexed
+    for op in reduced:
+        kind = op[1]
+        if kind == "create":
+            _, _, entity, delta, version = op
+            previous = entities.get(entity["id"])
+            if previous is not None:
+                if delta is not None:
+                    version = previous.get("version", 1) + delta
+                if indexed:
+                    graph._unindex_entity(previous)
+            entity["version"] = version
+            if indexed:
+                graph._index_entity(entity)
+            entities[entity["id"]] = entity
+        elif kind == "relate":
+            graph._add_relation(op[2])
+        elif kind == "unrelate":
+            graph._remove_relation(*op[2])
+        elif kind == "update":
+            _, _, entity_id, props, timestamp, count = op
+            apply({"op": "update", "id": entity_id, "properties": props, "timestamp": timestamp})
+            entity = entities.get(entity_id)
+            if entity is not None:
+                entity["version"] += count - 1
+        elif kind == "delete":
+            apply({"op": "delete", "id": op[2]})
+
+
+def parallel_apply_log(graph, graph_path, offset: int = 0, workers: int = None) -> tuple[int, bool] | None:
+    """
+    Like ``graph.apply_log``, but parses the complete lines after ``offset``
+    in ``workers`` processes (default: one per available core). Returns None,
+    with ``graph`` untouched, when no process pool can be started.
+    """
+    workers = workers or default_workers()
+    end, torn = _complete_end(graph_path, offset)
+    ranges = split_ranges(graph_path, offset, end, workers * RANGES_PER_WORKER)
+    first = None
+    try:
+        # Results are unpickled on the pool's result thread while this one
+        # applies earlier ranges; neither needs collections
+        with gc_paused(), ProcessPoolExecutor(min(workers, len(ranges))) as pool:
+            futures = [pool.submit(reduce_range, graph_path, lo, hi) for lo, hi in ranges]
+            results = iter(futures)
+            # Nothing is applied until the first range is back, so a pool that
+            # cannot start leaves the graph as it was
+            first = next(results).result()
+            apply_reduced(graph, first)
+            for future in results:
+                apply_reduced(graph, future.result())
+    except (OSError, BrokenProcessPool):
+        if first is None:
+            return None
+        raise
+    return end, torn
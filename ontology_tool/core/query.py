@@ -0,0 +1,189 @@
+"""
+Entity query language: filter operators, ordering and pagination.
+
+A ``where`` clause maps a property to either a literal (equality, as before)
+or an operator object such as ``{"$gt": 3}``, ``{"$in": ["open", "blocked"]}``,
+``{"$prefix": "Q3"}`` or ``{"$exists": true}``. Results are streamed: without
+ordering the scan stops once ``offset + limit`` matches are found, and with
+ordering only the top ``offset + limit`` entities are kept in a heap.
+"""
+import base64
+import heapq
+import json
+from itertools import islice
+
+# Entity fields usable in order_by; any other name is looked up in properties.
+META_FIELDS = ("id", "type", "created", "updated")
+
+_MISSING = object()
+
+
+class QueryError(ValueError):
+    """A malformed where clause or cursor."""
+
+
+def _compare(op):
+    def test(value, operand):
+        if value is _MISSING or value is None:
+            return False
+        try:
+            return op(value, operand)
+        except TypeError:
+            return False
+    return test
+
+
+OPERATORS = {
+    "$eq": lambda value, operand: (None if value is _MISSING else value) == operand,
+    "$ne": lambda value, operand: (None if value is _MISSING else value) != operand,
+    "$gt": _compare(lambda a, b: a > b),
+    "$gte": _compare(lambda a, b: a >= b),
+    "$lt": _compare(lambda a, b: a < b),
+    "$lte": _compare(lambda a, b: a <= b),
+    "$in": lambda value, operand: (None if value is _MISSING else value) in operand,
+    "$prefix": lambda value, operand: isinstance(value, str) and value.startswith(operand),
+    "$exists": lambda value, operand: (value is not _MISSING) == bool(operand),
+}
+
+
+def _is_operator(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(k.startswith("$") for k in condition)
+
+
+def conditions(where: dict):
+    """Yield ``(property, operator name, operand)`` for a where clause; a literal is ``$eq``."""
+    for prop, condition in (where or {}).items():
+        if not _is_operator(condition):
+            yield prop, "$eq", condition
+            continue
+        for name, operand in condition.items():
+            yield prop, name, operand
+
+
+def compile_where(where: dict) -> list:
+    """Compile a where clause into ``[(property, operator, operand), ...]``."""
+    if where is not None and not isinstance(where, dict):
+        raise QueryError(f"where must be an object, got {type(where).__name__}")
+    clauses = []
+    for prop, name, operand in conditions(where):
+        if name not in OPERATORS:
+            raise QueryError(f"unknown query operator '{name}' on '{prop}'")
+        if name == "$in" and not isinstance(operand, (list, tuple)):
+            raise QueryError(f"'$in' on '{prop}' expects a list")
+        clauses.append((prop, OPERATORS[name], operand))
+    return clauses
+
+
+def index_values(condition):
+    """Values to look up in a hash index for ``condition``, or None if it needs a scan."""
+    if not _is_operator(condition):
+        return [condition]
+    if len(condition) == 1:
+        (name, operand), = condition.items()
+        if name == "$eq":
+            return [operand]
+        if name == "$in":
+            return list(operand)
+    return None
+
+
+def matches(entity: dict, clauses: list) -> bool:
+    properties = entity["properties"]
+    for prop, op, operand in clauses:
+        if not op(properties.get(prop, _MISSING), operand):
+            return False
+    return True
+
+
+class _Descending:
+    """Inverts ordering so one ascending heap serves both sort directions."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _rank(value):
+    # Mixed-type columns sort numbers, then strings, then everything else
+    if isinstance(value, (int, float)):
+        return 0, value
+    if isinstance(value, str):
+        return 1, value
+    return 2, json.dumps(value, sort_keys=True, default=str)
+
+
+def _field_getter(field: str):
+    if field in META_FIELDS:
+        return lambda entity: entity.get(field)
+    return lambda entity: entity["properties"].get(field)
+
+
+def _build_key(missing: bool, ranked, entity_id: str, descending: bool) -> tuple:
+    # Missing values sort last in either direction; ties break on id
+    return (missing, _Descending(ranked) if descending else ranked, entity_id)
+
+
+def sort_key(order_by: str):
+    """Key function for ``order_by`` (``field`` or ``-field`` for descending)."""
+    descending = order_by.startswith("-")
+    getter = _field_getter(order_by.lstrip("-"))
+
+    def key(entity):
+        value = getter(entity)
+        missing = value is None
+        return _build_key(missing, (0, 0) if missing else _rank(value), entity["id"], descending)
+    return key
+
+
+def encode_cursor(order_by: str, entity: dict) -> str:
+    key = sort_key(order_by)(entity)
+    ranked = key[1].value if isinstance(key[1], _Descending) else key[1]
+    payload = json.dumps([order_by, key[0], list(ranked), key[2]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple:
+    try:
+        cursor_order, missing, ranked, entity_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        ranked = tuple(ranked)
+    except (ValueError, TypeError):
+        raise QueryError("invalid query cursor")
+    if cursor_order != order_by:
+        raise QueryError(f"cursor was issued for order_by '{cursor_order}', not '{order_by}'")
+    return _build_key(missing, ranked, entity_id, order_by.startswith("-"))
+
+
+def execute(entities, clauses: list, order_by: str = None, limit: int = None,
+            offset: int = 0, cursor: str = None) -> tuple[list, str | None]:
+    """
+    Filter an iterable of entities and return ``(page, next_cursor)``.
+    ``next_cursor`` is set when ordering with a limit and more results may follow.
+    """
+    offset = offset or 0
+    if offset < 0 or (limit is not None and limit < 0):
+        raise QueryError("limit and offset must not be negative")
+    matched = (entity for entity in entities if matches(entity, clauses))
+
+    if order_by is None:
+        if cursor is not None:
+            raise QueryError("cursor pagination requires order_by")
+        stop = None if limit is None else offset + limit
+        return list(islice(matched, offset, stop)), None
+
+    key = sort_key(order_by)
+    if cursor is not None:
+        after = decode_cursor(cursor, order_by)
+        matched = (entity for entity in matched if after < key(entity))
+    if limit is None:
+        page = sorted(matched, key=key)[offset:]
+        return page, None
+
+    page = heapq.nsmallest(offset + limit, matched, key=key)[offset:]
+    next_cursor = encode_cursor(order_by, page[-1]) if page and len(page) == limit else None
+    return page, next_cursor
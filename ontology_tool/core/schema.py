@@ -0,0 +1,367 @@
+"""
+Loading, compilation and validation of ``schema.yaml``.
+
+The schema is compiled into one validator per entity type and one rule per
+relation type, covering typed properties (``string``, ``number``,
+``datetime``, ``enum(...)``, ``ref(Type|Other)``, ``[]`` lists, ``?``
+nullable), required and forbidden properties, relation endpoint types,
+cardinality and ``acyclic`` relations. Parsed and compiled schemas are
+cached per path and reused until the file's mtime changes.
+"""
+import re
+from datetime import date, datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+_cache = {}
+_compiled = {}
+
+# Top-level keys that are neither entity nor relation types
+RESERVED_KEYS = {"types", "relations", "constraints", "indexes"}
+RELATION_KEYS = {"from_types", "to_types", "cardinality", "acyclic"}
+# Any entity type satisfies ref(Entity)
+ANY_TYPE = "Entity"
+
+
+def load_schema(schema_path) -> dict:
+    """Parsed schema, or an empty dict when the file does not exist."""
+    schema_path = Path(schema_path)
+    try:
+        mtime = schema_path.stat().st_mtime_ns
+    except OSError:
+        return {}
+    cached = _cache.get(schema_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    import yaml
+    with open(schema_path) as f:
+        schema = yaml.safe_load(f) or {}
+    _cache[schema_path] = (mtime, schema)
+    return schema
+
+
+def index_specs(schema: dict) -> list:
+    """Declared property indexes as ``(type, property)`` pairs, from ``indexes: [Type.prop, ...]``."""
+    specs = []
+    for spec in schema.get("indexes") or ():
+        type_name, _, prop = str(spec).partition(".")
+        if not type_name or not prop:
+            raise ValueError(f"index must be declared as Type.property, got '{spec}'")
+        specs.append((type_name, prop))
+    return specs
+
+
+def _is_datetime(value) -> bool:
+    if not isinstance(value, str):
+        return False
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_date(value) -> bool:
+    if not isinstance(value, str):
+        return False
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return _is_datetime(value)
+    return True
+
+
+def _is_url(value) -> bool:
+    if not isinstance(value, str):
+        return False
+    parsed = urlparse(value)
+    return bool(parsed.scheme and parsed.netloc)
+
+
+SCALAR_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "object": lambda v: isinstance(v, dict),
+    "datetime": _is_datetime,
+    "date": _is_date,
+    "url": _is_url,
+}
+
+_PROPERTY_TYPE = re.compile(
+    r"^(?:enum\((?P<enum>[^)]*)\)|ref\((?P<ref>[^)]*)\)|(?P<scalar>\w+))(?P<list>\[\])?(?P<nullable>\?)?$"
+)
+
+
+class PropertySpec:
+    """Compiled check for one declared property, e.g. ``ref(Person)[]?``."""
+    __slots__ = ("spec", "nullable", "is_list", "enum", "ref_types", "scalar", "check_scalar")
+
+    def __init__(self, spec: str):
+        self.spec = spec = str(spec).strip()
+        match = _PROPERTY_TYPE.match(spec)
+        self.nullable = bool(match and match["nullable"])
+        self.is_list = bool(match and match["list"])
+        self.enum = self.ref_types = self.scalar = self.check_scalar = None
+        if match is None:
+            return
+        if match["enum"] is not None:
+            self.enum = frozenset(v.strip() for v in match["enum"].split(",") if v.strip())
+        elif match["ref"] is not None:
+            self.ref_types = frozenset(t.strip() for t in match["ref"].split("|") if t.strip())
+        else:
+            self.scalar = match["scalar"]
+            # Unknown scalar names are accepted without a value check
+            self.check_scalar = SCALAR_CHECKS.get(self.scalar)
+
+    def check(self, value, entities: dict) -> str | None:
+        """Error message for ``value``, or None when it conforms."""
+        if value is None:
+            return None if self.nullable else "must not be null"
+        if self.is_list:
+            if not isinstance(value, list):
+                return f"must be a list ({self.spec})"
+            for item in value:
+                error = self._check_one(item, entities)
+                if error:
+                    return error
+            return None
+        return self._check_one(value, entities)
+
+    def _check_one(self, value, entities: dict) -> str | None:
+        if self.enum is not None:
+            if value not in self.enum:
+                return f"must be one of {sorted(self.enum)}, got '{value}'"
+        elif self.ref_types is not None:
+            if not isinstance(value, str):
+                return f"must be an entity id ({self.spec}), got {type(value).__name__}"
+            target = entities.get(value)
+            if target is None:
+                return f"references missing entity '{value}'"
+            if ANY_TYPE not in self.ref_types and target["type"] not in self.ref_types:
+                return f"must reference {'|'.join(sorted(self.ref_types))}, got {target['type']} '{value}'"
+        elif self.check_scalar is not None and not self.check_scalar(value):
+            return f"must be {self.scalar}, got {type(value).__name__} '{value}'"
+        return None
+
+
+class TypeValidator:
+    """Required, forbidden and typed-property checks for one entity type."""
+
+    def __init__(self, name: str, definition: dict):
+        self.name = name
+        self.required = list(definition.get("required") or ())
+        self.forbidden = list(definition.get("forbidden_properties") or ())
+        self.properties = {prop: PropertySpec(spec)
+                           for prop, spec in (definition.get("properties") or {}).items()}
+        # Legacy `<field>_enum: [...]` lists
+        self.legacy_enums = {key[:-len("_enum")]: list(allowed) for key, allowed in definition.items()
+                             if key.endswith("_enum") and isinstance(allowed, list)}
+
+    def check(self, entity: dict, entities: dict, errors: list):
+        entity_id = entity["id"]
+        properties = entity["properties"]
+        for prop in self.required:
+            if prop not in properties:
+                errors.append(f"{entity_id}: missing required property '{prop}'")
+        for prop in self.forbidden:
+            if prop in properties:
+                errors.append(f"{entity_id}: contains forbidden property '{prop}'")
+        for prop, value in properties.items():
+            spec = self.properties.get(prop)
+            if spec is not None:
+                error = spec.check(value, entities)
+                if error:
+                    errors.append(f"{entity_id}: '{prop}' {error}")
+        for field, allowed in self.legacy_enums.items():
+            value = properties.get(field)
+            if value and value not in allowed:
+                errors.append(f"{entity_id}: '{field}' must be one of {allowed}, got '{value}'")
+
+
+class RelationRule:
+    """Endpoint types, cardinality, acyclicity and property checks for one relation type."""
+
+    def __init__(self, name: str, definition: dict):
+        self.name = name
+        self.from_types = frozenset(definition["from_types"]) if definition.get("from_types") else None
+        self.to_types = frozenset(definition["to_types"]) if definition.get("to_types") else None
+        self.cardinality = definition.get("cardinality", "many_to_many")
+        # one_to_many: a target has at most one source; many_to_one: a source at most one target
+        self.single_source = self.cardinality in ("one_to_one", "one_to_many")
+        self.single_target = self.cardinality in ("one_to_one", "many_to_one")
+        self.acyclic = bool(definition.get("acyclic"))
+        self.properties = {prop: PropertySpec(spec)
+                           for prop, spec in (definition.get("properties") or {}).items()}
+
+    def check_edge(self, rel: dict, entities: dict, errors: list):
+        label = f"{rel['from']} -[{self.name}]-> {rel['to']}"
+        for end, types in (("from", self.from_types), ("to", self.to_types)):
+            entity = entities.get(rel[end])
+            if entity is None:
+                errors.append(f"{label}: {'source' if end == 'from' else 'target'} entity not found")
+            elif types is not None and entity["type"] not in types:
+                errors.append(f"{label}: {'source' if end == 'from' else 'target'} type "
+                              f"'{entity['type']}' must be one of {sorted(types)}")
+        for prop, value in (rel.get("properties") or {}).items():
+            spec = self.properties.get(prop)
+            if spec is not None:
+                error = spec.check(value, entities)
+                if error:
+                    errors.append(f"{label}: '{prop}' {error}")
+
+
+def reaches(outgoing: dict, start_id: str, target_id: str, rel_type: str) -> bool:
+    """Whether ``target_id`` is reachable from ``start_id`` along ``rel_type`` edges."""
+    seen = {start_id}
+    stack = [start_id]
+    while stack:
+        node_id = stack.pop()
+        if node_id == target_id:
+            return True
+        for next_id in outgoing.get(node_id, {}).get(rel_type, ()):
+            if next_id not in seen:
+                seen.add(next_id)
+                stack.append(next_id)
+    return False
+
+
+def find_cycle(outgoing: dict, rel_type: str) -> list | None:
+    """One cycle (as a list of ids, first repeated last) along ``rel_type`` edges, or None."""
+    WHITE, GREY, BLACK = 0, 1, 2
+    color = {}
+    for root, by_type in outgoing.items():
+        if color.get(root, WHITE) != WHITE or rel_type not in by_type:
+            continue
+        # Iterative DFS; the stack holds (node, iterator over its successors)
+        path = [root]
+        stack = [iter(by_type[rel_type])]
+        color[root] = GREY
+        while stack:
+            next_id = next(stack[-1], None)
+            if next_id is None:
+                color[path.pop()] = BLACK
+                stack.pop()
+                continue
+            state = color.get(next_id, WHITE)
+            if state == GREY:
+                return path[path.index(next_id):] + [next_id]
+            if state == WHITE:
+                color[next_id] = GREY
+                path.append(next_id)
+                stack.append(iter(outgoing.get(next_id, {}).get(rel_type, ())))
+    return None
+
+
+class SchemaViolation(ValueError):
+    """A write rejected by schema enforcement; ``errors`` lists every violation."""
+
+    def __init__(self, errors: list):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+class CompiledSchema:
+    def __init__(self, schema: dict):
+        self.types = {}
+        self.relations = {}
+        definitions = {k: v for k, v in schema.items() if k not in RESERVED_KEYS}
+        # Also accept explicit `types:` / `relations:` sections
+        definitions.update(schema.get("types") or {})
+        definitions.update(schema.get("relations") or {})
+        for name, definition in definitions.items():
+            if not isinstance(definition, dict):
+                continue
+            if RELATION_KEYS & definition.keys():
+                self.relations[name] = RelationRule(name, definition)
+            else:
+                self.types[name] = TypeValidator(name, definition)
+
+    def check_entity(self, entity: dict, graph) -> list:
+        """Violations of one entity about to be written, checked against ``graph``."""
+        errors = []
+        validator = self.types.get(entity["type"])
+        if validator is not None:
+            validator.check(entity, graph.entities, errors)
+        return errors
+
+    def check_update(self, entity: dict, properties: dict, graph) -> list:
+        """Violations of ``entity`` once ``properties`` are merged into it."""
+        merged = dict(entity, properties={**entity["properties"], **properties})
+        return self.check_entity(merged, graph)
+
+    def check_relation(self, rel: dict, graph) -> list:
+        """
+        Violations of one edge about to be added: endpoint types, properties,
+        cardinality against the existing adjacency, and whether it would
+        close a cycle in an acyclic relation. Only touches the endpoints'
+        neighbourhoods, never the whole graph.
+        """
+        errors = []
+        rule = self.relations.get(rel["rel"])
+        if rule is None:
+            return errors
+        rule.check_edge(rel, graph.entities, errors)
+
+        from_id, to_id = rel["from"], rel["to"]
+        label = f"{from_id} -[{rule.name}]-> {to_id}"
+        if rule.single_target:
+            others = [t for t in graph.outgoing.get(from_id, {}).get(rule.name, ()) if t != to_id]
+            if others:
+                errors.append(f"{label}: {rule.cardinality} relation already links {from_id} to '{others[0]}'")
+        if rule.single_source:
+            others = [f for f in graph.incoming.get(to_id, {}).get(rule.name, ()) if f != from_id]
+            if others:
+                errors.append(f"{label}: {rule.cardinality} relation already links '{others[0]}' to {to_id}")
+        if rule.acyclic and reaches(graph.outgoing, to_id, from_id, rule.name):
+            errors.append(f"{label}: would create a cycle in acyclic relation '{rule.name}'")
+        return errors
+
+    def validate(self, graph) -> list:
+        """All schema violations in an OntologyGraph, in one pass over entities and edges."""
+        errors = []
+        entities = graph.entities
+        types = self.types
+        for entity in entities.values():
+            validator = types.get(entity["type"])
+            if validator is not None:
+                validator.check(entity, entities, errors)
+
+        relations = self.relations
+        for (_, rel_type, _), rel in graph.edges.items():
+            rule = relations.get(rel_type)
+            if rule is not None:
+                rule.check_edge(rel, entities, errors)
+
+        for index, end, attr in ((graph.outgoing, "source", "single_target"),
+                                 (graph.incoming, "target", "single_source")):
+            for node_id, by_type in index.items():
+                for rel_type, others in by_type.items():
+                    rule = relations.get(rel_type)
+                    if rule is not None and getattr(rule, attr) and len(others) > 1:
+                        errors.append(f"{node_id}: {rule.cardinality} relation '{rel_type}' allows one "
+                                      f"{'target' if end == 'source' else 'source'} per {end}, "
+                                      f"found {len(others)}")
+
+        for rule in relations.values():
+            if rule.acyclic:
+                cycle = find_cycle(graph.outgoing, rule.name)
+                if cycle:
+                    errors.append(f"acyclic relation '{rule.name}' has a cycle: {' -> '.join(cycle)}")
+        return errors
+
+
+def compile_schema(schema_path) -> CompiledSchema:
+    """Compiled schema for ``schema_path``, recompiled only when the file changes."""
+    schema_path = Path(schema_path)
+    try:
+        mtime = schema_path.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    cached = _compiled.get(schema_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    compiled = CompiledSchema(load_schema(schema_path))
+    _compiled[schema_path] = (mtime, compiled)
+    return compiled
@@ -0,0 +1,306 @@
+"""
+Full-text search over entity properties, ranked by BM25.
+
+``SearchIndex`` keeps an inverted index in a side database
+(``<graph>.search``) next to the log:
+
+* ``docs`` - every live entity (as stored, so hits need no lookup) with its
+  type and length in tokens;
+* ``postings`` - for each term, the entities containing it, how often, and
+  the entity's length (so scoring reads nothing else);
+* ``terms`` - each term's document frequency.
+
+Every string property is indexed, as are strings inside list properties
+(tags). Text is NFKC-normalized and case-folded; Latin, digits and other
+scripts split into words, while runs of CJK characters (Chinese, Japanese
+kana, Korean Hangul), which are written without spaces, are indexed as
+overlapping bigrams plus single characters. A query is tokenized the same
+way, into bigrams for CJK runs longer than one character, and matches
+entities containing any of its terms.
+
+Like the history index, the search index catches up with the log
+incrementally whenever it is used, and is rebuilt from the state the log
+starts from when the log was rewritten (compaction, conversion, a segment fold).
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+from .graph import OntologyGraph
+from .segment import gc_paused
+from .snapshot import fingerprint, read_log
+
+# BM25 term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+DEFAULT_LIMIT = 10
+# Changed entities held in memory before they are written to the index
+FLUSH_DOCS = 50_000
+ENTITY_OPS = ("create", "update", "delete")
+# Page cache per connection; postings inserts touch pages all over the index
+CACHE_KIB = 256 << 10
+# Seconds a connection waits for another process's index update to commit
+BUSY_TIMEOUT = 60
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+# Hiragana and katakana, CJK ideographs (extension A, unified, compatibility, extensions B on), Hangul
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af\U00020000-\U0002ffff"
+_PIECE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_IS_CJK = re.compile(f"[{_CJK}]")
+
+DDL = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    entity_id TEXT NOT NULL UNIQUE,
+    type TEXT,
+    length INTEGER NOT NULL,
+    entity TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def search_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".search")
+
+
+def remove_search(graph_path):
+    path = search_path(graph_path)
+    for suffix in ("", "-wal", "-shm"):
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+def tokenize(text: str, query: bool = False) -> list:
+    """
+    Terms of ``text``: words outside CJK runs, bigrams within them, and (when
+    indexing, or for a one-character run) each CJK character on its own.
+    """
+    tokens = []
+    for piece in _PIECE.findall(unicodedata.normalize("NFKC", text).casefold()):
+        if not _IS_CJK.match(piece):
+            if piece not in STOPWORDS:
+                tokens.append(piece)
+            continue
+        if len(piece) == 1 or not query:
+            tokens.extend(piece)
+        tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+def texts(properties: dict):
+    """The string values of ``properties``, including strings inside lists."""
+    for value in properties.values():
+        if isinstance(value, str):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, str):
+                    yield item
+
+
+def entity_terms(entity: dict) -> Counter:
+    terms = Counter()
+    for text in texts(entity.get("properties") or {}):
+        terms.update(tokenize(text))
+    return terms
+
+
+class SearchIndex:
+    """
+    Search index of the log at ``graph_path``. ``base`` returns the entities
+    the log starts from and the offset its records start at (default: none, 0).
+    """
+
+    def __init__(self, graph_path, base=None):
+        self.graph_path = Path(graph_path)
+        self.path = search_path(self.graph_path)
+        self.base = base or (lambda: ((), 0))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+        conn.executescript(DDL)
+        return conn
+
+    def _valid(self, meta: dict, st) -> bool:
+        if not meta or meta.get("ino") != st.st_ino or st.st_size < meta["offset"]:
+            return False
+        with open(self.graph_path, "rb") as f:
+            return fingerprint(f, meta["offset"]) == meta.get("sample")
+
+    def _lookup(self, conn, pending: dict, entity_id: str) -> dict | None:
+        if entity_id in pending:
+            return pending[entity_id]
+        row = conn.execute("SELECT entity FROM docs WHERE entity_id = ?", (entity_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _flush(self, conn, pending: dict, meta: dict):
+        """Write the changed entities in ``pending`` (None for deleted) to the index."""
+        df = Counter()
+        removed, docs, dropped = [], [], []
+        # term -> [(doc, tf, length), ...]
+        added = {}
+        next_doc = conn.execute("SELECT coalesce(max(id), 0) + 1 FROM docs").fetchone()[0]
+        for entity_id, entity in pending.items():
+            row = conn.execute("SELECT id, length, entity FROM docs WHERE entity_id = ?", (entity_id,)).fetchone()
+            if row is not None:
+                doc, length, old = row
+                # The old postings, from the entity as it was indexed
+                for term in entity_terms(json.loads(old)):
+                    removed.append((term, doc))
+                    df[term] -= 1
+                meta["docs"] -= 1
+                meta["length"] -= length
+            else:
+                doc, next_doc = next_doc, next_doc + 1
+            if entity is None:
+                if row is not None:
+                    dropped.append((doc,))
+                continue
+            terms = entity_terms(entity)
+            length = sum(terms.values())
+            docs.append((doc, entity_id, entity.get("type"), length, json.dumps(entity)))
+            for term, tf in terms.items():
+                added.setdefault(term, []).append((doc, tf, length))
+            df.update(terms.keys())
+            meta["docs"] += 1
+            meta["length"] += length
+        conn.executemany("DELETE FROM postings WHERE term = ? AND doc = ?", removed)
+        conn.executemany("DELETE FROM docs WHERE id = ?", dropped)
+        conn.executemany("INSERT OR REPLACE INTO docs (id, entity_id, type, length, entity) VALUES (?, ?, ?, ?, ?)",
+                         docs)
+        # In key order, so pages fill one after another rather than split at random
+        conn.executemany("INSERT INTO postings (term, doc, tf, length) VALUES (?, ?, ?, ?)",
+                         ((term, *posting) for term in sorted(added) for posting in sorted(added[term])))
+        conn.executemany("INSERT INTO terms (term, df) VALUES (?, ?) "
+                         "ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                         sorted((term, count) for term, count in df.items() if count))
+        conn.executemany("DELETE FROM terms WHERE term = ? AND df <= 0",
+                         ((term,) for term, count in df.items() if count < 0))
+        pending.clear()
+
+    def _reset(self, conn, pending: dict) -> dict:
+        for table in ("docs", "postings", "terms", "meta"):
+            conn.execute(f"DELETE FROM {table}")
+        meta = {"docs": 0, "length": 0}
+        entities, start = self.base()
+        for entity in entities:
+            pending[entity["id"]] = entity
+            if len(pending) >= FLUSH_DOCS:
+                self._flush(conn, pending, meta)
+        meta["offset"] = start
+        return meta
+
+    def sync(self, conn) -> dict:
+        """Index the records appended since the last sync; returns the index metadata."""
+        try:
+            st = os.stat(self.graph_path)
+        except FileNotFoundError:
+            return {"docs": 0, "length": 0}
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        if self._valid(meta, st) and meta["offset"] == st.st_size:
+            return meta
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            with gc_paused():
+                meta = self._catch_up(conn, st)
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return meta
+
+    def _catch_up(self, conn, st) -> dict:
+        # Another process may have synced while we waited for the write lock
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        pending = {}
+        if not self._valid(meta, st):
+            meta = self._reset(conn, pending)
+        offset = meta["offset"]
+        # Applies each op to the one entity it touches, as OntologyGraph.apply would
+        scratch = OntologyGraph()
+        for line, end in read_log(self.graph_path, offset):
+            if end is None:
+                break
+            offset = end
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict) or record.get("op") not in ENTITY_OPS:
+                continue
+            entity_id = record["entity"]["id"] if record["op"] == "create" else record.get("id")
+            current = self._lookup(conn, pending, entity_id)
+            scratch.entities.clear()
+            if current is not None:
+                scratch.entities[entity_id] = current
+            elif record["op"] != "create":
+                continue
+            scratch.apply(record)
+            pending[entity_id] = scratch.entities.get(entity_id)
+            if len(pending) >= FLUSH_DOCS:
+                self._flush(conn, pending, meta)
+        self._flush(conn, pending, meta)
+        with open(self.graph_path, "rb") as f:
+            sample = fingerprint(f, offset)
+        meta.update(offset=offset, ino=st.st_ino, sample=sample)
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?) "
+                         "ON CONFLICT (key) DO UPDATE SET value = excluded.value", meta.items())
+        return meta
+
+    def search(self, query: str, type_name: str = None, limit: int = DEFAULT_LIMIT) -> list:
+        """
+        Entities matching ``query`` (of ``type_name``), best first, as
+        ``{"score", "entity"}``; at most ``limit`` of them.
+        """
+        terms = sorted(set(tokenize(query, query=True)))
+        conn = self._connect()
+        try:
+            meta = self.sync(conn)
+            if not terms or not meta["docs"]:
+                return []
+            placeholders = ", ".join("?" * len(terms))
+            df = dict(conn.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms))
+            if not df:
+                return []
+            count, average = meta["docs"], meta["length"] / meta["docs"] or 1
+            weights = [(term, math.log(1 + (count - n + 0.5) / (n + 0.5))) for term, n in df.items()]
+            sql = (f"WITH q (term, idf) AS (VALUES {', '.join(['(?, ?)'] * len(weights))}), "
+                   "hits AS (SELECT p.doc, sum(q.idf * p.tf * (? + 1) / (p.tf + ? * (1 - ? + ? * p.length / ?))) "
+                   "AS score FROM q JOIN postings p ON p.term = q.term GROUP BY p.doc) "
+                   "SELECT d.entity, h.score FROM hits h JOIN docs d ON d.id = h.doc "
+                   f"{'WHERE d.type = ? ' if type_name else ''}"
+                   "ORDER BY h.score DESC, d.entity_id LIMIT ?")
+            params = [value for weight in weights for value in weight] + [K1, K1, B, B, average]
+            params += [type_name] if type_name else []
+            rows = conn.execute(sql, params + [limit]).fetchall()
+        finally:
+            conn.close()
+        return [{"score": round(score, 4), "entity": json.loads(entity)} for entity, score in rows]
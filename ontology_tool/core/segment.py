@@ -0,0 +1,420 @@
+"""
+Compact binary columnar segment format for the materialized graph state.
+
+A segment stores every live entity and edge once. All strings (ids, types,
+relation and property names, string values, timestamps) are interned in a
+dictionary and referenced by index, entity and edge fields are stored as
+fixed-width columns, and property values as tagged cells. Columns decode in
+bulk for a full load. Entities are stored in log order, so a load lists them
+as replaying the log would; an id index (the entity rows sorted by id) lets
+a memory-mapped segment answer a lookup by binary search, decoding only the
+matching entity.
+
+Layout (little-endian, every section padded to 8 bytes)::
+
+    header
+    strings         byte and character offsets u64 x (n_strings + 1), UTF-8 blob
+    entities        id, type, created, updated, version, extra u32 x n; cell_end u64 x n
+    entity cells    key u32, tag u8, payload 8 bytes, each x n_entity_cells
+    id index        entity row u32 x n, in id order
+    edges           from, rel, to, timestamp, extra u32 x n; cell_end u64 x n
+    edge cells      as entity cells
+
+A cell payload is an int64, a float64 or a string index depending on its
+tag; values without a native tag (lists, objects, out-of-range integers)
+are stored as JSON text. ``extra`` holds any unexpected top-level keys as
+JSON so conversion is lossless.
+"""
+import gc
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+
+MAGIC = b"ONTSEG\x00\x01"
+FORMAT_VERSION = 2
+# Version 1 stored the entity rows sorted by id, with no separate id index
+READABLE_VERSIONS = (1, 2)
+
+HEADER = struct.Struct("<8sI8Q")
+
+# Marks an absent string field
+NONE = 0xFFFFFFFF
+
+TAG_NULL, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_JSON = range(7)
+_CONSTANTS = (None, False, True)
+_INT_MIN, _INT_MAX = -(1 << 63), (1 << 63) - 1
+
+ENTITY_KEYS = ("id", "type", "properties", "created", "updated", "version")
+EDGE_KEYS = ("op", "from", "rel", "to", "properties", "timestamp")
+ENTITY_COLUMNS = ("id", "type", "created", "updated", "version", "extra")
+EDGE_COLUMNS = ("from", "rel", "to", "timestamp", "extra")
+
+_SWAP = sys.byteorder != "little"
+
+
+@contextmanager
+def gc_paused():
+    """
+    Suspend the cyclic garbage collector while bulk-building graph objects;
+    nothing built from a segment forms a cycle, and collector passes over
+    millions of fresh containers otherwise dominate load time.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def segment_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".seg")
+
+
+def _padded(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _layout(n_strings: int, blob_len: int, n_entities: int, n_entity_cells: int,
+            n_edges: int, n_edge_cells: int, version: int = FORMAT_VERSION) -> dict:
+    """Section name -> (offset, typecode, count), derived from the header counts."""
+    sections = {}
+    pos = HEADER.size
+
+    def add(name, typecode, count):
+        nonlocal pos
+        sections[name] = (pos, typecode, count)
+        pos += _padded(array(typecode).itemsize * count)
+
+    add("string_offsets", "Q", n_strings + 1)
+    add("string_chars", "Q", n_strings + 1)
+    add("blob", "B", blob_len)
+    for prefix, columns, rows, cells in (("entity", ENTITY_COLUMNS, n_entities, n_entity_cells),
+                                         ("edge", EDGE_COLUMNS, n_edges, n_edge_cells)):
+        for column in columns:
+            add(f"{prefix}.{column}", "I", rows)
+        add(f"{prefix}.cell_end", "Q", rows)
+        add(f"{prefix}.key", "I", cells)
+        add(f"{prefix}.tag", "B", cells)
+        add(f"{prefix}.int", "q", cells)
+        if prefix == "entity" and version > 1:
+            add("entity.by_id", "I", rows)
+    sections["size"] = pos
+    return sections
+
+
+class _Strings:
+    """Interning string table used while writing."""
+
+    def __init__(self):
+        self.index = {}
+
+    def __call__(self, value: str) -> int:
+        idx = self.index.get(value)
+        if idx is None:
+            idx = self.index[value] = len(self.index)
+        return idx
+
+    def optional(self, value) -> int:
+        return self(value) if isinstance(value, str) else NONE
+
+
+class _Table:
+    """Columns of one record kind (entities or edges) and their property cells."""
+
+    def __init__(self, columns: tuple):
+        self.columns = {name: array("I") for name in columns}
+        self.cell_end = array("Q")
+        self.key = array("I")
+        self.tag = array("B")
+        self.payload = array("q")
+
+    def add_row(self, values: tuple, properties: dict, strings: _Strings):
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+        for key, value in properties.items():
+            self.key.append(strings(key))
+            if value is None:
+                self.tag.append(TAG_NULL)
+                self.payload.append(0)
+            elif value is True or value is False:
+                self.tag.append(TAG_TRUE if value else TAG_FALSE)
+                self.payload.append(0)
+            elif isinstance(value, int) and _INT_MIN <= value <= _INT_MAX:
+                self.tag.append(TAG_INT)
+                self.payload.append(value)
+            elif isinstance(value, float):
+                self.tag.append(TAG_FLOAT)
+                self.payload.append(struct.unpack("<q", struct.pack("<d", value))[0])
+            elif isinstance(value, str):
+                self.tag.append(TAG_STR)
+                self.payload.append(strings(value))
+            else:
+                self.tag.append(TAG_JSON)
+                self.payload.append(strings(json.dumps(value)))
+        self.cell_end.append(len(self.key))
+
+    def arrays(self) -> list:
+        return [*self.columns.values(), self.cell_end, self.key, self.tag, self.payload]
+
+
+def _extra(record: dict, known: tuple, strings: _Strings) -> int:
+    extra = {key: value for key, value in record.items() if key not in known}
+    for key in ("created", "updated", "timestamp"):
+        # Non-string timestamps don't fit the string column
+        if key in known and key in record and not isinstance(record[key], str):
+            extra[key] = record[key]
+    return strings(json.dumps(extra)) if extra else NONE
+
+
+def write_segment(path, entities, edges, generation: int = 1, prior_offset: int = 0):
+    """
+    Write ``entities`` (entity dicts) and ``edges`` (``relate`` records) to a
+    segment at ``path``, fsynced. ``generation`` and ``prior_offset`` tie the
+    segment to the op log written alongside it (see ``storage.SegmentStorage``).
+    """
+    strings = _Strings()
+    entity_table = _Table(ENTITY_COLUMNS)
+    ids = []
+    for entity in entities:
+        ids.append(entity["id"])
+        version = entity.get("version")
+        if not (type(version) is int and 0 < version < NONE):
+            version = None
+        entity_table.add_row((
+            strings(entity["id"]), strings(entity["type"]),
+            strings.optional(entity.get("created")), strings.optional(entity.get("updated")),
+            version or 0,
+            _extra(entity, ENTITY_KEYS if version else ENTITY_KEYS[:-1], strings),
+        ), entity.get("properties") or {}, strings)
+
+    edge_table = _Table(EDGE_COLUMNS)
+    for rel in edges:
+        edge_table.add_row((
+            strings(rel["from"]), strings(rel["rel"]), strings(rel["to"]),
+            strings.optional(rel.get("timestamp")), _extra(rel, EDGE_KEYS, strings),
+        ), rel.get("properties") or {}, strings)
+
+    blob = bytearray()
+    string_offsets = array("Q", [0])
+    string_chars = array("Q", [0])
+    chars = 0
+    for value in strings.index:
+        blob += value.encode("utf-8", "surrogatepass")
+        string_offsets.append(len(blob))
+        chars += len(value)
+        string_chars.append(chars)
+
+    by_id = array("I", sorted(range(len(ids)), key=ids.__getitem__))
+    sections = [string_offsets, string_chars, array("B", blob), *entity_table.arrays(), by_id,
+                *edge_table.arrays()]
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, generation, prior_offset, len(strings.index), len(blob),
+                            len(entity_table.cell_end), len(entity_table.key),
+                            len(edge_table.cell_end), len(edge_table.key)))
+        for section in sections:
+            if _SWAP:
+                section.byteswap()
+            data = section.tobytes()
+            f.write(data)
+            f.write(b"\0" * (_padded(len(data)) - len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SegmentError(ValueError):
+    """The file is not a readable segment."""
+
+
+class Segment:
+    """A memory-mapped segment: point lookups by id, or a bulk decode of every column."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise SegmentError(f"{self.path}: truncated segment")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.generation, self.prior_offset, n_strings, blob_len,
+         self.n_entities, n_entity_cells, self.n_edges, n_edge_cells) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version not in READABLE_VERSIONS:
+            self._map.close()
+            raise SegmentError(f"{self.path}: not a segment (or unsupported version)")
+        self.n_strings = n_strings
+        self._sections = _layout(n_strings, blob_len, self.n_entities, n_entity_cells,
+                                 self.n_edges, n_edge_cells, version)
+        self._indexed = "entity.by_id" in self._sections
+        if self._sections["size"] > size:
+            self._map.close()
+            raise SegmentError(f"{self.path}: truncated segment")
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.n_entities
+
+    def _column(self, name: str, typecode: str = None) -> array:
+        pos, code, count = self._sections[name]
+        column = array(typecode or code)
+        column.frombytes(self._map[pos:pos + column.itemsize * count])
+        if _SWAP:
+            column.byteswap()
+        return column
+
+    def _item(self, name: str, i: int):
+        pos, code, _ = self._sections[name]
+        return struct.unpack_from("<" + code, self._map, pos + struct.calcsize(code) * i)[0]
+
+    def _string(self, idx: int) -> str:
+        pos = self._sections["string_offsets"][0] + 8 * idx
+        start, end = struct.unpack_from("<2Q", self._map, pos)
+        blob = self._sections["blob"][0]
+        return self._map[blob + start:blob + end].decode("utf-8", "surrogatepass")
+
+    def strings(self) -> list:
+        """Decode the whole string table with one decode of the blob."""
+        offsets = self._column("string_chars")
+        pos, _, blob_len = self._sections["blob"]
+        text = self._map[pos:pos + blob_len].decode("utf-8", "surrogatepass")
+        return list(map(text.__getitem__, map(slice, offsets, offsets[1:])))
+
+    @staticmethod
+    def _value(tag: int, payload: int, string):
+        if tag == TAG_STR:
+            return string(payload)
+        if tag == TAG_INT:
+            return payload
+        if tag == TAG_FLOAT:
+            return struct.unpack("<d", struct.pack("<q", payload))[0]
+        if tag == TAG_JSON:
+            return json.loads(string(payload))
+        return _CONSTANTS[tag]
+
+    def _cells(self, prefix: str, strings: list) -> tuple[list, list]:
+        """Every property key and value of one table, decoded column-wise."""
+        keys = list(map(strings.__getitem__, self._column(f"{prefix}.key")))
+        tags = self._column(f"{prefix}.tag")
+        ints = self._column(f"{prefix}.int")
+        floats = self._column(f"{prefix}.int", "d")
+        values = [strings[i] if t == TAG_STR else i if t == TAG_INT else f if t == TAG_FLOAT
+                  else _CONSTANTS[t] if t < TAG_INT else None
+                  for t, i, f in zip(tags, ints, floats)]
+        if TAG_JSON in tags:
+            # One parser call for every JSON-encoded value, each decoded separately
+            cells = [n for n, t in enumerate(tags) if t == TAG_JSON]
+            decoded = json.loads("[" + ",".join(strings[ints[n]] for n in cells) + "]")
+            for n, value in zip(cells, decoded):
+                values[n] = value
+        return keys, values
+
+    def _cell_range(self, prefix: str, i: int) -> tuple[int, int]:
+        start = self._item(f"{prefix}.cell_end", i - 1) if i else 0
+        return start, self._item(f"{prefix}.cell_end", i)
+
+    def get(self, entity_id: str) -> dict | None:
+        """Binary-search the id index and decode a single entity."""
+        lo, hi = 0, self.n_entities
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = self._item("entity.by_id", mid) if self._indexed else mid
+            found = self._string(self._item("entity.id", row))
+            if found < entity_id:
+                lo = mid + 1
+            elif found > entity_id:
+                hi = mid
+            else:
+                break
+        else:
+            return None
+        string = self._string
+        start, end = self._cell_range("entity", row)
+        properties = {string(self._item("entity.key", c)):
+                      self._value(self._item("entity.tag", c), self._item("entity.int", c), string)
+                      for c in range(start, end)}
+        return _entity(*(self._item(f"entity.{column}", row) for column in ENTITY_COLUMNS),
+                       properties, string)
+
+    def read(self, records: bool = True) -> tuple[dict, list]:
+        """
+        Decode everything as ``(entities by id, edges)``; strings are shared,
+        not copied. Edges are ``relate`` log records, or with ``records=False``
+        relation dicts as held by ``OntologyGraph``.
+        """
+        with gc_paused():
+            return self._read(records)
+
+    def _read(self, records: bool) -> tuple[dict, list]:
+        strings = self.strings()
+        string = strings.__getitem__
+
+        keys, values = self._cells("entity", strings)
+        columns = [self._column(f"entity.{column}") for column in ENTITY_COLUMNS]
+        entities = {}
+        start = 0
+        for id_, type_, created, updated, version, extra, end in zip(*columns, self._column("entity.cell_end")):
+            properties = dict(zip(keys[start:end], values[start:end]))
+            start = end
+            if extra == NONE and version and created != NONE and updated != NONE:
+                entity_id = strings[id_]
+                entities[entity_id] = {"id": entity_id, "type": strings[type_], "properties": properties,
+                                       "created": strings[created], "updated": strings[updated],
+                                       "version": version}
+            else:
+                entity = _entity(id_, type_, created, updated, version, extra, properties, string)
+                entities[entity["id"]] = entity
+
+        keys, values = self._cells("edge", strings)
+        columns = [self._column(f"edge.{column}") for column in EDGE_COLUMNS]
+        edges = []
+        start = 0
+        for from_, rel, to, timestamp, extra, end in zip(*columns, self._column("edge.cell_end")):
+            properties = dict(zip(keys[start:end], values[start:end]))
+            start = end
+            if not records:
+                edges.append({"from": strings[from_], "rel": strings[rel], "to": strings[to],
+                              "properties": properties})
+                continue
+            record = {"op": "relate", "from": strings[from_], "rel": strings[rel], "to": strings[to],
+                      "properties": properties}
+            if timestamp != NONE:
+                record["timestamp"] = strings[timestamp]
+            if extra != NONE:
+                record.update(json.loads(strings[extra]))
+            edges.append(record)
+        return entities, edges
+
+
+def _entity(id_, type_, created, updated, version, extra, properties, string) -> dict:
+    entity = {"id": string(id_), "type": string(type_), "properties": properties}
+    if created != NONE:
+        entity["created"] = string(created)
+    if updated != NONE:
+        entity["updated"] = string(updated)
+    if version:
+        entity["version"] = version
+    if extra != NONE:
+        entity.update(json.loads(string(extra)))
+    return entity
+
+
+def read_segment(path) -> Segment | None:
+    """Open the segment at ``path``, or None if there is none."""
+    try:
+        return Segment(path)
+    except FileNotFoundError:
+        return None
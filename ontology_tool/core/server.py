@@ -0,0 +1,213 @@
+"""
+Long-running graph server.
+
+Keeps an OntologyManager's graph resident in memory and serves the CLI
+operations over a local Unix socket (or localhost TCP) with an asyncio
+event loop. The protocol is one JSON object per line in each direction:
+
+    -> {"op": "get", "args": {"entity_id": "p_001"}}
+    <- {"ok": true, "result": {...}}
+
+A write request may add ``"enforce_schema": true`` to be checked against
+the server's schema even if the server was started without enforcement.
+
+Requests run in worker threads, off the loop. Reads run concurrently over
+the resident graph pinned as it stands; writes, and the reload that picks
+up records appended by other processes, run one at a time with no reader
+active, so every read sees a consistent graph.
+
+TCP mode has no authentication, so it only binds to loopback addresses.
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import signal
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from .client import socket_path
+from .manager import OntologyManager
+
+# Large enough for bulk create requests; asyncio's default is 64 KiB.
+MAX_REQUEST_BYTES = 64 << 20
+
+# Operations that never write; they may run concurrently.
+READ_OPS = {"get", "query", "list", "related", "search", "traverse", "path", "validate", "stats"}
+
+
+class ReadWriteLock:
+    """Many readers or one writer at a time; a waiting writer holds back new readers."""
+
+    def __init__(self):
+        self._cond = asyncio.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting = 0
+
+    @asynccontextmanager
+    async def shared(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._writing and not self._waiting)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        async with self._cond:
+            self._waiting += 1
+            try:
+                await self._cond.wait_for(lambda: not self._writing and not self._readers)
+            finally:
+                self._waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+def _error(e: Exception) -> dict:
+    return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def _response(response: dict) -> bytes:
+    return json.dumps(response).encode() + b"\n"
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class GraphServer:
+    def __init__(self, manager: OntologyManager):
+        self.manager = manager
+        # Operation name -> manager method; request args are passed as keywords
+        self.ops = {
+            "create": manager.create_entity,
+            "upsert": manager.upsert_entity,
+            "get": manager.get_entity,
+            "query": manager.query_page,
+            "list": manager.list_entities,
+            "update": manager.update_entity,
+            "delete": manager.delete_entity,
+            "relate": manager.create_relation,
+            "related": manager.get_related,
+            "search": manager.search,
+            "traverse": manager.traverse,
+            "path": manager.shortest_path,
+            "validate": manager.validate,
+            "stats": manager.get_stats,
+        }
+        # Created on first use, inside the running loop
+        self.lock = None
+
+    def dispatch(self, request: dict):
+        op = self.ops.get(request.get("op"))
+        if op is None:
+            raise ValueError(f"unknown operation '{request.get('op')}'")
+        args = request.get("args") or {}
+        if not request.get("enforce_schema") or self.manager.enforce_schema:
+            return op(**args)
+        # The client asked for this one write to be checked (its --enforce-schema)
+        if self.manager.compact_memory:
+            raise ValueError("schema enforcement needs the dict graph; not available with --compact-memory")
+        self.manager.enforce_schema = True
+        try:
+            return op(**args)
+        finally:
+            self.manager.enforce_schema = False
+
+    def respond(self, request: dict) -> bytes:
+        """
+        The response line for ``request``. Encoded in the same worker thread
+        as the dispatch, while the lock still keeps writes off the results.
+        """
+        try:
+            return _response({"ok": True, "result": self.dispatch(request)})
+        except Exception as e:
+            return _response(_error(e))
+
+    async def run(self, request: dict) -> bytes:
+        """``respond`` in a worker thread, concurrently with other reads or alone for a write."""
+        if self.lock is None:
+            self.lock = ReadWriteLock()
+        if request.get("op") in READ_OPS and not request.get("enforce_schema"):
+            if self.manager.stale():
+                # Apply other processes' records before any reader pins the graph
+                async with self.lock.exclusive():
+                    await asyncio.to_thread(self.manager.load_ontology)
+            async with self.lock.shared():
+                with self.manager.pinned():
+                    return await asyncio.to_thread(self.respond, request)
+        async with self.lock.exclusive():
+            return await asyncio.to_thread(self.respond, request)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    data = await self.run(json.loads(line))
+                except Exception as e:
+                    data = _response(_error(e))
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host: str = "127.0.0.1", port: int = None):
+        """Serve on ``port`` over loopback TCP when given, otherwise on the Unix socket ``path``."""
+        if port is not None and not is_loopback(host):
+            raise ValueError(f"refusing to serve on '{host}': TCP mode has no authentication, "
+                             f"so it only binds to loopback addresses")
+        # Load once up front so the first request doesn't pay for the replay
+        self.manager.load_ontology()
+        try:
+            # Stop cleanly (removing the socket) on SIGTERM as well as Ctrl-C
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+        if port is not None:
+            server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+            print(f"Serving {self.manager.graph_path} on {host}:{port}")
+            async with server:
+                await server.serve_forever()
+            return
+
+        path = Path(path or socket_path(self.manager.graph_path))
+        path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(self.handle, str(path), limit=MAX_REQUEST_BYTES)
+        os.chmod(path, 0o600)
+        print(f"Serving {self.manager.graph_path} on {path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            path.unlink(missing_ok=True)
+
+
+def serve(graph_path, schema_path, path=None, host: str = "127.0.0.1", port: int = None,
+          enforce_schema: bool = False, compact_memory: bool = False):
+    manager = OntologyManager(graph_path, schema_path, resident=True, enforce_schema=enforce_schema,
+                              compact_memory=compact_memory)
+    try:
+        asyncio.run(GraphServer(manager).serve(path, host, port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -0,0 +1,90 @@
+"""
+Materialized snapshots of the append-only graph log.
+
+A snapshot stores the replayed graph state together with the byte offset of
+the log it covers, so loaders only replay the records appended after it.
+"""
+import os
+import pickle
+from pathlib import Path
+
+SNAPSHOT_VERSION = 3
+# Refresh the snapshot once the replayed tail grows past this many bytes.
+DEFAULT_SNAPSHOT_THRESHOLD = 1 << 20
+# Bytes sampled at the head of the log and just before the covered offset;
+# a mismatch means the log was rewritten (cleared, compacted) underneath us.
+FINGERPRINT_BYTES = 64
+
+
+def snapshot_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".snapshot")
+
+
+def fingerprint(f, offset: int) -> bytes:
+    """Sample of the log head and the bytes just before ``offset``, read from open file ``f``."""
+    f.seek(0)
+    head = f.read(min(offset, FINGERPRINT_BYTES))
+    f.seek(max(0, offset - FINGERPRINT_BYTES))
+    tail = f.read(min(offset, FINGERPRINT_BYTES))
+    return head + tail
+
+
+def read_snapshot(graph_path):
+    """Return ``(state, offset)`` from a snapshot still valid for the log, else None."""
+    try:
+        with open(snapshot_path(graph_path), "rb") as f:
+            data = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    offset = data["offset"]
+    try:
+        with open(graph_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < offset:
+                return None
+            if fingerprint(f, offset) != data["fingerprint"]:
+                return None
+    except OSError:
+        return None
+    return data["state"], offset
+
+
+def write_snapshot(graph_path, state, offset: int) -> bool:
+    """Atomically persist ``state`` as covering the log up to ``offset``."""
+    path = snapshot_path(graph_path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with open(graph_path, "rb") as f:
+            sample = fingerprint(f, offset)
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "version": SNAPSHOT_VERSION,
+                "offset": offset,
+                "fingerprint": sample,
+                "state": state,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Snapshots are only a cache; a read-only directory must not break loads.
+        return False
+    return True
+
+
+def remove_snapshot(graph_path):
+    snapshot_path(graph_path).unlink(missing_ok=True)
+
+
+def read_log(graph_path, offset: int = 0):
+    """
+    Yield ``(line, end)`` for each raw log line starting at ``offset``.
+    ``end`` is the byte offset just past the line, or None for an
+    unterminated final line (a write still in progress).
+    """
+    with open(graph_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            yield line, (offset if line.endswith(b"\n") else None)
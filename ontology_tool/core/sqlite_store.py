@@ -0,0 +1,342 @@
+"""
+SQLite tables mirroring the graph log, used by the ``sqlite`` storage backend.
+
+The database (``<graph>.db``) holds the op history and the state it folds to:
+
+* ``ops`` - every applied log record in log order, with the entity it
+  touches and its timestamp, so history survives log compaction.
+* ``entities`` - live entities, properties as JSON text queried with the
+  JSON1 functions, indexed by type and by each declared ``(type, property)``.
+* ``relations`` - live edges, unique on (from, rel, to) with an index on
+  (to, rel) for incoming lookups.
+* ``meta`` - the log generation and offset the tables are synced to.
+* ``checkpoints`` - the pickled state after every ``CHECKPOINT_OPS`` ops,
+  written by point-in-time reads so the next one replays from the nearest.
+
+Records are applied with the same semantics as ``OntologyGraph.apply``.
+Queries push the type filter and whatever part of the ``where`` clause SQL
+can express into the database, then run the exact matching, ordering and
+pagination of ``query.execute`` on the candidate rows.
+"""
+import json
+import math
+import pickle
+import sqlite3
+from pathlib import Path
+
+from .graph import DIRECTIONS, OntologyGraph
+from .query import compile_where, conditions, execute
+
+OPS = ("create", "update", "delete", "relate", "unrelate")
+
+# Declared property indexes are named "prop:<type>:<property>"
+INDEX_PREFIX = "prop:"
+
+# Seconds a connection waits for another process's sync to commit
+BUSY_TIMEOUT = 60
+
+# Ops between the checkpoints of point-in-time reads
+CHECKPOINT_OPS = 100_000
+
+DDL = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ops (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    entity_id TEXT,
+    timestamp TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ops_entity ON ops (entity_id);
+CREATE INDEX IF NOT EXISTS ops_timestamp ON ops (timestamp);
+CREATE TABLE IF NOT EXISTS entities (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    properties TEXT NOT NULL,
+    created TEXT,
+    updated TEXT,
+    version INTEGER NOT NULL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS entities_type ON entities (type);
+CREATE TABLE IF NOT EXISTS relations (
+    from_id TEXT NOT NULL,
+    rel TEXT NOT NULL,
+    to_id TEXT NOT NULL,
+    properties TEXT NOT NULL,
+    timestamp TEXT,
+    UNIQUE (from_id, rel, to_id)
+);
+CREATE INDEX IF NOT EXISTS relations_to ON relations (to_id, rel);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    seq INTEGER PRIMARY KEY,
+    state BLOB NOT NULL
+);
+"""
+
+ENTITY_KEYS = ("id", "type", "properties", "created", "updated", "version")
+ENTITY_COLUMNS = "id, type, properties, created, updated, version, extra"
+
+_COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_INT_MIN, _INT_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def db_path(graph_path) -> Path:
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_path.name + ".db")
+
+
+def connect(path) -> sqlite3.Connection:
+    """Open (creating if needed) the database in autocommit mode; callers manage transactions."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(DDL)
+    return conn
+
+
+def get_meta(conn) -> dict:
+    return dict(conn.execute("SELECT key, value FROM meta"))
+
+
+def set_meta(conn, **values):
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?) "
+                     "ON CONFLICT (key) DO UPDATE SET value = excluded.value", values.items())
+
+
+def _entity_row(entity: dict) -> tuple:
+    extra = {key: value for key, value in entity.items() if key not in ENTITY_KEYS}
+    return (entity["id"], entity["type"], json.dumps(entity.get("properties", {})),
+            entity.get("created"), entity.get("updated"), entity.get("version", 1),
+            json.dumps(extra) if extra else None)
+
+
+def _entity(row) -> dict:
+    entity_id, type_name, properties, created, updated, version, extra = row
+    entity = {"id": entity_id, "type": type_name, "properties": json.loads(properties)}
+    if created is not None:
+        entity["created"] = created
+    if updated is not None:
+        entity["updated"] = updated
+    if extra is not None:
+        entity.update(json.loads(extra))
+    entity["version"] = version
+    return entity
+
+
+def apply_record(conn, record: dict, line: str):
+    """Apply one log record (and its raw ``line``) to the tables."""
+    op = record.get("op")
+    if op not in OPS:
+        return
+    timestamp = record.get("timestamp")
+    if op == "create":
+        entity_id = record["entity"]["id"]
+        # Versions count writes to an entity, as in OntologyGraph.apply
+        conn.execute(f"INSERT INTO entities ({ENTITY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                     "ON CONFLICT (id) DO UPDATE SET type = excluded.type, properties = excluded.properties, "
+                     "created = excluded.created, updated = excluded.updated, extra = excluded.extra, "
+                     "version = entities.version + 1", _entity_row(record["entity"]))
+    elif op == "update":
+        entity_id = record["id"]
+        row = conn.execute("SELECT properties FROM entities WHERE id = ?", (entity_id,)).fetchone()
+        if row is not None:
+            properties = json.loads(row[0])
+            properties.update(record.get("properties", {}))
+            conn.execute("UPDATE entities SET properties = ?, updated = ?, version = version + 1 WHERE id = ?",
+                         (json.dumps(properties), timestamp, entity_id))
+    elif op == "delete":
+        entity_id = record["id"]
+        conn.execute("DELETE FROM entities WHERE id = ?", (entity_id,))
+    elif op == "relate":
+        entity_id = None
+        # Re-relating an existing edge replaces its properties in place
+        conn.execute("INSERT INTO relations (from_id, rel, to_id, properties, timestamp) VALUES (?, ?, ?, ?, ?) "
+                     "ON CONFLICT (from_id, rel, to_id) DO UPDATE SET properties = excluded.properties, "
+                     "timestamp = excluded.timestamp",
+                     (record["from"], record["rel"], record["to"],
+                      json.dumps(record.get("properties", {})), timestamp))
+    else:
+        entity_id = None
+        conn.execute("DELETE FROM relations WHERE from_id = ? AND rel = ? AND to_id = ?",
+                     (record["from"], record["rel"], record["to"]))
+    conn.execute("INSERT INTO ops (op, entity_id, timestamp, record) VALUES (?, ?, ?, ?)",
+                 (op, entity_id, timestamp, line))
+
+
+def count_rows(conn) -> int:
+    """Live entities plus live edges."""
+    return (conn.execute("SELECT count(*) FROM entities").fetchone()[0]
+            + conn.execute("SELECT count(*) FROM relations").fetchone()[0])
+
+
+def iter_entities(conn):
+    for row in conn.execute(f"SELECT {ENTITY_COLUMNS} FROM entities ORDER BY rowid"):
+        yield _entity(row)
+
+
+def iter_relations(conn, records: bool = False):
+    """Every live edge, as a graph relation or, with ``records``, as the ``relate`` record compaction writes."""
+    rows = conn.execute("SELECT from_id, rel, to_id, properties, timestamp FROM relations ORDER BY rowid")
+    for from_id, rel, to_id, properties, timestamp in rows:
+        if records:
+            yield {"op": "relate", "from": from_id, "rel": rel, "to": to_id,
+                   "properties": json.loads(properties), "timestamp": timestamp}
+        else:
+            yield {"from": from_id, "rel": rel, "to": to_id, "properties": json.loads(properties)}
+
+
+def read_state(conn, records: bool = False) -> tuple[dict, list]:
+    """Every live entity by id and every live edge; see ``iter_relations``."""
+    entities = {entity["id"]: entity for entity in iter_entities(conn)}
+    return entities, list(iter_relations(conn, records))
+
+
+def state_as_of(conn, timestamp: str) -> OntologyGraph:
+    """
+    The graph after every op up to the first one stamped later than
+    ``timestamp`` (a UTC isoformat string), replayed from the nearest checkpoint.
+    """
+    row = conn.execute("SELECT min(seq) FROM ops WHERE timestamp > ?", (timestamp,)).fetchone()
+    stop = row[0] if row[0] is not None else conn.execute("SELECT coalesce(max(seq), 0) + 1 FROM ops").fetchone()[0]
+    row = conn.execute("SELECT seq, state FROM checkpoints WHERE seq < ? ORDER BY seq DESC LIMIT 1",
+                       (stop,)).fetchone()
+    graph, start = (pickle.loads(row[1]), row[0]) if row else (OntologyGraph(), 0)
+    checkpoints = []
+    for seq, record in conn.execute("SELECT seq, record FROM ops WHERE seq > ? AND seq < ? ORDER BY seq",
+                                    (start, stop)):
+        graph.apply(json.loads(record))
+        if seq % CHECKPOINT_OPS == 0:
+            checkpoints.append((seq, pickle.dumps(graph, protocol=pickle.HIGHEST_PROTOCOL)))
+    try:
+        conn.executemany("INSERT OR IGNORE INTO checkpoints (seq, state) VALUES (?, ?)", checkpoints)
+    except sqlite3.OperationalError:
+        # Read-only or busy database: the next read replays these ops again
+        pass
+    return graph
+
+
+def get_entity(conn, entity_id: str) -> dict | None:
+    row = conn.execute(f"SELECT {ENTITY_COLUMNS} FROM entities WHERE id = ?", (entity_id,)).fetchone()
+    return _entity(row) if row else None
+
+
+def _json_path(prop: str) -> str | None:
+    """SQL literal for the JSON path of ``prop``, or None if it can't be quoted."""
+    if '"' in prop or "\\" in prop:
+        return None
+    return "'$.\"" + prop.replace("'", "''") + "\"'"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def set_indexes(conn, specs):
+    """Make the declared ``(type, property)`` expression indexes exactly ``specs``."""
+    wanted = {}
+    for type_name, prop in specs or ():
+        path = _json_path(prop)
+        if path is not None:
+            wanted[f"{INDEX_PREFIX}{type_name}:{prop}"] = path
+    existing = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND substr(name, 1, ?) = ?",
+        (len(INDEX_PREFIX), INDEX_PREFIX))}
+    for name in existing - set(wanted):
+        conn.execute(f"DROP INDEX IF EXISTS {_quote(name)}")
+    for name in set(wanted) - existing:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(name)} ON entities (type, json_extract(properties, {wanted[name]}))")
+
+
+def _bindable(value) -> bool:
+    if isinstance(value, float):
+        return not math.isnan(value)
+    if isinstance(value, int):
+        return _INT_MIN <= value <= _INT_MAX
+    return isinstance(value, str)
+
+
+def _prefilter(prop: str, name: str, operand):
+    """
+    ``(sql, params)`` selecting a superset of the entities matching one
+    operator, or None if SQL can't narrow it down; matches are rechecked in
+    Python. SQL orders numbers before text, where Python comparisons of
+    mixed types are simply false, so the superset is never too small.
+    """
+    path = _json_path(prop)
+    if path is None:
+        return None
+    value = f"json_extract(properties, {path})"
+    if name == "$eq" and _bindable(operand):
+        return f"{value} = ?", [operand]
+    if name == "$in" and operand and all(_bindable(v) for v in operand):
+        return f"{value} IN ({', '.join('?' * len(operand))})", list(operand)
+    if name in _COMPARISONS and _bindable(operand):
+        return f"{value} {_COMPARISONS[name]} ?", [operand]
+    if name == "$prefix" and isinstance(operand, str):
+        return f"substr({value}, 1, ?) = ?", [len(operand), operand]
+    if name == "$exists":
+        return f"json_type(properties, {path}) IS {'NOT ' if operand else ''}NULL", []
+    return None
+
+
+def query_page(conn, type_name: str = None, where: dict = None, order_by: str = None,
+               limit: int = None, offset: int = 0, cursor: str = None) -> tuple[list, str | None]:
+    """Same results as ``OntologyGraph.query_page``, filtering in SQL where it can."""
+    clauses = compile_where(where)
+    filters, params = [], []
+    if type_name:
+        filters.append("type = ?")
+        params.append(type_name)
+    for prop, name, operand in conditions(where):
+        narrowed = _prefilter(prop, name, operand)
+        if narrowed is not None:
+            filters.append(narrowed[0])
+            params.extend(narrowed[1])
+    sql = f"SELECT {ENTITY_COLUMNS} FROM entities"
+    if filters:
+        sql += " WHERE " + " AND ".join(filters)
+    rows = conn.execute(sql + " ORDER BY rowid", params)
+    return execute(map(_entity, rows), clauses, order_by, limit, offset, cursor)
+
+
+def related(conn, entity_id: str, rel_type: str = None, direction: str = "outgoing") -> list:
+    """Same results as ``OntologyGraph.related``, from two indexed joins."""
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {DIRECTIONS}, got '{direction}'")
+    columns = ", ".join(f"e.{column}" for column in ENTITY_COLUMNS.split(", "))
+    results = []
+    for rel_dir, near, far in (("outgoing", "from_id", "to_id"), ("incoming", "to_id", "from_id")):
+        if direction not in (rel_dir, "both"):
+            continue
+        sql = f"SELECT r.rel, {columns} FROM relations r JOIN entities e ON e.id = r.{far} WHERE r.{near} = ?"
+        params = [entity_id]
+        if rel_type:
+            sql += " AND r.rel = ?"
+            params.append(rel_type)
+        if direction == "both" and rel_dir == "incoming":
+            # A self-loop was already reported as outgoing
+            sql += " AND r.from_id != r.to_id"
+        # Grouped by relation, like the graph's adjacency dicts
+        by_rel = {}
+        for row in conn.execute(sql + " ORDER BY r.rowid", params):
+            result = {"relation": row[0]}
+            if direction == "both":
+                result["direction"] = rel_dir
+            result["entity"] = _entity(row[1:])
+            by_rel.setdefault(row[0], []).append(result)
+        for group in by_rel.values():
+            results.extend(group)
+    return results
+
+
+def adjacency(conn, entity_id: str, direction: str = "outgoing") -> dict:
+    """``OntologyGraph.outgoing[entity_id]`` (or ``incoming``), from the relations table alone."""
+    near, far = ("from_id", "to_id") if direction == "outgoing" else ("to_id", "from_id")
+    by_rel = {}
+    for rel, other in conn.execute(f"SELECT rel, {far} FROM relations WHERE {near} = ? ORDER BY rowid", (entity_id,)):
+        by_rel.setdefault(rel, {})[other] = True
+    return by_rel
@@ -0,0 +1,777 @@
+"""
+Storage backends for the graph's base state.
+
+Writes always append to the JSONL op log; a backend decides where the state
+the log is replayed on top of comes from, and what compaction writes:
+
+* ``JsonlStorage`` - the log alone, cached by pickled snapshots and compacted
+  into one JSONL record per live entity and edge.
+* ``SegmentStorage`` - a binary segment (``<graph>.seg``, see ``segment``)
+  holding the folded state, plus the records appended to the log since it
+  was written. Compaction folds the log into a new segment.
+* ``SqliteStorage`` - an SQLite database (``<graph>.db``, see
+  ``sqlite_store``) holding the op history and the state, which every access
+  first syncs with the records appended to the log. Lookups, queries and
+  neighbourhoods are answered in SQL; compaction empties the log, the
+  history staying in the database.
+
+A graph uses SQLite storage while its ``.db`` file exists, else segment
+storage while its ``.seg`` file exists; ``convert`` switches between them
+without losing any entity or edge data.
+
+Segment compaction replaces two files. The segment header records its
+generation and how many bytes of the previous log it folded, and the new log
+starts with a ``{"op": "segment", "generation": N}`` marker, so a crash
+between the two replaces is recovered on load. SQLite compaction commits the
+same generation and offset to the database before replacing the log.
+"""
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import sqlite_store
+from .compact_graph import CompactGraph
+from .compaction import archive_lines, compact_log, cutoff_for, fold_log, fsync_dir, parse_timestamp, write_state
+from .graph import OntologyGraph, apply_log, load_log
+from .history import HistoryError, HistoryIndex, fold_history, parse_as_of, remove_history
+from .locking import graph_lock
+from .search import DEFAULT_LIMIT, SearchIndex, remove_search
+from .segment import gc_paused, read_segment, segment_path, write_segment
+from .snapshot import DEFAULT_SNAPSHOT_THRESHOLD, read_log, remove_snapshot
+from .sqlite_store import (apply_record, connect, count_rows, db_path, get_meta, iter_entities, iter_relations,
+                           read_state, set_meta)
+
+MARKER_OP = "segment"
+BACKENDS = ("jsonl", "segment", "sqlite")
+
+
+class StorageError(ValueError):
+    """The segment and the log it belongs with don't match."""
+
+
+class _Lookup:
+    """A read-only mapping that fetches each key on first ``get``."""
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._cache = {}
+
+    def get(self, key, default=None):
+        if key not in self._cache:
+            self._cache[key] = self._fetch(key)
+        value = self._cache[key]
+        return default if value is None else value
+
+
+class WriteView:
+    """
+    What a schema check of one write reads (see ``CompiledSchema.check_entity``
+    and ``check_relation``): ``entities``, ``outgoing`` and ``incoming``
+    answer ``get`` one id at a time, so only the endpoints and the
+    neighbourhoods the check walks are ever read.
+    """
+
+    def __init__(self, entity, adjacency):
+        self.entities = _Lookup(entity)
+        self.outgoing = _Lookup(lambda entity_id: adjacency(entity_id, "outgoing"))
+        self.incoming = _Lookup(lambda entity_id: adjacency(entity_id, "incoming"))
+
+
+class StorageBackend:
+    name = None
+
+    def __init__(self, graph_path, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD):
+        self.graph_path = Path(graph_path)
+        # Used by the lookups below when they fall back to a full load
+        self.snapshot_threshold = snapshot_threshold
+
+    def load(self, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD,
+             indexes=None) -> tuple[OntologyGraph, int]:
+        """The full graph and the log offset it covers."""
+        raise NotImplementedError
+
+    def get_entity(self, entity_id: str) -> dict | None:
+        """Look up one entity, without loading the whole graph where the backend allows it."""
+        return self.load(self.snapshot_threshold)[0].entities.get(entity_id)
+
+    def query_page(self, type_name: str = None, where: dict = None, order_by: str = None,
+                   limit: int = None, offset: int = 0, cursor: str = None,
+                   indexes=None) -> tuple[list, str | None]:
+        """``OntologyGraph.query_page``, without a full load where the backend allows it."""
+        graph, _ = self.load(self.snapshot_threshold, indexes)
+        return graph.query_page(type_name, where, order_by, limit, offset, cursor)
+
+    def related(self, entity_id: str, rel_type: str = None, direction: str = "outgoing") -> list:
+        """``OntologyGraph.related``, without a full load where the backend allows it."""
+        return self.load(self.snapshot_threshold)[0].related(entity_id, rel_type, direction)
+
+    @contextmanager
+    def write_view(self):
+        """
+        The graph a write is checked against, for use under the write lock.
+        By default the loaded graph (snapshot plus log tail); backends with
+        point lookups yield a ``WriteView`` instead.
+        """
+        yield self.load(self.snapshot_threshold)[0]
+
+    def load_compact(self, indexes=None) -> tuple[CompactGraph, int]:
+        """
+        ``load`` into the compact in-memory model. By default the dict graph
+        is loaded first and converted; backends that can stream skip that peak.
+        """
+        graph, offset = self.load(self.snapshot_threshold)
+        compact = CompactGraph.from_graph(graph)
+        del graph
+        if indexes is not None:
+            compact.set_indexes(indexes)
+        return compact, offset
+
+    def iter_state(self):
+        """
+        Live entities and relations as two iterators, for streaming exports.
+        By default they come from the compact model, so no dict graph is built.
+        """
+        graph, _ = self.load_compact()
+        return graph.entities.values(), graph.iter_relations()
+
+    def history_index(self) -> HistoryIndex:
+        """The checkpoint and op index over the log, which starts from an empty graph by default."""
+        return HistoryIndex(self.graph_path)
+
+    def as_of(self, timestamp, indexes=None) -> OntologyGraph:
+        """The graph as it was at ``timestamp``, replayed from the nearest checkpoint."""
+        try:
+            graph = self.history_index().as_of(timestamp)
+        except HistoryError as e:
+            raise StorageError(str(e)) from None
+        if indexes is not None:
+            graph.set_indexes(indexes)
+        return graph
+
+    def history(self, entity_id: str) -> list:
+        """Every version of an entity, oldest first (see ``history.fold_history``)."""
+        return self.history_index().history(entity_id)
+
+    def search_index(self) -> SearchIndex:
+        """The full-text index over the log, which starts from no entities by default."""
+        return SearchIndex(self.graph_path)
+
+    def search(self, query: str, type_name: str = None, limit: int = DEFAULT_LIMIT) -> list:
+        """Entities matching ``query``, best first; see ``search.SearchIndex.search``."""
+        return self.search_index().search(query, type_name, limit)
+
+    def compact(self, archive_days: int = None) -> dict:
+        raise NotImplementedError
+
+    def clear(self):
+        remove_snapshot(self.graph_path)
+        remove_history(self.graph_path)
+        remove_search(self.graph_path)
+        if self.graph_path.exists():
+            self.graph_path.unlink()
+        self.graph_path.touch()
+
+
+class JsonlStorage(StorageBackend):
+    name = "jsonl"
+
+    def load(self, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD, indexes=None):
+        return load_log(self.graph_path, snapshot_threshold, indexes)
+
+    def load_compact(self, indexes=None):
+        # Replays the whole log straight into the compact model; the snapshot
+        # holds a dict graph, so reading it would cost the memory we avoid
+        graph = CompactGraph()
+        offset = 0
+        if self.graph_path.exists():
+            offset, _ = apply_log(graph, self.graph_path)
+        graph.freeze()
+        if indexes is not None:
+            graph.set_indexes(indexes)
+        return graph, offset
+
+    def compact(self, archive_days: int = None) -> dict:
+        return compact_log(self.graph_path, archive_days)
+
+
+def log_generation(graph_path) -> int:
+    """Generation from the marker starting a log written by segment compaction, else 0."""
+    try:
+        with open(graph_path, "rb") as f:
+            line = f.readline()
+    except FileNotFoundError:
+        return 0
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return 0
+    if isinstance(record, dict) and record.get("op") == MARKER_OP:
+        return record.get("generation", 0)
+    return 0
+
+
+def _marker(generation: int) -> bytes:
+    return json.dumps({"op": MARKER_OP, "generation": generation}).encode() + b"\n"
+
+
+def _log_start(segment, graph_path):
+    """
+    Offset in the log where records not in ``segment`` start, or None if the
+    segment was superseded by a conversion back to JSONL.
+    """
+    generation = log_generation(graph_path)
+    if generation == segment.generation:
+        return 0
+    if generation == segment.generation - 1:
+        # Crashed after replacing the segment but before replacing the log
+        return segment.prior_offset
+    if generation > segment.generation:
+        return None
+    raise StorageError(f"{segment.path} (generation {segment.generation}) does not belong "
+                       f"with {graph_path} (generation {generation})")
+
+
+class SegmentStorage(StorageBackend):
+    name = "segment"
+
+    def __init__(self, graph_path, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD):
+        super().__init__(graph_path, snapshot_threshold)
+        self.segment_path = segment_path(self.graph_path)
+
+    def load(self, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD, indexes=None):
+        # Reads never fold the log: folding drops the op history the log
+        # holds, so only an explicit compact() does it
+        segment = read_segment(self.segment_path)
+        if segment is None:
+            return load_log(self.graph_path, snapshot_threshold, indexes)
+        with segment:
+            start = _log_start(segment, self.graph_path)
+            if start is None:
+                return load_log(self.graph_path, snapshot_threshold, indexes)
+            with gc_paused():
+                entities, relations = segment.read(records=False)
+                graph = OntologyGraph(entities, relations)
+        if indexes is not None:
+            graph.set_indexes(indexes)
+        offset, _ = apply_log(graph, self.graph_path, start)
+        return graph, offset
+
+    def get_entity(self, entity_id: str) -> dict | None:
+        segment = read_segment(self.segment_path)
+        if segment is None:
+            return super().get_entity(entity_id)
+        with segment:
+            start = _log_start(segment, self.graph_path)
+            if start is None:
+                return super().get_entity(entity_id)
+            entity = segment.get(entity_id)
+
+        # Replay only the log lines that can mention this id
+        graph = OntologyGraph({entity_id: entity} if entity else {})
+        needles = {json.dumps(entity_id).encode(), json.dumps(entity_id, ensure_ascii=False).encode()}
+        for line, end in read_log(self.graph_path, start):
+            if end is None:
+                break
+            if any(needle in line for needle in needles):
+                try:
+                    graph.apply(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return graph.entities.get(entity_id)
+
+    @contextmanager
+    def write_view(self):
+        # Entities are point lookups; adjacency needs the whole graph, loaded
+        # only if a relation check asks for it
+        graph = None
+
+        def adjacency(entity_id, direction):
+            nonlocal graph
+            if graph is None:
+                graph, _ = self.load(self.snapshot_threshold)
+            return getattr(graph, direction).get(entity_id)
+
+        yield WriteView(self.get_entity, adjacency)
+
+    def _base_graph(self) -> tuple[OntologyGraph, int]:
+        """The segment's state and the log offset its records start at."""
+        segment = read_segment(self.segment_path)
+        if segment is None:
+            return OntologyGraph(), 0
+        with segment:
+            start = _log_start(segment, self.graph_path)
+            if start is None:
+                return OntologyGraph(), 0
+            with gc_paused():
+                entities, relations = segment.read(records=False)
+        return OntologyGraph(entities, relations), start
+
+    def _base_entity(self, entity_id: str) -> dict | None:
+        segment = read_segment(self.segment_path)
+        if segment is None:
+            return None
+        with segment:
+            return segment.get(entity_id) if _log_start(segment, self.graph_path) is not None else None
+
+    def history_index(self) -> HistoryIndex:
+        # History before the segment was written is folded into it
+        return HistoryIndex(self.graph_path, self._base_graph, self._base_entity)
+
+    def _search_base(self):
+        graph, start = self._base_graph()
+        return graph.entities.values(), start
+
+    def search_index(self) -> SearchIndex:
+        return SearchIndex(self.graph_path, self._search_base)
+
+    def _read_base(self) -> tuple[dict, dict, int, int]:
+        """Entities, edges, generation and log start offset of the current segment."""
+        segment = read_segment(self.segment_path)
+        if segment is None:
+            return {}, {}, log_generation(self.graph_path), 0
+        with segment:
+            start = _log_start(segment, self.graph_path)
+            if start is None:
+                return {}, {}, log_generation(self.graph_path), 0
+            entities, edges = segment.read()
+            generation = segment.generation
+        return entities, {(r["from"], r["rel"], r["to"]): r for r in edges}, generation, start
+
+    def _compact_locked(self, archive_days: int = None) -> dict:
+        stats = {"records_before": 0, "records_after": 0, "archived": 0,
+                 "bytes_before": 0, "bytes_after": 0}
+        if self.segment_path.exists():
+            stats["bytes_before"] += self.segment_path.stat().st_size
+        if self.graph_path.exists():
+            stats["bytes_before"] += self.graph_path.stat().st_size
+
+        entities, edges, generation, start = self._read_base()
+        stats["records_before"] = len(entities) + len(edges)
+        cutoff = cutoff_for(archive_days)
+        folded, kept = [], []
+        prior_offset = start
+        if self.graph_path.exists():
+            with open(self.graph_path, "rb") as f:
+                f.seek(start)
+                folded, kept, prior_offset = fold_log(f, cutoff, entities, edges, stats)
+
+        generation += 1
+        seg_tmp = self.segment_path.with_name(self.segment_path.name + ".tmp")
+        write_segment(seg_tmp, entities.values(), edges.values(), generation, prior_offset)
+        log_tmp = self.graph_path.with_name(self.graph_path.name + ".compact.tmp")
+        with open(log_tmp, "wb") as out:
+            out.write(_marker(generation))
+            for line in kept:
+                out.write(line if line.endswith(b"\n") else line + b"\n")
+            out.flush()
+            os.fsync(out.fileno())
+        if cutoff is not None:
+            stats["archived"] = archive_lines(self.graph_path, folded)
+
+        os.replace(seg_tmp, self.segment_path)
+        os.replace(log_tmp, self.graph_path)
+        fsync_dir(self.graph_path.parent)
+        remove_snapshot(self.graph_path)
+
+        stats["records_after"] = len(entities) + len(edges) + len(kept)
+        stats["bytes_after"] = self.segment_path.stat().st_size + self.graph_path.stat().st_size
+        return stats
+
+    def compact(self, archive_days: int = None) -> dict:
+        """Fold the log (or, with ``archive_days``, its older part) into a new segment."""
+        with graph_lock(self.graph_path):
+            return self._compact_locked(archive_days)
+
+    def to_jsonl(self) -> dict:
+        """Rewrite the segment and log as one compacted JSONL log and drop the segment."""
+        with graph_lock(self.graph_path):
+            stats = {"records_before": 0, "records_after": 0, "archived": 0,
+                     "bytes_before": self.segment_path.stat().st_size, "bytes_after": 0}
+            entities, edges, generation, start = self._read_base()
+            stats["records_before"] = len(entities) + len(edges)
+            if self.graph_path.exists():
+                stats["bytes_before"] += self.graph_path.stat().st_size
+                with open(self.graph_path, "rb") as f:
+                    f.seek(start)
+                    fold_log(f, None, entities, edges, stats)
+            tmp_path = self.graph_path.with_name(self.graph_path.name + ".compact.tmp")
+            with open(tmp_path, "wb") as out:
+                # Supersedes the segment should we crash before removing it
+                out.write(_marker(generation + 1))
+                write_state(out, entities, edges)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, self.graph_path)
+            self.segment_path.unlink(missing_ok=True)
+            fsync_dir(self.graph_path.parent)
+            remove_snapshot(self.graph_path)
+            stats["records_after"] = len(entities) + len(edges)
+            stats["bytes_after"] = self.graph_path.stat().st_size
+        return stats
+
+    def clear(self):
+        self.segment_path.unlink(missing_ok=True)
+        super().clear()
+
+
+class SqliteStorage(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, graph_path, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD):
+        super().__init__(graph_path, snapshot_threshold)
+        self.db_path = db_path(self.graph_path)
+
+    def _sync(self, conn) -> int | None:
+        """
+        Apply the log records appended since the last sync in one transaction.
+        Returns the log offset the tables cover, or None if the database was
+        superseded by a conversion back to JSONL.
+        """
+        meta = get_meta(conn)
+        try:
+            size = os.path.getsize(self.graph_path)
+        except FileNotFoundError:
+            size = 0
+        generation = log_generation(self.graph_path)
+        if meta.get("generation") in (generation, generation + 1) and self._covered(meta, generation) == size:
+            return size
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have synced while we waited for the write lock
+            meta = get_meta(conn)
+            generation = log_generation(self.graph_path)
+            if "generation" not in meta:
+                # New database: import the whole log, history included
+                offset = 0
+            elif generation == meta["generation"]:
+                offset = meta["offset"]
+            elif generation == meta["generation"] - 1:
+                # A compaction committed but has not replaced the log yet (or
+                # crashed before it could): keep reading the old log, leaving
+                # the generation and offset of the new one alone
+                offset = meta["prior_offset"]
+            elif generation > meta["generation"]:
+                conn.execute("ROLLBACK")
+                return None
+            else:
+                raise StorageError(f"{self.db_path} (generation {meta['generation']}) does not belong "
+                                   f"with {self.graph_path} (generation {generation})")
+            if self.graph_path.exists():
+                for line, end in read_log(self.graph_path, offset):
+                    if end is None:
+                        break
+                    offset = end
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict):
+                        apply_record(conn, record, line.rstrip(b"\n").decode())
+            if generation == meta.get("generation", generation):
+                set_meta(conn, generation=generation, offset=offset)
+            else:
+                set_meta(conn, prior_offset=offset)
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return offset
+
+    def _covered(self, meta: dict, generation: int) -> int:
+        """
+        The offset the tables cover in the log of ``generation``: the old log
+        until a committed compaction replaces it, else the current one.
+        """
+        if generation == meta["generation"] - 1:
+            return meta["prior_offset"]
+        return meta["offset"]
+
+    @contextmanager
+    def _database(self, fold_threshold: int = None):
+        """
+        A connection to the database synced with the log, or None if it was
+        superseded. With ``fold_threshold``, a longer log is folded into the
+        database first, unless a writer (possibly this process) holds the lock.
+        """
+        conn = connect(self.db_path)
+        try:
+            offset = self._sync(conn)
+            if offset is None:
+                conn.close()
+                self._remove_db()
+                yield None
+                return
+            if fold_threshold is not None and offset > fold_threshold:
+                try:
+                    with graph_lock(self.graph_path, blocking=False):
+                        if self._sync(conn) is not None:
+                            self._compact_locked(conn)
+                except (OSError, StorageError):
+                    pass
+            yield conn
+        finally:
+            conn.close()
+
+    def _remove_db(self):
+        for suffix in ("", "-wal", "-shm"):
+            self.db_path.with_name(self.db_path.name + suffix).unlink(missing_ok=True)
+
+    def _bytes(self) -> int:
+        total = 0
+        for path in (self.graph_path, self.db_path, self.db_path.with_name(self.db_path.name + "-wal")):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def load(self, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD, indexes=None):
+        with self._database(snapshot_threshold) as conn:
+            if conn is None:
+                return load_log(self.graph_path, snapshot_threshold, indexes)
+            # One read transaction, so the offset matches the rows even if
+            # another process syncs meanwhile
+            conn.execute("BEGIN")
+            offset = self._covered(get_meta(conn), log_generation(self.graph_path))
+            with gc_paused():
+                entities, relations = read_state(conn)
+                graph = OntologyGraph(entities, relations)
+            conn.execute("COMMIT")
+        if indexes is not None:
+            graph.set_indexes(indexes)
+        return graph, offset
+
+    def load_compact(self, indexes=None):
+        with self._database(self.snapshot_threshold) as conn:
+            if conn is None:
+                return JsonlStorage(self.graph_path, self.snapshot_threshold).load_compact(indexes)
+            conn.execute("BEGIN")
+            offset = self._covered(get_meta(conn), log_generation(self.graph_path))
+            graph = CompactGraph.from_state(iter_entities(conn), iter_relations(conn))
+            conn.execute("COMMIT")
+        if indexes is not None:
+            graph.set_indexes(indexes)
+        return graph, offset
+
+    def _stream(self, index: int):
+        with self._database(self.snapshot_threshold) as conn:
+            if conn is not None:
+                yield from (iter_entities, iter_relations)[index](conn)
+                return
+        yield from JsonlStorage(self.graph_path, self.snapshot_threshold).iter_state()[index]
+
+    def iter_state(self):
+        # Rows stream straight from the database, one connection per iterator
+        return self._stream(0), self._stream(1)
+
+    def get_entity(self, entity_id: str) -> dict | None:
+        with self._database(self.snapshot_threshold) as conn:
+            if conn is not None:
+                return sqlite_store.get_entity(conn, entity_id)
+        return JsonlStorage(self.graph_path, self.snapshot_threshold).get_entity(entity_id)
+
+    def query_page(self, type_name: str = None, where: dict = None, order_by: str = None,
+                   limit: int = None, offset: int = 0, cursor: str = None, indexes=None):
+        with self._database(self.snapshot_threshold) as conn:
+            if conn is not None:
+                if indexes is not None:
+                    sqlite_store.set_indexes(conn, indexes)
+                return sqlite_store.query_page(conn, type_name, where, order_by, limit, offset, cursor)
+        return JsonlStorage(self.graph_path, self.snapshot_threshold).query_page(
+            type_name, where, order_by, limit, offset, cursor, indexes)
+
+    def related(self, entity_id: str, rel_type: str = None, direction: str = "outgoing") -> list:
+        with self._database(self.snapshot_threshold) as conn:
+            if conn is not None:
+                return sqlite_store.related(conn, entity_id, rel_type, direction)
+        return JsonlStorage(self.graph_path, self.snapshot_threshold).related(entity_id, rel_type, direction)
+
+    @contextmanager
+    def write_view(self):
+        with self._database() as conn:
+            if conn is None:
+                with JsonlStorage(self.graph_path, self.snapshot_threshold).write_view() as graph:
+                    yield graph
+                return
+            yield WriteView(lambda entity_id: sqlite_store.get_entity(conn, entity_id),
+                            lambda entity_id, direction: sqlite_store.adjacency(conn, entity_id, direction))
+
+    def as_of(self, timestamp, indexes=None) -> OntologyGraph:
+        timestamp = parse_as_of(timestamp)
+        with self._database(self.snapshot_threshold) as conn:
+            if conn is None:
+                return JsonlStorage(self.graph_path, self.snapshot_threshold).as_of(timestamp, indexes)
+            if get_meta(conn).get("archived"):
+                raise StorageError(f"{self.db_path}: older ops were moved to the archive, "
+                                   "so earlier states can no longer be rebuilt")
+            graph = sqlite_store.state_as_of(conn, timestamp)
+        if indexes is not None:
+            graph.set_indexes(indexes)
+        return graph
+
+    def _search_base(self):
+        """The entities in the database and the log offset they cover, so a rebuild reads no history."""
+        with self._database() as conn:
+            if conn is None:
+                return (), 0
+            # One read transaction, so the offset matches the rows
+            conn.execute("BEGIN")
+            offset = self._covered(get_meta(conn), log_generation(self.graph_path))
+            entities = list(iter_entities(conn))
+            conn.execute("COMMIT")
+        return entities, offset
+
+    def search_index(self) -> SearchIndex:
+        return SearchIndex(self.graph_path, self._search_base)
+
+    def history(self, entity_id: str) -> list:
+        with self._database(self.snapshot_threshold) as conn:
+            if conn is None:
+                return JsonlStorage(self.graph_path, self.snapshot_threshold).history(entity_id)
+            records = [json.loads(record) for (record,) in conn.execute(
+                "SELECT record FROM ops WHERE entity_id = ? ORDER BY seq", (entity_id,))]
+        return fold_history(records)
+
+    def _archive(self, conn, cutoff) -> int:
+        """Move the ops up to the first one newer than ``cutoff`` to the archive."""
+        lines, last = [], None
+        for seq, timestamp, record in conn.execute("SELECT seq, timestamp, record FROM ops ORDER BY seq"):
+            ts = parse_timestamp(timestamp)
+            if ts is not None and ts >= cutoff:
+                break
+            lines.append(record.encode())
+            last = seq
+        if last is None:
+            return 0
+        archive_lines(self.graph_path, lines)
+        conn.execute("DELETE FROM ops WHERE seq <= ?", (last,))
+        conn.execute("DELETE FROM checkpoints")
+        return len(lines)
+
+    def _compact_locked(self, conn, archive_days: int = None) -> dict:
+        meta = get_meta(conn)
+        pending = conn.execute("SELECT count(*) FROM ops WHERE seq > ?", (meta.get("folded_seq", 0),))
+        stats = {"records_before": count_rows(conn) + pending.fetchone()[0], "records_after": 0,
+                 "archived": 0, "bytes_before": self._bytes(), "bytes_after": 0}
+
+        # Everything in the log is in the tables, so the new log is just the marker.
+        # Numbered after the log, so a reader still sees the log as the previous
+        # generation should the last compaction not have replaced it
+        log = log_generation(self.graph_path)
+        generation = log + 1
+        marker = _marker(generation)
+        tmp_path = self.graph_path.with_name(self.graph_path.name + ".compact.tmp")
+        with open(tmp_path, "wb") as out:
+            out.write(marker)
+            out.flush()
+            os.fsync(out.fileno())
+
+        cutoff = cutoff_for(archive_days)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if cutoff is not None:
+                stats["archived"] = self._archive(conn, cutoff)
+            last_seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ops'").fetchone()
+            set_meta(conn, generation=generation, offset=len(marker), prior_offset=self._covered(meta, log),
+                     folded_seq=last_seq[0] if last_seq else 0,
+                     archived=meta.get("archived", 0) + stats["archived"])
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        os.replace(tmp_path, self.graph_path)
+        fsync_dir(self.graph_path.parent)
+        remove_snapshot(self.graph_path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        stats["records_after"] = count_rows(conn)
+        stats["bytes_after"] = self._bytes()
+        return stats
+
+    def compact(self, archive_days: int = None) -> dict:
+        """
+        Fold the log into the database, leaving only a marker in the log. The
+        ops table keeps the history; ``archive_days`` moves older ops to the archive.
+        """
+        with graph_lock(self.graph_path):
+            bytes_before = self._bytes()
+            with self._database() as conn:
+                if conn is not None:
+                    # Sizes from before the sync, which may have built the database
+                    return dict(self._compact_locked(conn, archive_days), bytes_before=bytes_before)
+        return compact_log(self.graph_path, archive_days)
+
+    def to_jsonl(self) -> dict:
+        """
+        Rewrite the database as one JSONL log and drop it. The log replays the
+        full op history, or just the live state once older ops were archived.
+        """
+        with graph_lock(self.graph_path):
+            with self._database() as conn:
+                if conn is None:
+                    stats = None
+                else:
+                    meta = get_meta(conn)
+                    stats = {"records_before": count_rows(conn), "records_after": 0, "archived": 0,
+                             "bytes_before": self._bytes(), "bytes_after": 0}
+                    tmp_path = self.graph_path.with_name(self.graph_path.name + ".compact.tmp")
+                    with open(tmp_path, "wb") as out:
+                        # Supersedes the database should we crash before removing it
+                        out.write(_marker(meta["generation"] + 1))
+                        if meta.get("archived"):
+                            entities, edges = read_state(conn, records=True)
+                            write_state(out, entities, dict(enumerate(edges)))
+                            stats["records_after"] = len(entities) + len(edges)
+                        else:
+                            for (record,) in conn.execute("SELECT record FROM ops ORDER BY seq"):
+                                out.write(record.encode() + b"\n")
+                                stats["records_after"] += 1
+                        out.flush()
+                        os.fsync(out.fileno())
+                    os.replace(tmp_path, self.graph_path)
+            if stats is not None:
+                self._remove_db()
+                fsync_dir(self.graph_path.parent)
+                remove_snapshot(self.graph_path)
+                stats["bytes_after"] = self.graph_path.stat().st_size
+                return stats
+        return compact_log(self.graph_path)
+
+    def clear(self):
+        self._remove_db()
+        super().clear()
+
+
+BACKEND_TYPES = {"jsonl": JsonlStorage, "segment": SegmentStorage, "sqlite": SqliteStorage}
+
+
+def open_storage(graph_path, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD) -> StorageBackend:
+    """The backend the graph at ``graph_path`` currently uses."""
+    if db_path(graph_path).exists():
+        return SqliteStorage(graph_path, snapshot_threshold)
+    if segment_path(graph_path).exists():
+        return SegmentStorage(graph_path, snapshot_threshold)
+    return JsonlStorage(graph_path, snapshot_threshold)
+
+
+def convert(graph_path, backend: str) -> dict:
+    """
+    Convert the graph at ``graph_path`` to ``backend`` (one of ``BACKENDS``),
+    returning compaction-style stats. Converting to the current backend compacts.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got '{backend}'")
+    storage = open_storage(graph_path)
+    if storage.name == backend:
+        return storage.compact()
+    if storage.name != "jsonl":
+        # Go through JSONL; only the last step's stats are reported
+        stats = storage.to_jsonl()
+        if backend == "jsonl":
+            return stats
+    return BACKEND_TYPES[backend](graph_path).compact()
@@ -0,0 +1,188 @@
+"""
+Bounded views of a graph for visualization.
+
+A browser can lay out and draw a few hundred nodes; a graph with millions
+of edges has to be cut down on the server first. Each view returns at most
+``max_nodes`` nodes and ``max_edges`` edges, already positioned, so the
+client only draws them:
+
+* ``ego_view`` - the entities within ``hops`` of one entity, in rings by distance;
+* ``summary_view`` - one node per entity type and one edge per
+  (type, relation, type), weighted by how many entities and edges they stand for;
+* ``degree_view`` - the best-connected entities and the edges between them;
+* ``page_view`` - entities in log order, a page at a time, and the edges between them.
+
+Views are plain dicts (``{"nodes", "edges", "truncated"}``) so callers can
+cache them; ``degrees`` is the one pass over every edge that the degree
+view and node sizes share, worth caching per graph version as well.
+"""
+import heapq
+import math
+from collections import Counter
+from itertools import islice
+
+MAX_NODES = 300
+MAX_EDGES = 1500
+# Layout distances, in the viewer's pixels
+NODE_SPACING = 60
+RING_SPACING = 150
+MIN_SIZE = 10
+MAX_SIZE = 40
+
+
+def label(entity: dict) -> str:
+    properties = entity.get("properties") or {}
+    return str(properties.get("name") or properties.get("title") or entity["id"])
+
+
+def degrees(graph) -> Counter:
+    """Edges touching each entity, from one pass over the relations."""
+    counts = Counter()
+    for rel in graph.iter_relations():
+        counts[rel["from"]] += 1
+        counts[rel["to"]] += 1
+    return counts
+
+
+def _size(weight: int, largest: int) -> float:
+    """Node size growing with the log of ``weight``, up to MAX_SIZE for ``largest``."""
+    if largest <= 1:
+        return MIN_SIZE
+    return MIN_SIZE + (MAX_SIZE - MIN_SIZE) * math.log1p(weight) / math.log1p(largest)
+
+
+def _ring(ids: list, radius: float, positions: dict):
+    for i, node_id in enumerate(ids):
+        angle = 2 * math.pi * i / len(ids)
+        positions[node_id] = (round(radius * math.cos(angle), 1), round(radius * math.sin(angle), 1))
+
+
+def radial_layout(levels: list) -> dict:
+    """
+    Positions ``{id: (x, y)}`` with ``levels[0]`` at the centre and each
+    following level on a ring further out; a level too large for its ring
+    spills onto more rings.
+    """
+    positions = {}
+    radius = 0.0
+    for level in levels:
+        level = list(level)
+        while level:
+            if radius == 0 and len(level) == 1:
+                positions[level[0]] = (0.0, 0.0)
+                radius = RING_SPACING
+                break
+            radius = radius or RING_SPACING
+            capacity = max(1, int(2 * math.pi * radius / NODE_SPACING))
+            _ring(level[:capacity], radius, positions)
+            level = level[capacity:]
+            radius += RING_SPACING
+    return positions
+
+
+def _node(graph, entity_id: str, degree: int, largest: int, position, **extra) -> dict:
+    entity = graph.entities[entity_id]
+    node = {"id": entity_id, "label": label(entity), "type": entity["type"], "degree": degree,
+            "size": _size(degree, largest), "x": position[0], "y": position[1]}
+    node.update(extra)
+    return node
+
+
+def _induced_edges(graph, ids, rel_types, max_edges: int) -> tuple[list, bool]:
+    """Edges between entities in ``ids``, at most ``max_edges`` of them."""
+    edges = []
+    for node_id in ids:
+        for rel, _, other_id in graph.neighbors(node_id, rel_types, "outgoing"):
+            if other_id in ids:
+                if len(edges) == max_edges:
+                    return edges, True
+                edges.append({"from": node_id, "to": other_id, "rel": rel["rel"]})
+    return edges, False
+
+
+def _view(graph, ids: list, levels: list, counts, rel_types, max_edges: int, truncated: bool, **extra) -> dict:
+    positions = radial_layout(levels)
+    degree = counts.get if counts is not None else (lambda node_id, default: default)
+    largest = max((degree(node_id, 0) for node_id in ids), default=0)
+    nodes = [_node(graph, node_id, degree(node_id, 0), largest, positions[node_id]) for node_id in ids]
+    edges, cut = _induced_edges(graph, set(ids), rel_types, max_edges)
+    return {"nodes": nodes, "edges": edges, "truncated": truncated or cut, **extra}
+
+
+def ego_view(graph, center: str, hops: int = 1, rel_types=None, direction: str = "both",
+             max_nodes: int = MAX_NODES, max_edges: int = MAX_EDGES, counts=None) -> dict:
+    """
+    ``center`` and the entities within ``hops`` of it, breadth first, until
+    ``max_nodes``; node sizes follow ``counts`` (see ``degrees``) when given.
+    """
+    if center not in graph.entities:
+        return {"nodes": [], "edges": [], "truncated": False}
+    depth = {center: 0}
+    levels = [[center]]
+    truncated = False
+    while levels[-1] and len(levels) <= hops and not truncated:
+        ring = []
+        for node_id in levels[-1]:
+            for _, _, other_id in graph.neighbors(node_id, rel_types, direction):
+                if other_id in depth or other_id not in graph.entities:
+                    continue
+                if len(depth) == max_nodes:
+                    truncated = True
+                    break
+                depth[other_id] = len(levels)
+                ring.append(other_id)
+            if truncated:
+                break
+        levels.append(ring)
+    view = _view(graph, list(depth), levels, counts, rel_types, max_edges, truncated)
+    for node in view["nodes"]:
+        node["depth"] = depth[node["id"]]
+    return view
+
+
+def summary_view(graph) -> dict:
+    """One node per entity type and one edge per (from type, relation, to type), with counts."""
+    types = Counter(entity["type"] for entity in graph.entities.values())
+    links = Counter()
+    for rel in graph.iter_relations():
+        source, target = graph.entities.get(rel["from"]), graph.entities.get(rel["to"])
+        if source is not None and target is not None:
+            links[source["type"], rel["rel"], target["type"]] += 1
+    names = sorted(types, key=lambda name: (-types[name], name))
+    positions = radial_layout([names[:1], names[1:]])
+    largest = max(types.values(), default=0)
+    nodes = [{"id": name, "label": f"{name} ({count})", "type": name, "count": count,
+              "size": _size(count, largest), "x": positions[name][0], "y": positions[name][1]}
+             for name, count in ((name, types[name]) for name in names)]
+    edges = [{"from": source, "to": target, "rel": rel, "count": count}
+             for (source, rel, target), count in links.most_common()]
+    return {"nodes": nodes, "edges": edges, "truncated": False}
+
+
+def degree_view(graph, counts: Counter = None, type_name: str = None, max_nodes: int = MAX_NODES,
+                max_edges: int = MAX_EDGES) -> dict:
+    """The ``max_nodes`` entities (of ``type_name``) with the most edges, hubs at the centre."""
+    counts = counts if counts is not None else degrees(graph)
+    if type_name:
+        candidates = (entity["id"] for entity in graph.entities.values() if entity["type"] == type_name)
+    else:
+        candidates = iter(graph.entities)
+    ids = heapq.nlargest(max_nodes, candidates, key=lambda node_id: (counts.get(node_id, 0), node_id))
+    truncated = len(ids) == max_nodes and (type_name is not None or len(graph.entities) > max_nodes)
+    return _view(graph, ids, [ids[:1], ids[1:]], counts, None, max_edges, truncated)
+
+
+def page_view(graph, page: int = 0, page_size: int = MAX_NODES, type_name: str = None,
+              counts: Counter = None, max_edges: int = MAX_EDGES) -> dict:
+    """
+    Page ``page`` of the entities (of ``type_name``) in log order; ``more``
+    says whether another page follows.
+    """
+    if type_name:
+        candidates = (entity["id"] for entity in graph.entities.values() if entity["type"] == type_name)
+    else:
+        candidates = iter(graph.entities)
+    ids = list(islice(candidates, page * page_size, (page + 1) * page_size + 1))
+    more = len(ids) > page_size
+    ids = ids[:page_size]
+    return _view(graph, ids, [[], ids], counts, None, max_edges, False, page=page, more=more)
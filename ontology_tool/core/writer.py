@@ -0,0 +1,173 @@
+"""
+Writer protocol for the append-only graph log.
+
+Every append happens under the exclusive ``graph_lock``, so records from
+concurrent processes never interleave. Within a process, threads appending
+at the same time are group-committed: the first one to arrive becomes the
+leader, takes the lock once, writes everything queued so far with a single
+write (and at most one fsync) and wakes the others.
+
+Because writers only ever append while holding the lock, an unterminated
+final line seen under the lock belongs to a writer that died mid-write;
+``recover_log`` truncates it before the next append.
+"""
+import os
+import threading
+from pathlib import Path
+
+from .locking import graph_lock
+
+# Bytes read per step when scanning backwards for the last complete line.
+RECOVERY_READ_SIZE = 1 << 16
+
+
+class VersionConflict(ValueError):
+    """An optimistic update or delete found the entity at a different version."""
+
+    def __init__(self, entity_id: str, expected: int, actual: int):
+        super().__init__(f"{entity_id}: expected version {expected}, found {actual}")
+        self.entity_id = entity_id
+        self.expected = expected
+        self.actual = actual
+
+
+def check_version(entity: dict, expected: int):
+    """Raise VersionConflict unless ``entity`` is at ``expected`` (None skips the check)."""
+    if expected is None:
+        return
+    actual = entity.get("version", 1)
+    if actual != expected:
+        raise VersionConflict(entity["id"], expected, actual)
+
+
+def _recover_fd(fd: int) -> int:
+    size = os.fstat(fd).st_size
+    if size == 0 or os.pread(fd, 1, size - 1) == b"\n":
+        return 0
+    end = size
+    while end > 0:
+        start = max(0, end - RECOVERY_READ_SIZE)
+        newline = os.pread(fd, end - start, start).rfind(b"\n")
+        if newline != -1:
+            end = start + newline + 1
+            break
+        end = start
+    os.ftruncate(fd, end)
+    return size - end
+
+
+def recover_log(graph_path) -> int:
+    """
+    Truncate a torn final line left by a crashed writer; returns the bytes
+    removed. The caller must hold the exclusive graph lock.
+    """
+    try:
+        fd = os.open(graph_path, os.O_RDWR)
+    except FileNotFoundError:
+        return 0
+    try:
+        return _recover_fd(fd)
+    finally:
+        os.close(fd)
+
+
+def write_locked(graph_path, data: bytes, fsync: bool = False) -> tuple[int, int, int]:
+    """
+    Append ``data`` to the log after recovering a torn tail. The caller must
+    hold the exclusive graph lock. Returns ``(inode, start, end)`` offsets.
+    """
+    fd = os.open(graph_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        _recover_fd(fd)
+        st = os.fstat(fd)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if fsync:
+            os.fsync(fd)
+        return st.st_ino, st.st_size, st.st_size + len(data)
+    finally:
+        os.close(fd)
+
+
+class _Entry:
+    __slots__ = ("data", "fsync", "on_commit", "seq", "error")
+
+    def __init__(self, data, fsync, on_commit, seq):
+        self.data = data
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self.seq = seq
+        self.error = None
+
+
+class GroupCommitter:
+    """Batches concurrent appends from threads of one process into one locked write."""
+
+    def __init__(self, graph_path):
+        self.graph_path = Path(graph_path)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._writing = False
+        self._next_seq = 0
+        self._committed_seq = 0
+
+    def append(self, data: bytes, fsync: bool = False, on_commit=None):
+        """
+        Append ``data`` (complete lines) and return once it is written, and
+        fsynced if requested. ``on_commit(inode, start, end)`` runs under the
+        lock right after the write.
+        """
+        with self._cond:
+            self._next_seq += 1
+            entry = _Entry(data, fsync, on_commit, self._next_seq)
+            self._queue.append(entry)
+            while self._writing and self._committed_seq < entry.seq:
+                self._cond.wait()
+            if self._committed_seq >= entry.seq:
+                # A leader wrote this entry for us
+                if entry.error is not None:
+                    raise entry.error
+                return
+            self._writing = True
+            batch, self._queue = self._queue, []
+
+        try:
+            self._commit(batch)
+        finally:
+            with self._cond:
+                self._writing = False
+                self._committed_seq = batch[-1].seq
+                self._cond.notify_all()
+        if entry.error is not None:
+            raise entry.error
+
+    def _commit(self, batch: list):
+        try:
+            with graph_lock(self.graph_path):
+                ino, start, _ = write_locked(self.graph_path, b"".join(e.data for e in batch),
+                                             any(e.fsync for e in batch))
+                for e in batch:
+                    end = start + len(e.data)
+                    if e.on_commit is not None:
+                        try:
+                            e.on_commit(ino, start, end)
+                        except Exception as error:
+                            e.error = error
+                    start = end
+        except Exception as error:
+            for e in batch:
+                e.error = error
+
+
+_committers = {}
+_committers_lock = threading.Lock()
+
+
+def committer(graph_path) -> GroupCommitter:
+    """The process-wide group committer for ``graph_path``."""
+    key = os.path.abspath(graph_path)
+    with _committers_lock:
+        if key not in _committers:
+            _committers[key] = GroupCommitter(key)
+        return _committers[key]
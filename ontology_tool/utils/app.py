@@ -2,6 +2,7 @@ import streamlit as st
 import json
 import os
 import sys
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -13,12 +14,14 @@ sys.path.append(str(Path(__file__).parent))
 from ontology_tool.core.manager import OntologyManager
 from ontology_tool.core.importer import DataImporter
 from ontology_tool.core.extractor import LLMExtractor
-from ontology_tool.core.exporter import RDFExporter
+from ontology_tool.core.exporter import RDFExporter, FORMATS as RDF_FORMATS
+from ontology_tool.core.views import MAX_NODES, degree_view, degrees, ego_view, page_view, summary_view
 from streamlit_agraph import agraph, Node, Edge, Config
 
 # Initialize components
 if 'manager' not in st.session_state:
-    st.session_state.manager = OntologyManager(graph_path="memory/ontology/tool_graph.jsonl")
+    # Resident: reruns apply only records appended since the last one instead of replaying the log
+    st.session_state.manager = OntologyManager(graph_path="memory/ontology/tool_graph.jsonl", resident=True)
 
 manager = st.session_state.manager
 importer = DataImporter(manager)
@@ -90,28 +93,106 @@ with tab1:
                 st.success(f"Imported {count} entities")
 
 # --- Tab 2: Visualize ---
+VIEWS = ["Type summary", "Neighborhood", "Most connected", "Pages"]
+
+
+def graph_version():
+    """Changes whenever the log does; keys the cached views below."""
+    try:
+        st_ = os.stat(manager.graph_path)
+    except FileNotFoundError:
+        return None
+    return st_.st_ino, st_.st_size, st_.st_mtime_ns
+
+
+# Views are cut down and laid out on the server (see core/views.py) and
+# cached per graph version, so reruns that only change the page or the
+# selection don't walk the graph again
+@st.cache_resource(max_entries=1, show_spinner="Counting edges...")
+def cached_degrees(version, _graph):
+    return degrees(_graph)
+
+
+@st.cache_data(max_entries=64, show_spinner="Building view...")
+def cached_view(version, kind, params, _graph, _counts):
+    options = dict(params)
+    if kind == "Type summary":
+        return summary_view(_graph)
+    if kind == "Neighborhood":
+        return ego_view(_graph, counts=_counts, **options)
+    if kind == "Most connected":
+        return degree_view(_graph, _counts, **options)
+    return page_view(_graph, counts=_counts, **options)
+
+
+def focus(entity_id):
+    st.session_state.viz_view = "Neighborhood"
+    st.session_state.viz_center = entity_id
+
+
 with tab2:
     st.header("Graph Visualization")
     
-    entities, relations = manager.load_graph()
+    graph = manager.load_ontology()
+    version = graph_version()
     
-    if not entities:
+    if not graph.entities:
         st.warning("Graph is empty. Add data first.")
     else:
-        nodes = []
-        edges = []
+        if "viz_view" not in st.session_state:
+            # Small graphs are shown whole; large ones start from the type-level overview
+            st.session_state.viz_view = "Pages" if len(graph.entities) <= MAX_NODES else "Type summary"
+        kind = st.radio("View", VIEWS, key="viz_view", horizontal=True)
+        counts = cached_degrees(version, graph) if kind != "Type summary" else None
+        type_names = [node["id"] for node in cached_view(version, "Type summary", (), graph, None)["nodes"]]
         
-        # Convert to agraph format
-        for eid, data in entities.items():
-            label = data["properties"].get("name", eid)
-            nodes.append(Node(id=eid, label=label, size=25, shape="dot"))
+        if kind == "Neighborhood":
+            col1, col2, col3 = st.columns([3, 1, 1])
+            center = col1.text_input("Entity ID", key="viz_center")
+            hops = col2.number_input("Hops", min_value=1, max_value=5, value=1)
+            max_nodes = col3.number_input("Max nodes", min_value=10, max_value=2000, value=MAX_NODES, step=50)
+            params = (("center", center.strip()), ("hops", int(hops)), ("max_nodes", int(max_nodes)))
+        elif kind == "Most connected":
+            col1, col2 = st.columns([3, 1])
+            type_name = col1.selectbox("Type", ["(all)"] + type_names)
+            max_nodes = col2.number_input("Max nodes", min_value=10, max_value=2000, value=MAX_NODES, step=50)
+            params = (("type_name", None if type_name == "(all)" else type_name), ("max_nodes", int(max_nodes)))
+        elif kind == "Pages":
+            col1, col2, col3 = st.columns([3, 1, 1])
+            type_name = col1.selectbox("Type", ["(all)"] + type_names)
+            page_size = col2.number_input("Page size", min_value=10, max_value=2000, value=MAX_NODES, step=50)
+            page = col3.number_input("Page", min_value=1, value=1)
+            params = (("type_name", None if type_name == "(all)" else type_name),
+                      ("page", int(page) - 1), ("page_size", int(page_size)))
+        else:
+            params = ()
+        
+        view = cached_view(version, kind, params, graph, counts)
+        
+        if kind == "Neighborhood" and not view["nodes"]:
+            st.info("Enter the ID of an entity, or select one in another view.")
+        else:
+            nodes = [Node(id=node["id"], label=node["label"], size=node["size"], shape="dot",
+                          title=f"{node['type']} · {node.get('count', node.get('degree'))}",
+                          x=node["x"], y=node["y"], group=node["type"])
+                     for node in view["nodes"]]
+            edges = [Edge(source=edge["from"], target=edge["to"],
+                          label=f"{edge['rel']} ({edge['count']})" if "count" in edge else edge["rel"])
+                     for edge in view["edges"]]
+            st.caption(f"{len(nodes)} of {len(graph.entities)} entities, {len(edges)} edges")
+            if view["truncated"]:
+                st.caption("The view was cut down; raise the limits or narrow it to see more.")
+            if kind == "Pages" and view["more"]:
+                st.caption("More entities on the next page.")
             
-        for rel in relations:
-            edges.append(Edge(source=rel["from"], target=rel["to"], label=rel["rel"]))
+            # Nodes arrive positioned, so the browser draws them without running physics
+            config = Config(width=800, height=600, directed=True, physics=False,
+                            nodeHighlightBehavior=True, highlightColor="#F7A7A6")
             
-        config = Config(width=800, height=600, directed=True, nodeHighlightBehavior=True, highlightColor="#F7A7A6")
-        
-        return_value = agraph(nodes=nodes, edges=edges, config=config)
+            selected = agraph(nodes=nodes, edges=edges, config=config)
+            if selected and kind != "Type summary" and selected in graph.entities:
+                st.json(graph.entities[selected])
+                st.button(f"Show the neighborhood of {selected}", on_click=focus, args=(selected,))
 
 # --- Tab 3: Export ---
 with tab3:
@@ -121,14 +202,29 @@ with tab3:
     stats = manager.get_stats()
     st.write(stats)
     
-    st.subheader("Download RDF (Turtle)")
-    rdf_data = exporter.export_turtle()
-    st.download_button(
-        label="Download .ttl",
-        data=rdf_data,
-        file_name="ontology.ttl",
-        mime="text/turtle"
-    )
+    st.subheader("Download RDF")
+    rdf_format = st.selectbox("Format", list(RDF_FORMATS), format_func=lambda f: f"{f} (.{RDF_FORMATS[f][0]})")
+    extension, mime = RDF_FORMATS[rdf_format]
+    # The exporter streams triples to a temporary file of this session's own
+    # (so concurrent sessions don't overwrite each other's export); the
+    # download button then reads that file whole
+    if st.button("Prepare export"):
+        with tempfile.NamedTemporaryFile(prefix="ontology-", suffix=f".{extension}", delete=False) as tmp:
+            export_path = Path(tmp.name)
+        exporter.write(export_path, rdf_format)
+        previous = st.session_state.get("export")
+        if previous is not None:
+            previous[1].unlink(missing_ok=True)
+        st.session_state.export = (rdf_format, export_path)
+    export = st.session_state.get("export")
+    if export is not None and export[0] == rdf_format and export[1].exists():
+        with open(export[1], "rb") as f:
+            st.download_button(
+                label=f"Download .{extension}",
+                data=f,
+                file_name=f"ontology.{extension}",
+                mime=mime
+            )
 
     st.subheader("Raw JSONL")
     with open(manager.graph_path, "r") as f:
@@ -5,24 +5,60 @@ Ontology graph operations: create, query, relate, validate.
 Usage:
     python ontology.py create --type Person --props '{"name":"Alice"}'
     python ontology.py get --id p_001
+    python ontology.py get --id p_001 --as-of 2024-05-01T12:00:00Z
+    python ontology.py history --id p_001
     python ontology.py query --type Task --where '{"status":"open"}'
+    python ontology.py query --type Task --where '{"priority":{"$in":["high","urgent"]}}' --order-by=-updated --limit 20
     python ontology.py relate --from proj_001 --rel has_task --to task_001
     python ontology.py related --id proj_001 --rel has_task
+    python ontology.py traverse --id proj_001 --rel has_task --rel assigned_to --depth 3
+    python ontology.py traverse --id proj_001 --to p_001
     python ontology.py list --type Person
+    python ontology.py search "Q3 migration" --type Task --limit 5
+    python ontology.py update --id task_001 --props '{"status":"done"}' --if-version 3
     python ontology.py delete --id p_001
     python ontology.py validate
+    python ontology.py compact --archive-days 30
+    python ontology.py convert --to segment
+    python ontology.py export --format ntriples --out ontology.nt
+    python ontology.py import csv --file people.csv --type Person --id-col id
+    python ontology.py import edges --file edges.csv --from-col src --to-col dst --rel blocks
+    python ontology.py serve
 """
 
 import argparse
 import json
 import os
+import sys
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 
+# Add project root to path (ensure 'ontology_tool' is importable)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ontology_tool.core.client import ServerError, connect
+from ontology_tool.core.exporter import DEFAULT_BASE, FORMATS as RDF_FORMATS, iter_rdf, write_rdf
+from ontology_tool.core.graph import OntologyGraph
+from ontology_tool.core.history import parse_as_of
+from ontology_tool.core.locking import graph_lock
+from ontology_tool.core.query import QueryError
+from ontology_tool.core.schema import SchemaViolation, compile_schema, index_specs, load_schema
+from ontology_tool.core.search import DEFAULT_LIMIT as SEARCH_LIMIT
+from ontology_tool.core.snapshot import DEFAULT_SNAPSHOT_THRESHOLD
+from ontology_tool.core.storage import BACKENDS, StorageError, convert, open_storage
+from ontology_tool.core.writer import VersionConflict, check_version, write_locked
+
 DEFAULT_GRAPH_PATH = "memory/ontology/tool_graph.jsonl"
 DEFAULT_SCHEMA_PATH = "memory/ontology/schema.yaml"
 
+# Commands a running graph server can answer instead of this process.
+SERVED_COMMANDS = {"create", "get", "query", "list", "update", "delete", "relate", "related", "traverse", "validate",
+                   "search"}
+
+# Tail size (bytes) after which load_graph refreshes the snapshot; set by --snapshot-threshold.
+SNAPSHOT_THRESHOLD = DEFAULT_SNAPSHOT_THRESHOLD
+
 
 def generate_id(type_name: str) -> str:
     """Generate a unique ID for an entity."""
@@ -31,61 +67,70 @@ def generate_id(type_name: str) -> str:
     return f"{prefix}_{suffix}"
 
 
-def load_graph(path: str) -> tuple[dict, list]:
+def load_graph(path: str, as_of: str = None) -> tuple[dict, list]:
     """Load entities and relations from graph file."""
-    entities = {}
-    relations = []
-    
-    graph_path = Path(path)
-    if not graph_path.exists():
-        return entities, relations
-    
-    with open(graph_path) as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            record = json.loads(line)
-            op = record.get("op")
-            
-            if op == "create":
-                entity = record["entity"]
-                entities[entity["id"]] = entity
-            elif op == "update":
-                entity_id = record["id"]
-                if entity_id in entities:
-                    entities[entity_id]["properties"].update(record.get("properties", {}))
-                    entities[entity_id]["updated"] = record.get("timestamp")
-            elif op == "delete":
-                entity_id = record["id"]
-                entities.pop(entity_id, None)
-            elif op == "relate":
-                relations.append({
-                    "from": record["from"],
-                    "rel": record["rel"],
-                    "to": record["to"],
-                    "properties": record.get("properties", {})
-                })
-            elif op == "unrelate":
-                relations = [r for r in relations 
-                           if not (r["from"] == record["from"] 
-                                  and r["rel"] == record["rel"] 
-                                  and r["to"] == record["to"])]
-    
-    return entities, relations
-
-
-def append_op(path: str, record: dict):
-    """Append an operation to the graph file."""
+    graph = load_ontology(path, as_of)
+    return graph.entities, graph.relations
+
+
+def load_ontology(path: str, as_of: str = None) -> OntologyGraph:
+    """
+    Load the graph from its snapshot plus the log tail, with adjacency indexes;
+    with ``as_of``, the graph as it was then, from the nearest checkpoint.
+    """
+    if as_of is not None:
+        return open_storage(path, SNAPSHOT_THRESHOLD).as_of(as_of)
+    return open_storage(path, SNAPSHOT_THRESHOLD).load(SNAPSHOT_THRESHOLD)[0]
+
+
+def append_op(path: str, record: dict, schema_path: str = None, check=None):
+    """
+    Append an operation to the graph file; with ``schema_path``, only if
+    ``check`` passes (see ``check_write``) under the same lock as the write.
+    """
     graph_path = Path(path)
     graph_path.parent.mkdir(parents=True, exist_ok=True)
     
-    with open(graph_path, "a") as f:
-        f.write(json.dumps(record) + "\n")
+    with graph_lock(graph_path):
+        if schema_path:
+            check_write(schema_path, graph_path, check)
+        write_locked(graph_path, (json.dumps(record) + "\n").encode())
+
+
+def append_checked(path: str, record: dict, entity_id: str, expected_version: int = None,
+                   schema_path: str = None, check=None) -> dict | None:
+    """
+    Append ``record`` if the entity exists and is at ``expected_version``
+    (and passes ``check`` when ``schema_path`` is given), holding the lock
+    from the read through the write. Returns the entity as it was just
+    before the write, or None if it no longer exists.
+    """
+    with graph_lock(path):
+        entity = get_entity(entity_id, path)
+        if entity is None:
+            return None
+        check_version(entity, expected_version)
+        if schema_path:
+            check_write(schema_path, path, check)
+        write_locked(path, (json.dumps(record) + "\n").encode())
+    return entity
 
 
-def create_entity(type_name: str, properties: dict, graph_path: str, entity_id: str = None) -> dict:
-    """Create a new entity."""
+def check_write(schema_path: str, graph_path, check):
+    """
+    Raise SchemaViolation if ``check(schema, graph)`` reports errors for the
+    touched entity or edge. ``graph`` is the storage's write view, which reads
+    only what the check asks for; callers hold the write lock.
+    """
+    with open_storage(graph_path, SNAPSHOT_THRESHOLD).write_view() as graph:
+        errors = check(compile_schema(schema_path), graph)
+    if errors:
+        raise SchemaViolation(errors)
+
+
+def create_entity(type_name: str, properties: dict, graph_path: str, entity_id: str = None,
+                  schema_path: str = None) -> dict:
+    """Create a new entity, validating it against the schema when schema_path is given."""
     entity_id = entity_id or generate_id(type_name)
     timestamp = datetime.now(timezone.utc).isoformat()
     
@@ -98,75 +143,72 @@ def create_entity(type_name: str, properties: dict, graph_path: str, entity_id:
     }
     
     record = {"op": "create", "entity": entity, "timestamp": timestamp}
-    append_op(graph_path, record)
+    append_op(graph_path, record, schema_path, lambda schema, graph: schema.check_entity(entity, graph))
     
     return entity
 
 
-def get_entity(entity_id: str, graph_path: str) -> dict | None:
-    """Get entity by ID."""
-    entities, _ = load_graph(graph_path)
-    return entities.get(entity_id)
+def get_entity(entity_id: str, graph_path: str, as_of: str = None) -> dict | None:
+    """Get entity by ID (a point lookup with segment or SQLite storage)."""
+    if as_of is not None:
+        return load_ontology(graph_path, as_of).entities.get(entity_id)
+    return open_storage(graph_path, SNAPSHOT_THRESHOLD).get_entity(entity_id)
 
 
-def query_entities(type_name: str, where: dict, graph_path: str) -> list:
-    """Query entities by type and properties."""
-    entities, _ = load_graph(graph_path)
-    results = []
-    
-    for entity in entities.values():
-        if type_name and entity["type"] != type_name:
-            continue
-        
-        match = True
-        for key, value in where.items():
-            if entity["properties"].get(key) != value:
-                match = False
-                break
-        
-        if match:
-            results.append(entity)
-    
-    return results
+def query_entities(type_name: str, where: dict, graph_path: str, schema_path: str = DEFAULT_SCHEMA_PATH,
+                   order_by: str = None, limit: int = None, offset: int = 0, cursor: str = None,
+                   as_of: str = None) -> tuple[list, str | None]:
+    """Query entities by type and properties; returns the page and the cursor for the next one."""
+    storage = open_storage(graph_path, SNAPSHOT_THRESHOLD)
+    indexes = index_specs(load_schema(schema_path))
+    if as_of is not None:
+        return storage.as_of(as_of, indexes).query_page(type_name, where, order_by, limit, offset, cursor)
+    return storage.query_page(type_name, where, order_by, limit, offset, cursor, indexes)
 
 
-def list_entities(type_name: str, graph_path: str) -> list:
+def list_entities(type_name: str, graph_path: str, as_of: str = None) -> list:
     """List all entities of a type."""
-    entities, _ = load_graph(graph_path)
+    entities, _ = load_graph(graph_path, as_of)
     if type_name:
         return [e for e in entities.values() if e["type"] == type_name]
     return list(entities.values())
 
 
-def update_entity(entity_id: str, properties: dict, graph_path: str) -> dict | None:
-    """Update entity properties."""
-    entities, _ = load_graph(graph_path)
-    if entity_id not in entities:
-        return None
-    
+def update_entity(entity_id: str, properties: dict, graph_path: str, schema_path: str = None,
+                  expected_version: int = None) -> dict | None:
+    """
+    Update entity properties, validating the result against the schema when
+    schema_path is given and checking the entity version when expected_version is.
+    """
     timestamp = datetime.now(timezone.utc).isoformat()
     record = {"op": "update", "id": entity_id, "properties": properties, "timestamp": timestamp}
-    append_op(graph_path, record)
+    entity = append_checked(graph_path, record, entity_id, expected_version, schema_path,
+                            lambda schema, graph: schema.check_update(graph.entities.get(entity_id), properties,
+                                                                      graph))
+    if entity is None:
+        return None
     
-    entities[entity_id]["properties"].update(properties)
-    entities[entity_id]["updated"] = timestamp
-    return entities[entity_id]
+    graph = OntologyGraph({entity_id: entity})
+    graph.apply(record)
+    return graph.entities[entity_id]
 
 
-def delete_entity(entity_id: str, graph_path: str) -> bool:
-    """Delete an entity."""
-    entities, _ = load_graph(graph_path)
-    if entity_id not in entities:
+def delete_entity(entity_id: str, graph_path: str, expected_version: int = None) -> bool:
+    """Delete an entity, optionally only if it is still at expected_version."""
+    if get_entity(entity_id, graph_path) is None:
         return False
     
     timestamp = datetime.now(timezone.utc).isoformat()
     record = {"op": "delete", "id": entity_id, "timestamp": timestamp}
-    append_op(graph_path, record)
-    return True
+    if expected_version is None:
+        append_op(graph_path, record)
+        return True
+    return append_checked(graph_path, record, entity_id, expected_version) is not None
 
 
-def create_relation(from_id: str, rel_type: str, to_id: str, properties: dict, graph_path: str):
-    """Create a relation between entities."""
+def create_relation(from_id: str, rel_type: str, to_id: str, properties: dict, graph_path: str,
+                    schema_path: str = None):
+    """Create a relation between entities, validating the edge against the schema when schema_path is given."""
     timestamp = datetime.now(timezone.utc).isoformat()
     record = {
         "op": "relate",
@@ -176,88 +218,52 @@ def create_relation(from_id: str, rel_type: str, to_id: str, properties: dict, g
         "properties": properties,
         "timestamp": timestamp
     }
-    append_op(graph_path, record)
+    append_op(graph_path, record, schema_path, lambda schema, graph: schema.check_relation(record, graph))
     return record
 
 
-def get_related(entity_id: str, rel_type: str, graph_path: str, direction: str = "outgoing") -> list:
+def get_related(entity_id: str, rel_type: str, graph_path: str, direction: str = "outgoing",
+                as_of: str = None) -> list:
     """Get related entities."""
-    entities, relations = load_graph(graph_path)
-    results = []
-    
-    for rel in relations:
-        if direction == "outgoing" and rel["from"] == entity_id:
-            if not rel_type or rel["rel"] == rel_type:
-                if rel["to"] in entities:
-                    results.append({
-                        "relation": rel["rel"],
-                        "entity": entities[rel["to"]]
-                    })
-        elif direction == "incoming" and rel["to"] == entity_id:
-            if not rel_type or rel["rel"] == rel_type:
-                if rel["from"] in entities:
-                    results.append({
-                        "relation": rel["rel"],
-                        "entity": entities[rel["from"]]
-                    })
-        elif direction == "both":
-            if rel["from"] == entity_id or rel["to"] == entity_id:
-                if not rel_type or rel["rel"] == rel_type:
-                    other_id = rel["to"] if rel["from"] == entity_id else rel["from"]
-                    if other_id in entities:
-                        results.append({
-                            "relation": rel["rel"],
-                            "direction": "outgoing" if rel["from"] == entity_id else "incoming",
-                            "entity": entities[other_id]
-                        })
-    
-    return results
+    if as_of is not None:
+        return load_ontology(graph_path, as_of).related(entity_id, rel_type, direction)
+    return open_storage(graph_path, SNAPSHOT_THRESHOLD).related(entity_id, rel_type, direction)
+
+
+def search_entities(query: str, graph_path: str, type_name: str = None, limit: int = SEARCH_LIMIT) -> list:
+    """Full-text search over string properties, best BM25 score first."""
+    return open_storage(graph_path, SNAPSHOT_THRESHOLD).search(query, type_name, limit)
+
+
+def entity_history(entity_id: str, graph_path: str) -> list:
+    """Every version of an entity, oldest first, read through the per-entity op index."""
+    return open_storage(graph_path, SNAPSHOT_THRESHOLD).history(entity_id)
+
+
+def traverse(entity_id: str, graph_path: str, rel_types: list = None, direction: str = "outgoing",
+             max_depth: int = None, strategy: str = "bfs") -> list:
+    """Multi-hop traversal from an entity over one loaded graph."""
+    return load_ontology(graph_path).traverse(entity_id, max_depth, rel_types, direction, strategy)
+
+
+def shortest_path(from_id: str, to_id: str, graph_path: str, rel_types: list = None,
+                  direction: str = "outgoing", max_depth: int = None) -> list | None:
+    """Fewest-hop path between two entities."""
+    return load_ontology(graph_path).shortest_path(from_id, to_id, rel_types, direction, max_depth)
 
 
 def validate_graph(graph_path: str, schema_path: str) -> list:
     """Validate graph against schema constraints."""
-    entities, relations = load_graph(graph_path)
-    errors = []
-    
-    # Load schema if exists
-    schema = {}
-    schema_file = Path(schema_path)
-    if schema_file.exists():
-        import yaml
-        with open(schema_file) as f:
-            schema = yaml.safe_load(f) or {}
-    
-    type_schemas = schema.get("types", {})
-    
-    for entity_id, entity in entities.items():
-        type_name = entity["type"]
-        type_schema = type_schemas.get(type_name, {})
-        
-        # Check required properties
-        required = type_schema.get("required", [])
-        for prop in required:
-            if prop not in entity["properties"]:
-                errors.append(f"{entity_id}: missing required property '{prop}'")
-        
-        # Check forbidden properties
-        forbidden = type_schema.get("forbidden_properties", [])
-        for prop in forbidden:
-            if prop in entity["properties"]:
-                errors.append(f"{entity_id}: contains forbidden property '{prop}'")
-        
-        # Check enum values
-        for prop, allowed in type_schema.items():
-            if prop.endswith("_enum"):
-                field = prop.replace("_enum", "")
-                value = entity["properties"].get(field)
-                if value and value not in allowed:
-                    errors.append(f"{entity_id}: '{field}' must be one of {allowed}, got '{value}'")
-    
-    return errors
+    return compile_schema(schema_path).validate(load_ontology(graph_path))
 
 
 def main():
     parser = argparse.ArgumentParser(description="Ontology graph operations")
+    parser.add_argument("--server", help="Graph server address (socket path or host:port); "
+                                         "defaults to the graph's socket when a server is running")
+    parser.add_argument("--no-server", action="store_true", help="Always operate on the graph file directly")
+    parser.add_argument("--snapshot-threshold", type=int, default=DEFAULT_SNAPSHOT_THRESHOLD,
+                        help="Refresh the load snapshot once the unreplayed log tail exceeds this many bytes")
     subparsers = parser.add_subparsers(dest="command", required=True)
     
     # Create
@@ -266,32 +272,61 @@ def main():
     create_p.add_argument("--props", "-p", default="{}", help="Properties JSON")
     create_p.add_argument("--id", help="Entity ID (auto-generated if not provided)")
     create_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    create_p.add_argument("--schema", "-s", default=DEFAULT_SCHEMA_PATH)
+    create_p.add_argument("--enforce-schema", action="store_true", help="Reject the entity if it violates the schema")
+    create_p.add_argument("--resolve", action="store_true",
+                          help="Merge into the existing entity with the same email, URL or a similar name")
     
     # Get
     get_p = subparsers.add_parser("get", help="Get entity by ID")
     get_p.add_argument("--id", required=True, help="Entity ID")
+    get_p.add_argument("--as-of", help="Read the graph as it was at this ISO 8601 time (UTC if no offset)")
     get_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
     
+    # History
+    history_p = subparsers.add_parser("history", help="Every version of an entity")
+    history_p.add_argument("--id", required=True, help="Entity ID")
+    history_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    
     # Query
     query_p = subparsers.add_parser("query", help="Query entities")
     query_p.add_argument("--type", "-t", help="Entity type")
-    query_p.add_argument("--where", "-w", default="{}", help="Filter JSON")
+    query_p.add_argument("--where", "-w", default="{}",
+                         help="Filter JSON; values may use $eq/$ne/$gt/$gte/$lt/$lte/$in/$prefix/$exists")
+    query_p.add_argument("--order-by", help="Sort field, '-' prefix for descending (e.g. --order-by=-updated)")
+    query_p.add_argument("--limit", type=int, help="Maximum number of results")
+    query_p.add_argument("--offset", type=int, default=0, help="Number of results to skip")
+    query_p.add_argument("--cursor", help="Cursor from a previous page (requires --order-by)")
+    query_p.add_argument("--as-of", help="Read the graph as it was at this ISO 8601 time (UTC if no offset)")
     query_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    query_p.add_argument("--schema", "-s", default=DEFAULT_SCHEMA_PATH)
     
     # List
     list_p = subparsers.add_parser("list", help="List entities")
     list_p.add_argument("--type", "-t", help="Entity type")
+    list_p.add_argument("--as-of", help="Read the graph as it was at this ISO 8601 time (UTC if no offset)")
     list_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
     
+    # Search
+    search_p = subparsers.add_parser("search", help="Full-text search over entity properties")
+    search_p.add_argument("text", help="Words to search for (English or CJK)")
+    search_p.add_argument("--type", "-t", help="Entity type")
+    search_p.add_argument("--limit", type=int, default=SEARCH_LIMIT, help="Maximum number of results")
+    search_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    
     # Update
     update_p = subparsers.add_parser("update", help="Update entity")
     update_p.add_argument("--id", required=True, help="Entity ID")
     update_p.add_argument("--props", "-p", required=True, help="Properties JSON")
     update_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    update_p.add_argument("--schema", "-s", default=DEFAULT_SCHEMA_PATH)
+    update_p.add_argument("--enforce-schema", action="store_true", help="Reject the update if the result violates the schema")
+    update_p.add_argument("--if-version", type=int, help="Only update if the entity is still at this version")
     
     # Delete
     delete_p = subparsers.add_parser("delete", help="Delete entity")
     delete_p.add_argument("--id", required=True, help="Entity ID")
+    delete_p.add_argument("--if-version", type=int, help="Only delete if the entity is still at this version")
     delete_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
     
     # Relate
@@ -301,73 +336,280 @@ def main():
     relate_p.add_argument("--to", dest="to_id", required=True, help="To entity ID")
     relate_p.add_argument("--props", "-p", default="{}", help="Relation properties JSON")
     relate_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    relate_p.add_argument("--schema", "-s", default=DEFAULT_SCHEMA_PATH)
+    relate_p.add_argument("--enforce-schema", action="store_true", help="Reject the edge if it violates the schema")
     
     # Related
     related_p = subparsers.add_parser("related", help="Get related entities")
     related_p.add_argument("--id", required=True, help="Entity ID")
     related_p.add_argument("--rel", "-r", help="Relation type filter")
     related_p.add_argument("--dir", "-d", choices=["outgoing", "incoming", "both"], default="outgoing")
+    related_p.add_argument("--as-of", help="Read the graph as it was at this ISO 8601 time (UTC if no offset)")
     related_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
     
+    # Traverse
+    traverse_p = subparsers.add_parser("traverse", help="Multi-hop traversal or shortest path")
+    traverse_p.add_argument("--id", required=True, help="Start entity ID")
+    traverse_p.add_argument("--to", dest="to_id", help="Target entity ID (returns the shortest path)")
+    traverse_p.add_argument("--rel", "-r", action="append", help="Relation type filter (repeatable)")
+    traverse_p.add_argument("--dir", "-d", choices=["outgoing", "incoming", "both"], default="outgoing")
+    traverse_p.add_argument("--depth", type=int, help="Maximum number of hops")
+    traverse_p.add_argument("--mode", choices=["bfs", "dfs"], default="bfs")
+    traverse_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    
     # Validate
     validate_p = subparsers.add_parser("validate", help="Validate graph")
     validate_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
     validate_p.add_argument("--schema", "-s", default=DEFAULT_SCHEMA_PATH)
     
+    # Compact
+    compact_p = subparsers.add_parser("compact", help="Rewrite graph log to its live state")
+    compact_p.add_argument("--archive-days", type=int,
+                           help="Only fold history older than N days, archiving the raw records")
+    compact_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    
+    # Convert storage
+    convert_p = subparsers.add_parser("convert", help="Switch the graph between JSONL, binary segment and SQLite storage")
+    convert_p.add_argument("--to", required=True, choices=BACKENDS, help="Target storage backend")
+    convert_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    
+    # Export
+    export_p = subparsers.add_parser("export", help="Stream the graph out as RDF")
+    export_p.add_argument("--format", "-f", default="turtle", choices=list(RDF_FORMATS))
+    export_p.add_argument("--out", "-o", help="Output file (default: stdout)")
+    export_p.add_argument("--base", default=DEFAULT_BASE, help="Base IRI for entities, types and properties")
+    export_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    
+    # Import
+    import_p = subparsers.add_parser("import", help="Bulk import entities or edges from a file")
+    import_p.add_argument("format", choices=["csv", "json", "edges"],
+                          help="Input format (json: JSON array, object or NDJSON; edges: edge-list CSV)")
+    import_p.add_argument("--file", "-f", required=True, help="Input file")
+    import_p.add_argument("--type", "-t", help="Entity type (csv, json)")
+    import_p.add_argument("--id-col", help="CSV column / JSON field holding entity IDs")
+    import_p.add_argument("--batch-size", type=int, default=10000, help="JSON records per append")
+    import_p.add_argument("--mapping", help="CSV column to property mapping JSON")
+    import_p.add_argument("--from-col", help="Edge-list column holding source IDs")
+    import_p.add_argument("--to-col", help="Edge-list column holding target IDs")
+    import_p.add_argument("--rel", "-r", help="Relation type for every edge")
+    import_p.add_argument("--rel-col", help="Edge-list column holding relation types")
+    import_p.add_argument("--resolve", action="store_true",
+                          help="Upsert rows onto the entities they resolve to instead of always creating (csv, json)")
+    import_p.add_argument("--schema", "-s", default=DEFAULT_SCHEMA_PATH)
+    import_p.add_argument("--enforce-schema", action="store_true",
+                          help="Validate every row against the schema; the first violation stops the import")
+    import_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    
+    # Serve
+    serve_p = subparsers.add_parser("serve", help="Keep the graph in memory and serve operations")
+    serve_p.add_argument("--socket", help="Unix socket path (default: <graph>.sock)")
+    serve_p.add_argument("--port", type=int, help="Serve on loopback TCP instead of a Unix socket")
+    serve_p.add_argument("--host", default="127.0.0.1", help="Loopback address to bind with --port")
+    serve_p.add_argument("--graph", "-g", default=DEFAULT_GRAPH_PATH)
+    serve_p.add_argument("--schema", "-s", default=DEFAULT_SCHEMA_PATH)
+    serve_p.add_argument("--enforce-schema", action="store_true", help="Reject writes that violate the schema")
+    serve_p.add_argument("--compact-memory", action="store_true",
+                         help="Hold the graph in the compact in-memory model (large graphs)")
+    
     args = parser.parse_args()
     
+    global SNAPSHOT_THRESHOLD
+    SNAPSHOT_THRESHOLD = args.snapshot_threshold
+    if getattr(args, "as_of", None):
+        try:
+            args.as_of = parse_as_of(args.as_of)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    # Forward to a running graph server for this graph, if there is one
+    # (historical reads replay the log here; the server holds only the current state)
+    server = None
+    if args.command in SERVED_COMMANDS and not args.no_server and not getattr(args, "as_of", None):
+        server = connect(args.server, args.graph)
+    # Write-time validation of the touched entity or edge (forwarded writes are
+    # checked by the server, against the schema it was started with)
+    enforced_schema = args.schema if getattr(args, "enforce_schema", False) else None
+    
+    try:
+        run_command(args, parser, server, enforced_schema)
+    except VersionConflict as e:
+        print(f"Conflict: {e}")
+        sys.exit(1)
+    except (SchemaViolation, ServerError) as e:
+        errors = e.errors if isinstance(e, SchemaViolation) else [str(e)]
+        print("Rejected:" if isinstance(e, SchemaViolation) else "Server error:")
+        for err in errors:
+            print(f"  - {err}")
+        sys.exit(1)
+    except (QueryError, StorageError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+def run_command(args, parser, server, enforced_schema):
+    
     if args.command == "create":
         props = json.loads(args.props)
-        entity = create_entity(args.type, props, args.graph, args.id)
+        if args.resolve:
+            if server:
+                entity = server.call("upsert", enforce_schema=bool(enforced_schema), type_name=args.type,
+                                     properties=props, entity_id=args.id)
+            else:
+                from ontology_tool.core.manager import OntologyManager
+                manager = OntologyManager(args.graph, args.schema, enforce_schema=bool(enforced_schema))
+                entity = manager.upsert_entity(args.type, props, args.id)
+        elif server:
+            entity = server.call("create", enforce_schema=bool(enforced_schema), type_name=args.type,
+                                 properties=props, entity_id=args.id)
+        else:
+            entity = create_entity(args.type, props, args.graph, args.id, enforced_schema)
         print(json.dumps(entity, indent=2))
     
     elif args.command == "get":
-        entity = get_entity(args.id, args.graph)
+        entity = server.call("get", entity_id=args.id) if server else get_entity(args.id, args.graph, args.as_of)
         if entity:
             print(json.dumps(entity, indent=2))
         else:
             print(f"Entity not found: {args.id}")
     
+    elif args.command == "history":
+        versions = entity_history(args.id, args.graph)
+        if versions:
+            print(json.dumps(versions, indent=2))
+        else:
+            print(f"No history for: {args.id}")
+    
     elif args.command == "query":
         where = json.loads(args.where)
-        results = query_entities(args.type, where, args.graph)
+        if server:
+            results, next_cursor = server.call("query", type_name=args.type, where=where, order_by=args.order_by,
+                                               limit=args.limit, offset=args.offset, cursor=args.cursor)
+        else:
+            results, next_cursor = query_entities(args.type, where, args.graph, args.schema,
+                                                  args.order_by, args.limit, args.offset, args.cursor, args.as_of)
         print(json.dumps(results, indent=2))
+        if next_cursor:
+            print(f"Next cursor: {next_cursor}", file=sys.stderr)
     
     elif args.command == "list":
-        results = list_entities(args.type, args.graph)
+        results = server.call("list", type_name=args.type) if server else list_entities(args.type, args.graph, args.as_of)
         print(json.dumps(results, indent=2))
     
+    elif args.command == "search":
+        if server:
+            results = server.call("search", query=args.text, type_name=args.type, limit=args.limit)
+        else:
+            results = search_entities(args.text, args.graph, args.type, args.limit)
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    
     elif args.command == "update":
         props = json.loads(args.props)
-        entity = update_entity(args.id, props, args.graph)
+        if server:
+            entity = server.call("update", enforce_schema=bool(enforced_schema), entity_id=args.id,
+                                 properties=props, expected_version=args.if_version)
+        else:
+            entity = update_entity(args.id, props, args.graph, enforced_schema, args.if_version)
         if entity:
             print(json.dumps(entity, indent=2))
         else:
             print(f"Entity not found: {args.id}")
     
     elif args.command == "delete":
-        if delete_entity(args.id, args.graph):
+        if server:
+            deleted = server.call("delete", entity_id=args.id, expected_version=args.if_version)
+        else:
+            deleted = delete_entity(args.id, args.graph, args.if_version)
+        if deleted:
             print(f"Deleted: {args.id}")
         else:
             print(f"Entity not found: {args.id}")
     
     elif args.command == "relate":
         props = json.loads(args.props)
-        rel = create_relation(args.from_id, args.rel, args.to_id, props, args.graph)
+        if server:
+            rel = server.call("relate", enforce_schema=bool(enforced_schema), from_id=args.from_id,
+                              rel_type=args.rel, to_id=args.to_id, properties=props)
+        else:
+            rel = create_relation(args.from_id, args.rel, args.to_id, props, args.graph, enforced_schema)
         print(json.dumps(rel, indent=2))
     
     elif args.command == "related":
-        results = get_related(args.id, args.rel, args.graph, args.dir)
+        if server:
+            results = server.call("related", entity_id=args.id, rel_type=args.rel, direction=args.dir)
+        else:
+            results = get_related(args.id, args.rel, args.graph, args.dir, args.as_of)
         print(json.dumps(results, indent=2))
     
+    elif args.command == "traverse":
+        if args.to_id:
+            if server:
+                path = server.call("path", from_id=args.id, to_id=args.to_id, rel_types=args.rel,
+                                   direction=args.dir, max_depth=args.depth)
+            else:
+                path = shortest_path(args.id, args.to_id, args.graph, args.rel, args.dir, args.depth)
+            if path is None:
+                print(f"No path from {args.id} to {args.to_id}")
+            else:
+                print(json.dumps(path, indent=2))
+        else:
+            if server:
+                results = server.call("traverse", entity_id=args.id, max_depth=args.depth, rel_types=args.rel,
+                                      direction=args.dir, strategy=args.mode)
+            else:
+                results = traverse(args.id, args.graph, args.rel, args.dir, args.depth, args.mode)
+            print(json.dumps(results, indent=2))
+    
     elif args.command == "validate":
-        errors = validate_graph(args.graph, args.schema)
+        errors = server.call("validate") if server else validate_graph(args.graph, args.schema)
         if errors:
             print("Validation errors:")
             for err in errors:
                 print(f"  - {err}")
         else:
             print("Graph is valid.")
+    
+    elif args.command == "compact":
+        stats = open_storage(args.graph, SNAPSHOT_THRESHOLD).compact(args.archive_days)
+        print(json.dumps(stats, indent=2))
+    
+    elif args.command == "convert":
+        stats = convert(args.graph, args.to)
+        print(json.dumps(stats, indent=2))
+    
+    elif args.command == "export":
+        entities, relations = open_storage(args.graph, SNAPSHOT_THRESHOLD).iter_state()
+        write_rdf(args.out or sys.stdout, iter_rdf(entities, relations, args.format, args.base))
+    
+    elif args.command == "import":
+        from ontology_tool.core.importer import DataImporter
+        from ontology_tool.core.manager import OntologyManager
+        importer = DataImporter(OntologyManager(args.graph, args.schema, enforce_schema=bool(enforced_schema)))
+        mapping = json.loads(args.mapping) if args.mapping else None
+        if args.format == "edges":
+            if not (args.from_col and args.to_col):
+                parser.error("import edges requires --from-col and --to-col")
+            count = importer.import_relations_csv(args.file, args.from_col, args.to_col,
+                                                  args.rel, args.rel_col, mapping)
+            print(f"Imported {count} relations")
+        else:
+            if not args.type:
+                parser.error(f"import {args.format} requires --type")
+            if args.format == "csv":
+                count = importer.import_csv(args.file, args.type, args.id_col, mapping, resolve=args.resolve)
+                print(f"Imported {count} entities")
+            else:
+                with open(args.file, "rb") as f:
+                    stats = importer.import_json_stream(f, args.type, args.batch_size, args.id_col,
+                                                        resolve=args.resolve)
+                print(f"Imported {stats['imported']} entities, rejected {stats['rejected']} "
+                      f"({stats['records_per_sec']:.0f} records/s)")
+    
+    elif args.command == "serve":
+        from ontology_tool.core.server import serve
+        try:
+            serve(args.graph, args.schema, args.socket, args.host, args.port, args.enforce_schema, args.compact_memory)
+        except ValueError as e:
+            parser.error(str(e))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from ontology_tool.core.manager import OntologyManager
+
+SCHEMA = """
+Person:
+  required: [name]
+  properties:
+    name: string
+    age: number
+    manager: ref(Person)
+reports_to:
+  from_types: [Person]
+  to_types: [Person]
+  cardinality: many_to_one
+  acyclic: true
+"""
+
+
+@pytest.fixture
+def graph_path(tmp_path):
+    return tmp_path / "graph.jsonl"
+
+
+@pytest.fixture
+def schema_path(tmp_path):
+    path = tmp_path / "schema.yaml"
+    path.write_text(SCHEMA)
+    return path
+
+
+@pytest.fixture
+def manager(graph_path, schema_path):
+    return OntologyManager(graph_path, schema_path)
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from ontology_tool.core import compact_graph
+from ontology_tool.core.compact_graph import CompactGraph
+from ontology_tool.core.graph import OntologyGraph
+from ontology_tool.core.manager import OntologyManager
+
+IDS = [f"e{i}" for i in range(10)]
+RELS = ["a", "b", "c"]
+FILTERS = [None, ["a"], ["b", "a"], ["c", "b", "a"]]
+
+
+def assert_same(expected: OntologyGraph, actual: CompactGraph):
+    assert {k: dict(v, properties=v["properties"]) for k, v in expected.entities.items()} == dict(actual.entities.items())
+    for entity_id in IDS:
+        for direction in ("outgoing", "incoming", "both"):
+            for rel_types in FILTERS:
+                assert list(actual.neighbors(entity_id, rel_types, direction)) == \
+                    list(expected.neighbors(entity_id, rel_types, direction)), (entity_id, direction, rel_types)
+            assert actual.related(entity_id, None, direction) == expected.related(entity_id, None, direction)
+            assert actual.traverse(entity_id, None, None, direction) == expected.traverse(entity_id, None, None, direction)
+
+
+@pytest.mark.parametrize("min_overlay", [1, 5, 40, 1000])
+@pytest.mark.parametrize("seed", range(6))
+def test_matches_dict_graph(monkeypatch, seed, min_overlay):
+    """Random relates, unrelates, deletes and merges give the dict graph's answers, in its order."""
+    monkeypatch.setattr(compact_graph, "MIN_OVERLAY_EDGES", min_overlay)
+    monkeypatch.setattr(compact_graph, "OVERLAY_FRACTION", 0.3)
+    rnd = random.Random(seed)
+    expected, actual = OntologyGraph(), CompactGraph()
+    for entity_id in IDS:
+        record = {"op": "create", "entity": {"id": entity_id, "type": "T", "properties": {"k": entity_id}}}
+        expected.apply(record)
+        actual.apply(record)
+    for step in range(250):
+        source, target, rel = rnd.choice(IDS), rnd.choice(IDS), rnd.choice(RELS)
+        roll = rnd.random()
+        if roll < 0.6:
+            record = {"op": "relate", "from": source, "rel": rel, "to": target,
+                      "properties": {"step": step} if rnd.random() < 0.3 else {}}
+        elif roll < 0.9:
+            if expected.edges and rnd.random() < 0.8:
+                source, rel, target = rnd.choice(list(expected.edges))
+            record = {"op": "unrelate", "from": source, "rel": rel, "to": target}
+        elif roll < 0.95:
+            record = {"op": "update", "id": source, "properties": {"step": step}}
+        else:
+            actual.freeze()
+            continue
+        expected.apply(record)
+        actual.apply(record)
+        if step % 25 == 0:
+            assert_same(expected, actual)
+    assert_same(expected, actual)
+    rebuilt = CompactGraph.from_graph(expected)
+    for entity_id in IDS:
+        assert list(rebuilt.neighbors(entity_id, None, "both")) == list(expected.neighbors(entity_id, None, "both"))
+
+
+def test_compact_manager_reads_like_the_dict_one(graph_path):
+    manager = OntologyManager(graph_path)
+    for i in range(30):
+        manager.create_entity("Task", {"title": f"t{i}", "n": i % 7}, f"t{i}")
+    for i in range(1, 30):
+        manager.create_relation(f"t{i // 2}", "parent_of" if i % 3 else "blocks", f"t{i}", {"w": i})
+    manager.delete_entity("t29")
+    compact = OntologyManager(graph_path, compact_memory=True)
+    plain = OntologyManager(graph_path, resident=True)
+    for entity_id in ("t0", "t1", "t5", "t14"):
+        assert compact.get_entity(entity_id) == plain.get_entity(entity_id)
+        assert compact.get_related(entity_id, direction="both") == plain.get_related(entity_id, direction="both")
+        assert compact.traverse(entity_id) == plain.traverse(entity_id)
+    assert compact.query_entities("Task", {"n": {"$gte": 5}}, order_by="-n") == \
+        plain.query_entities("Task", {"n": {"$gte": 5}}, order_by="-n")
+    assert compact.shortest_path("t0", "t28") == plain.shortest_path("t0", "t28")
@@ -0,0 +1,57 @@
+from ontology_tool.core.extractor import LLMExtractor, chunk_text
+from ontology_tool.core.fake_llm import FakeExtractionModel
+from ontology_tool.core.manager import OntologyManager
+
+TEXT = "Alice Smith met Bruno Okafor in Lagos. Then, Chen Wang joined Alice Smith.\n\nDana Garcia stayed home."
+
+
+def extractor(graph_path, tmp_path, **options):
+    options.setdefault("retry_delay", 0)
+    return LLMExtractor(OntologyManager(graph_path), llm=FakeExtractionModel(), cache_dir=tmp_path / "cache", **options)
+
+
+def test_chunks_cover_the_text():
+    text = "".join(f"Sentence number {i}. " for i in range(500))
+    chunks = chunk_text(text, size=1000, overlap=100)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert all(sentence in "".join(chunks) for sentence in text.split(". "))
+
+
+def test_extracts_entities_and_relations(graph_path, tmp_path):
+    [result] = extractor(graph_path, tmp_path).extract_documents([TEXT])
+    assert {e.properties["name"] for e in result.entities} == {"Alice Smith", "Bruno Okafor", "Chen Wang", "Dana Garcia"}
+    manager = OntologyManager(graph_path)
+    assert len(manager.list_entities("Person")) == 4
+    alice = next(e for e in manager.list_entities("Person") if e["properties"]["name"] == "Alice Smith")
+    assert {r["entity"]["properties"]["name"] for r in manager.get_related(alice["id"], direction="both")} == \
+        {"Bruno Okafor", "Chen Wang"}
+
+
+def test_rerun_hits_the_cache_and_adds_nothing(graph_path, tmp_path):
+    first = extractor(graph_path, tmp_path)
+    first.extract_documents([TEXT])
+    stats = OntologyManager(graph_path).get_stats()
+    second = extractor(graph_path, tmp_path)
+    second.extract_documents([TEXT])
+    assert second.llm.calls == 0
+    assert OntologyManager(graph_path).get_stats() == stats
+
+
+def test_resolves_onto_existing_entities(graph_path, tmp_path):
+    manager = OntologyManager(graph_path)
+    manager.create_entity("Person", {"name": "Alice Smith", "email": "alice@example.com"}, "p_alice")
+    extractor(graph_path, tmp_path).extract_documents([TEXT])
+    people = OntologyManager(graph_path).list_entities("Person")
+    assert [e["id"] for e in people if e["properties"]["name"] == "Alice Smith"] == ["p_alice"]
+    assert OntologyManager(graph_path).get_related("p_alice", direction="both")
+
+
+def test_failed_chunks_are_retried_on_the_next_run(graph_path, tmp_path):
+    flaky = extractor(graph_path, tmp_path, max_retries=0)
+    flaky.llm.failure_rate = 1.0
+    assert flaky.extract_documents([TEXT]) == [None]
+    assert OntologyManager(graph_path).list_entities() == []
+    retry = extractor(graph_path, tmp_path)
+    assert retry.extract_documents([TEXT])[0] is not None
+    assert retry.llm.calls == 1
@@ -0,0 +1,86 @@
+import io
+import json
+
+import pytest
+
+from ontology_tool.core.importer import DataImporter, _Rejected, iter_json_values
+from ontology_tool.core.manager import OntologyManager
+from ontology_tool.core.schema import SchemaViolation
+
+FLOATS = [0.1, 0.1 + 0.2, 1 / 3, 1e-300, 2.5e20, 123456789.12345679, -0.0]
+
+
+def values(text: str, read_size: int) -> list:
+    return ["rejected" if isinstance(v, _Rejected) else v for v in iter_json_values(io.BytesIO(text.encode()), read_size)]
+
+
+def test_csv_floats_round_trip(graph_path):
+    manager = OntologyManager(graph_path)
+    rows = "\n".join(f"e{i},{value!r},{i},label {i}" for i, value in enumerate(FLOATS))
+    DataImporter(manager).import_csv(io.StringIO("id,x,n,label\n" + rows + "\ne9,,9,\n"), "Item", id_col="id")
+    for i, value in enumerate(FLOATS):
+        properties = manager.get_entity(f"e{i}")["properties"]
+        assert properties == {"id": f"e{i}", "x": value, "n": i, "label": f"label {i}"}
+    # Missing values are left out rather than written as NaN
+    assert manager.get_entity("e9")["properties"] == {"id": "e9", "n": 9}
+    for line in graph_path.read_text().splitlines():
+        json.loads(line)
+
+
+def test_edge_list_import(graph_path):
+    manager = OntologyManager(graph_path)
+    csv = "src,dst,kind,weight\na,b,blocks,0.5\nb,c,,1.0\n,c,blocks,2.0\nc,a,owns,\n"
+    assert DataImporter(manager).import_relations_csv(io.StringIO(csv), "src", "dst", rel_col="kind") == 2
+    assert [(r["from"], r["rel"], r["to"], r["properties"]) for r in manager.load_graph()[1]] == \
+        [("a", "blocks", "b", {"weight": 0.5}), ("c", "owns", "a", {})]
+    with pytest.raises(ValueError):
+        DataImporter(manager).import_relations_csv(io.StringIO(csv), "src", "dst")
+
+
+def test_enforced_imports_are_validated(graph_path, schema_path):
+    manager = OntologyManager(graph_path, schema_path, enforce_schema=True)
+    importer = DataImporter(manager)
+    assert importer.import_csv(io.StringIO("id,name,age\na,A,1\nb,B,2\nc,C,3\n"), "Person", id_col="id") == 3
+    # A ref resolves against a row earlier in the same chunk
+    assert importer.import_csv(io.StringIO("id,name,manager\nd,D,\ne,E,d\n"), "Person", id_col="id") == 2
+    for csv in ["id,name\nx,\n", "id,name,manager\nx,X,zz\n", "id,name,age\nx,X,old\n"]:
+        with pytest.raises(SchemaViolation):
+            importer.import_csv(io.StringIO(csv), "Person", id_col="id")
+    assert importer.import_relations_csv(io.StringIO("s,t\na,b\nb,c\n"), "s", "t", rel_type="reports_to") == 2
+    # Cardinality and cycles are checked against edges earlier in the chunk too
+    for csv in ["s,t\nd,e\nd,a\n", "s,t\nd,e\ne,d\n", "s,t\nc,a\n", "s,t\nzz,a\n"]:
+        with pytest.raises(SchemaViolation):
+            importer.import_relations_csv(io.StringIO(csv), "s", "t", rel_type="reports_to")
+    reread = OntologyManager(graph_path, schema_path)
+    assert reread.get_entity("x") is None
+    assert reread.validate() == []
+
+
+def test_resolving_import_upserts(graph_path):
+    manager = OntologyManager(graph_path)
+    importer = DataImporter(manager)
+    importer.import_csv(io.StringIO("name,email\nAna Garcia,ana@example.com\n"), "Person")
+    importer.import_csv(io.StringIO("name,email,age\nAna G.,ANA@example.com,30\n"), "Person", resolve=True)
+    [person] = manager.list_entities("Person")
+    assert person["properties"] == {"name": "Ana G.", "email": "ANA@example.com", "age": 30}
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 64, 1 << 16])
+def test_json_values_stream(read_size):
+    data = [{"a": i, "s": "x" * i + "中"} for i in range(40)] + [12345, "str", [1, 2], None, 1.5e10]
+    assert values(json.dumps(data, indent=1), read_size) == data
+    assert values("\n".join(json.dumps(d) for d in data) + "\n", read_size) == data
+    assert values('{"a":1}\n{"b":\n{"c":3}\n  \nnot json\n{"d":[1,2]}', read_size) == \
+        [{"a": 1}, "rejected", {"c": 3}, "rejected", {"d": [1, 2]}]
+    assert values("", read_size) == []
+
+
+def test_json_stream_import(graph_path):
+    manager = OntologyManager(graph_path)
+    ndjson = "".join(json.dumps({"id": f"n{i}", "title": f"t{i}"}) + "\n" for i in range(25)) + "garbage\n42\n"
+    seen = []
+    stats = DataImporter(manager).import_json_stream(io.BytesIO(ndjson.encode()), "Note", id_field="id",
+                                                     batch_size=10, progress=lambda s: seen.append(s["imported"]))
+    assert (stats["imported"], stats["rejected"]) == (25, 2)
+    assert seen == [10, 20, 25]
+    assert manager.get_entity("n24")["properties"] == {"id": "n24", "title": "t24"}
@@ -0,0 +1,67 @@
+import pytest
+
+from ontology_tool.core.query import QueryError, compile_where, execute
+
+TASKS = [
+    {"id": f"t{i}", "type": "Task", "properties": props}
+    for i, props in enumerate([
+        {"title": "Q3 migration", "priority": 3, "status": "open"},
+        {"title": "Q3 review", "priority": 1, "status": "blocked"},
+        {"title": "Hiring", "priority": 2, "status": "done"},
+        {"title": "Q4 plan", "status": "open"},
+        {"title": "Audit", "priority": 5, "status": None},
+    ])
+]
+
+
+def ids(where, **options):
+    page, _ = execute(TASKS, compile_where(where), **options)
+    return [entity["id"] for entity in page]
+
+
+@pytest.mark.parametrize("where, expected", [
+    ({"status": "open"}, ["t0", "t3"]),
+    ({"status": {"$eq": None}}, ["t4"]),
+    ({"status": {"$ne": "open"}}, ["t1", "t2", "t4"]),
+    ({"priority": {"$gt": 2}}, ["t0", "t4"]),
+    ({"priority": {"$gte": 2, "$lt": 5}}, ["t0", "t2"]),
+    ({"priority": {"$lte": 1}}, ["t1"]),
+    ({"status": {"$in": ["open", "blocked"]}}, ["t0", "t1", "t3"]),
+    ({"title": {"$prefix": "Q3"}}, ["t0", "t1"]),
+    ({"priority": {"$exists": False}}, ["t3"]),
+    ({"title": {"$gt": 3}}, []),
+])
+def test_operators(where, expected):
+    assert ids(where) == expected
+
+
+def test_unknown_operator():
+    with pytest.raises(QueryError):
+        compile_where({"priority": {"$near": 3}})
+
+
+def test_order_by_puts_missing_values_last():
+    assert ids({}, order_by="priority") == ["t1", "t2", "t0", "t4", "t3"]
+    assert ids({}, order_by="-priority") == ["t4", "t0", "t2", "t1", "t3"]
+
+
+def test_cursor_pages_through_every_match_once():
+    seen, cursor = [], None
+    while True:
+        page, cursor = execute(TASKS, [], order_by="-priority", limit=2, cursor=cursor)
+        seen.extend(entity["id"] for entity in page)
+        if cursor is None:
+            break
+    assert seen == ids({}, order_by="-priority")
+
+
+def test_offset_and_limit():
+    assert ids({}, limit=2, offset=1) == ["t1", "t2"]
+    assert ids({}, order_by="id", limit=0) == []
+
+
+@pytest.mark.parametrize("options", [{"limit": -1}, {"offset": -1}, {"limit": 2, "cursor": "abc"},
+                                     {"order_by": "id", "limit": 2, "cursor": "not a cursor"}])
+def test_bad_pagination(options):
+    with pytest.raises(QueryError):
+        execute(TASKS, [], **options)
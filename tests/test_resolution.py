@@ -0,0 +1,57 @@
+from ontology_tool.core.manager import OntologyManager
+from ontology_tool.core.resolution import EntityResolver, normalize_email, normalize_name, normalize_url
+
+
+def test_normalization():
+    assert normalize_name("  José   GARCÍA ") == "jose garcia"
+    assert normalize_email(" Ana@Example.COM ") == "ana@example.com"
+    assert normalize_url("https://www.Example.com/about/") == normalize_url("example.com/about")
+
+
+def test_exact_keys_before_fuzzy_names():
+    resolver = EntityResolver.from_entities([
+        {"id": "p1", "type": "Person", "properties": {"name": "Ana Garcia", "email": "ana@example.com"}},
+        {"id": "p2", "type": "Person", "properties": {"name": "Alexander Hamilton"}},
+    ])
+    assert resolver.resolve("Person", {"name": "Someone Else", "email": "ANA@example.com"}) == "p1"
+    assert resolver.resolve("Person", {"name": "ana garcía"}) == "p1"
+    assert resolver.resolve("Person", {"name": "Alexander Hamiltonn"}) == "p2"
+    assert resolver.resolve("Person", {"name": "Alexander Hamiltonn"}, fuzzy=False) is None
+    assert resolver.resolve("Person", {"name": "Alexandra Hamilton-Smith"}) is None
+    assert resolver.resolve("Organization", {"name": "Ana Garcia"}) is None
+
+
+def test_fuzzy_types_only():
+    resolver = EntityResolver.from_entities([
+        {"id": "t1", "type": "Task", "properties": {"title": "Q3 report 2024"}},
+        {"id": "o1", "type": "Organization", "properties": {"name": "Acme Corporation"}},
+    ])
+    # Task titles differing by a number are different tasks
+    assert resolver.resolve("Task", {"title": "Q3 report 2025"}) is None
+    assert resolver.resolve("Organization", {"name": "Acme Corporations"}) == "o1"
+    everything = EntityResolver.from_entities(
+        [{"id": "t1", "type": "Task", "properties": {"title": "Quarterly planning review"}}], fuzzy_types=None)
+    assert everything.resolve("Task", {"title": "Quarterly planing review"}) == "t1"
+
+
+def test_index_follows_updates_and_deletes(graph_path):
+    manager = OntologyManager(graph_path)
+    manager.upsert_entity("Person", {"name": "Ana Garcia"}, "p1")
+    manager.update_entity("p1", {"name": "Ana Lopez"})
+    assert manager.upsert_entity("Person", {"name": "Ana Lopez", "age": 30})["id"] == "p1"
+    assert manager.upsert_entity("Person", {"name": "Ana Garcia"})["id"] != "p1"
+    manager.delete_entity("p1")
+    assert manager.upsert_entity("Person", {"name": "Ana Lopez"})["id"] != "p1"
+
+
+def test_upsert_merges_within_a_batch(graph_path):
+    manager = OntologyManager(graph_path)
+    first, second, third = manager.upsert_entities_bulk([
+        {"type": "Person", "properties": {"name": "Chen Wang", "email": "chen@example.com"}},
+        {"type": "Person", "properties": {"name": "Chen Wang", "age": 41}},
+        {"type": "Person", "properties": {"name": "Other Person"}},
+    ])
+    assert first["id"] == second["id"] != third["id"]
+    assert manager.get_entity(first["id"])["properties"] == {"name": "Chen Wang", "email": "chen@example.com", "age": 41}
+    again = manager.upsert_entity("Person", {"email": "chen@example.com", "age": 41})
+    assert again["id"] == first["id"] and again["version"] == 1
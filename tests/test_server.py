@@ -0,0 +1,137 @@
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from ontology_tool.core.client import OntologyClient, ServerError
+from ontology_tool.core.manager import OntologyManager
+from ontology_tool.core.server import ReadWriteLock, is_loopback
+
+from conftest import ROOT
+
+CLI = str(ROOT / "scripts" / "ontology.py")
+
+
+@pytest.fixture
+def server(graph_path, schema_path, tmp_path):
+    manager = OntologyManager(graph_path, schema_path)
+    with manager.batch():
+        for i in range(2000):
+            manager.create_entity("Task", {"title": f"t{i}", "n": i}, f"t{i}")
+        for i in range(1, 2000):
+            manager.create_relation(f"t{i - 1}", "next", f"t{i}")
+    sock = tmp_path / "graph.sock"
+    process = subprocess.Popen([sys.executable, CLI, "serve", "-g", str(graph_path), "-s", str(schema_path),
+                                "--socket", str(sock)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while not sock.exists():
+        assert process.poll() is None and time.monotonic() < deadline, "server did not start"
+        time.sleep(0.05)
+    yield sock
+    process.terminate()
+    process.wait()
+
+
+def test_concurrent_clients_and_outside_writers(server, graph_path, schema_path):
+    errors = []
+
+    def run(work):
+        client = OntologyClient(server)
+        try:
+            work(client)
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            client.close()
+
+    def reader(k):
+        def work(client):
+            for i in range(100):
+                entity_id = f"t{(i * k) % 2000}"
+                assert client.call("get", entity_id=entity_id)["id"] == entity_id
+                page, _ = client.call("query", type_name="Task", where={"n": {"$lt": 5}})
+                assert len(page) >= 5
+        return work
+
+    def writer(k):
+        def work(client):
+            for i in range(50):
+                client.call("create", type_name="Note", properties={"i": i}, entity_id=f"n{k}_{i}")
+                client.call("update", entity_id=f"t{i}", properties={"w": k})
+        return work
+
+    def traverse(client):
+        assert len(client.call("traverse", entity_id="t0")) == 1999
+
+    def outside():
+        manager = OntologyManager(graph_path, schema_path)
+        for i in range(50):
+            manager.create_entity("Ext", {"i": i}, f"x{i}")
+
+    threads = [threading.Thread(target=run, args=(reader(k),)) for k in range(1, 5)]
+    threads += [threading.Thread(target=run, args=(writer(k),)) for k in range(3)]
+    threads += [threading.Thread(target=run, args=(traverse,)), threading.Thread(target=outside)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    client = OntologyClient(server)
+    assert client.call("stats")["entity_count"] == 2000 + 3 * 50 + 50
+    assert client.call("get", entity_id="x49")["type"] == "Ext"
+    assert client.call("get", entity_id="t0")["version"] == 4
+    client.close()
+
+
+def test_errors_and_per_request_enforcement(server):
+    client = OntologyClient(server)
+    with pytest.raises(ServerError, match="unknown operation"):
+        client.call("drop")
+    client.call("create", type_name="Person", properties={}, entity_id="p0")
+    with pytest.raises(ServerError, match="SchemaViolation"):
+        client.call("create", enforce_schema=True, type_name="Person", properties={}, entity_id="p1")
+    assert client.call("get", entity_id="p1") is None
+    # The connection stays usable after an error
+    assert client.call("get", entity_id="p0")["type"] == "Person"
+    client.close()
+
+
+def test_tcp_only_on_loopback(graph_path):
+    assert is_loopback("127.0.0.1") and is_loopback("::1") and is_loopback("localhost")
+    assert not is_loopback("0.0.0.0") and not is_loopback("example.com")
+    result = subprocess.run([sys.executable, CLI, "serve", "-g", str(graph_path), "--port", "0", "--host", "0.0.0.0"],
+                            capture_output=True, text=True, timeout=30)
+    assert result.returncode != 0
+    assert "loopback" in result.stderr
+
+
+def test_read_write_lock():
+    events = []
+
+    async def reader(lock, name):
+        async with lock.shared():
+            events.append(f"+{name}")
+            await asyncio.sleep(0.01)
+            events.append(f"-{name}")
+
+    async def writer(lock):
+        async with lock.exclusive():
+            events.append("+w")
+            await asyncio.sleep(0.01)
+            events.append("-w")
+
+    async def main():
+        lock = ReadWriteLock()
+        first = [asyncio.create_task(reader(lock, name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        second = [asyncio.create_task(writer(lock)), asyncio.create_task(reader(lock, "c"))]
+        await asyncio.gather(*first, *second)
+
+    asyncio.run(main())
+    # Readers overlap; the writer runs alone, and a reader arriving behind it waits
+    assert events[:2] == ["+a", "+b"]
+    assert events[events.index("+w") + 1] == "-w"
+    assert events.index("+c") > events.index("-w")
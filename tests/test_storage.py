@@ -0,0 +1,113 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from ontology_tool.core.manager import OntologyManager
+from ontology_tool.core.storage import BACKENDS, StorageError, convert
+
+
+def build(graph_path, schema_path, backend):
+    """A small graph, converted to ``backend`` part way so both the base and the log tail are read."""
+    manager = OntologyManager(graph_path, schema_path)
+    manager.create_entity("Task", {"title": "Alpha migration", "n": 1}, "t1")
+    manager.create_entity("Task", {"title": "Beta review", "n": 2}, "t2")
+    manager.create_relation("t1", "blocks", "t2")
+    manager.create_relation("t1", "owner", "t2")
+    time.sleep(0.01)
+    before_update = datetime.now(timezone.utc).isoformat()
+    time.sleep(0.01)
+    manager.update_entity("t1", {"n": 5})
+    if backend != "jsonl":
+        convert(graph_path, backend)
+    manager.create_entity("Task", {"title": "Gamma", "n": 3}, "t3")
+    manager.create_relation("t3", "blocks", "t2")
+    manager.delete_entity("t2")
+    manager.create_entity("Task", {"title": "Delta", "n": 4}, "t2")
+    manager.create_relation("t3", "blocks", "t2")
+    return OntologyManager(graph_path, schema_path), before_update
+
+
+def snapshot(manager):
+    page, cursor = manager.query_page("Task", {"n": {"$gte": 2}}, order_by="-n", limit=2)
+    return {
+        "get": [manager.get_entity(entity_id) for entity_id in ("t1", "t2", "t3", "missing")],
+        "query": (page, cursor),
+        "next": manager.query_page("Task", {"n": {"$gte": 2}}, order_by="-n", limit=2, cursor=cursor),
+        "related": [manager.get_related(entity_id, direction=direction)
+                    for entity_id in ("t1", "t2", "t3") for direction in ("outgoing", "incoming", "both")],
+        "search": [result["entity"]["id"] for result in manager.search("alpha")],
+    }
+
+
+def strip_times(value):
+    if isinstance(value, dict):
+        return {k: strip_times(v) for k, v in value.items() if k not in ("created", "updated")}
+    if isinstance(value, (list, tuple)):
+        return [strip_times(v) for v in value]
+    return value
+
+
+def test_backends_answer_alike(tmp_path, schema_path):
+    answers = {}
+    for backend in BACKENDS:
+        manager, _ = build(tmp_path / backend / "graph.jsonl", schema_path, backend)
+        assert manager.storage.name == backend
+        result = snapshot(manager)
+        result["query"] = [strip_times(result["query"][0]), result["query"][1] is not None]
+        result["next"] = [strip_times(result["next"][0]), result["next"][1]]
+        answers[backend] = strip_times(result)
+    assert answers["segment"] == answers["jsonl"]
+    assert answers["sqlite"] == answers["jsonl"]
+
+
+def test_resident_graph_matches_storage(graph_path, schema_path):
+    manager, _ = build(graph_path, schema_path, "sqlite")
+    resident = OntologyManager(graph_path, schema_path, resident=True)
+    assert snapshot(resident) == snapshot(manager)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_as_of(graph_path, schema_path, backend):
+    manager, before_update = build(graph_path, schema_path, backend)
+    with pytest.raises(ValueError, match="invalid timestamp"):
+        manager.get_entity("t1", as_of="yesterday")
+    if backend == "segment":
+        # The segment folds the log, so states before the fold are gone
+        with pytest.raises(StorageError):
+            manager.get_entity("t1", as_of=before_update)
+        return
+    past = manager.load_ontology(before_update)
+    assert sorted(past.entities) == ["t1", "t2"]
+    assert past.entities["t1"]["properties"]["n"] == 1
+    assert [r["relation"] for r in past.related("t1")] == ["blocks", "owner"]
+
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_history(graph_path, schema_path, backend):
+    manager, _ = build(graph_path, schema_path, backend)
+    assert [(v["op"], v["version"]) for v in manager.history("t1")] == [("create", 1), ("update", 2)]
+    assert [v["entity"]["properties"]["n"] for v in manager.history("t1")] == [1, 5]
+    versions = manager.history("t2")
+    assert [v["op"] for v in versions] == ["create", "delete", "create"]
+    assert versions[1]["entity"] is None
+    assert versions[2]["entity"]["properties"]["title"] == "Delta"
+
+
+def test_history_after_segment_fold(graph_path, schema_path):
+    manager, _ = build(graph_path, schema_path, "segment")
+    assert [(v["op"], v["version"]) for v in manager.history("t1")] == [("base", 2)]
+
+
+def test_search_ranks_and_filters(manager):
+    manager.create_entity("Task", {"title": "Q3 migration plan", "notes": "migration of the billing db"}, "t1")
+    manager.create_entity("Task", {"title": "Q3 review"}, "t2")
+    manager.create_entity("Document", {"title": "Migration guide"}, "d1")
+    results = manager.search("migration")
+    assert {r["entity"]["id"] for r in results} == {"t1", "d1"}
+    assert results[0]["score"] >= results[1]["score"] > 0
+    assert [r["entity"]["id"] for r in manager.search("migration", type_name="Document")] == ["d1"]
+    manager.update_entity("t2", {"title": "Q3 migration review"})
+    manager.delete_entity("t1")
+    assert {r["entity"]["id"] for r in manager.search("migration")} == {"t2", "d1"}
+    assert manager.search("nothing here") == []
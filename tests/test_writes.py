@@ -0,0 +1,74 @@
+import pytest
+
+import ontology as cli
+from ontology_tool.core.manager import OntologyManager
+from ontology_tool.core.schema import SchemaViolation
+from ontology_tool.core.storage import BACKENDS, convert
+from ontology_tool.core.writer import VersionConflict
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_cli_writes_are_checked_on_every_backend(graph_path, schema_path, backend):
+    graph, schema = str(graph_path), str(schema_path)
+    for entity_id in "abc":
+        cli.create_entity("Person", {"name": entity_id.upper()}, graph, entity_id, schema)
+    if backend != "jsonl":
+        convert(graph_path, backend)
+    with pytest.raises(SchemaViolation, match="name"):
+        cli.create_entity("Person", {}, graph, "x", schema)
+    with pytest.raises(SchemaViolation, match="nope"):
+        cli.create_entity("Person", {"name": "X", "manager": "nope"}, graph, "x", schema)
+    cli.create_relation("a", "reports_to", "b", {}, graph, schema)
+    with pytest.raises(SchemaViolation):
+        cli.create_relation("a", "reports_to", "c", {}, graph, schema)
+    cli.create_relation("b", "reports_to", "c", {}, graph, schema)
+    with pytest.raises(SchemaViolation):
+        cli.create_relation("c", "reports_to", "a", {}, graph, schema)
+    with pytest.raises(SchemaViolation):
+        cli.update_entity("a", {"manager": "zz"}, graph, schema)
+    with pytest.raises(VersionConflict):
+        cli.update_entity("a", {"manager": "b"}, graph, schema, expected_version=2)
+    assert cli.update_entity("a", {"manager": "b"}, graph, schema, expected_version=1)["version"] == 2
+    assert cli.get_entity("a", graph)["properties"] == {"name": "A", "manager": "b"}
+    assert [r["entity"]["id"] for r in cli.get_related("a", None, graph)] == ["b"]
+    assert cli.get_entity("x", graph) is None
+
+
+def test_batch_checks_see_earlier_writes(graph_path, schema_path):
+    manager = OntologyManager(graph_path, schema_path, enforce_schema=True)
+    with manager.batch():
+        manager.create_entity("Person", {"name": "A"}, "a")
+        # The ref resolves against the create buffered above
+        manager.create_entity("Person", {"name": "B", "manager": "a"}, "b")
+        manager.create_entity("Person", {"name": "C"}, "c")
+        manager.create_relation("b", "reports_to", "a")
+        with pytest.raises(SchemaViolation):
+            manager.create_relation("b", "reports_to", "c")
+        with pytest.raises(SchemaViolation):
+            manager.create_relation("a", "reports_to", "b")
+    assert [(r["from"], r["to"]) for r in OntologyManager(graph_path).load_graph()[1]] == [("b", "a")]
+
+
+def test_resident_graph_keeps_its_own_copy(graph_path):
+    manager = OntologyManager(graph_path, resident=True)
+    properties = {"name": "A"}
+    entity = manager.create_entity("Person", properties, "a")
+    manager.update_entity("a", {"age": 3})
+    assert properties == {"name": "A"}
+    entity["properties"]["name"] = "changed"
+    entity["type"] = "Other"
+    assert manager.get_entity("a")["properties"] == {"name": "A", "age": 3}
+    assert manager.get_entity("a")["type"] == "Person"
+    assert OntologyManager(graph_path).get_entity("a") == manager.get_entity("a")
+
+
+def test_version_checks(graph_path):
+    manager = OntologyManager(graph_path)
+    manager.create_entity("Task", {"title": "T"}, "t")
+    assert manager.update_entity("t", {"status": "open"}, expected_version=1)["version"] == 2
+    with pytest.raises(VersionConflict):
+        manager.update_entity("t", {"status": "done"}, expected_version=1)
+    with pytest.raises(VersionConflict):
+        manager.delete_entity("t", expected_version=1)
+    assert manager.delete_entity("t", expected_version=2)
+    assert manager.update_entity("t", {"status": "done"}) is None